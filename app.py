@@ -3,47 +3,213 @@
 
 import os
 import json
-import requests # Make sure to install this: pip install requests
-from flask import Flask, request, jsonify, render_template # Make sure to install this: pip install Flask
-import faiss # Make sure to install this: pip install faiss-cpu
-import numpy as np
-from sentence_transformers import SentenceTransformer # Make sure to install this: pip install sentence-transformers
+import atexit
+import threading
+import zlib
+from concurrent.futures import Future
+
+from managers import startup
+
+# Every startup step is timed; see /health for the report.
+startup_profile = startup.StartupProfiler()
+
+with startup_profile.measure("import requests"):
+    import requests # Make sure to install this: pip install requests
+with startup_profile.measure("import flask"):
+    from flask import Flask, Response, request, jsonify, render_template, stream_with_context # Make sure to install this: pip install Flask
+
+# faiss (pip install faiss-cpu), numpy and the embedding backend (pip install
+# sentence-transformers, or onnxruntime + tokenizers) are heavy; the memory managers
+# import them lazily and warm_up_memory_system() loads them in the background.
+with startup_profile.measure("import managers"):
+    from managers import actions, embedding, event_log, event_metadata, game_state, lexical, llm_client, location_graph, memory, prompt_builder, response_cache, response_parser, session, sqlite_state, summarizer, undo
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
 
 # --- Global Memory System Variables ---
-faiss_index = None
+# The embedding model and its cache are shared; each session has its own indexes.
 sentence_model = None
+embedding_cache = None
+
+# Resolved once the embedding model is loaded and the default session's indexes are restored.
+memory_ready = Future()
 
 # --- Game Constants ---
 GAME_DATA_DIR = "gamedata"
-CHARACTER_FILE = os.path.join(GAME_DATA_DIR, "character.json")
-WORLD_FILE = os.path.join(GAME_DATA_DIR, "world.json")
-EVENTS_FILE = os.path.join(GAME_DATA_DIR, "events.json")
-LOCATIONS_FILE = os.path.join(GAME_DATA_DIR, "locations.json")
-NPCS_FILE = os.path.join(GAME_DATA_DIR, "npcs.json")
-SUMMARIES_FILE = os.path.join(GAME_DATA_DIR, "summaries.json")
-FULL_EVENT_LOG_FILE = os.path.join(GAME_DATA_DIR, "full_event_log.json")
+DEFAULT_SESSION_ID = "default" # Used when a request names no session; its files live directly in GAME_DATA_DIR
+SESSIONS_DIR = os.path.join(GAME_DATA_DIR, "sessions") # Every other session gets its own SESSIONS_DIR/<session_id>/
+MAX_SESSIONS = 16 # Sessions kept loaded; the least recently used idle ones are closed beyond this
+SESSION_MEMORY_BUDGET = 1024 * 1024 * 1024 # Approximate bytes of memory indexes the loaded sessions may hold together
+# Files inside each session's data directory
+CHARACTER_FILE = "character.json"
+WORLD_FILE = "world.json"
+EVENTS_FILE = "events.json"
+LOCATIONS_FILE = "locations.json"
+NPCS_FILE = "npcs.json"
+SUMMARIES_FILE = "summaries.json"
+FULL_EVENT_LOG_FILE = "full_event_log.jsonl"
+LEGACY_FULL_EVENT_LOG_FILE = "full_event_log.json" # Pre-JSONL format, migrated on startup
+EVENT_LOG_FSYNC = True # fsync the deep event log after every appended event
+# Game state storage: "json" (one file per section) or "sqlite" (rows read on demand).
+# The SQLite database is created from the JSON files on first start; see also scripts.migrate_state_to_sqlite.
+STATE_BACKEND = game_state.StateBackend.JSON
+STATE_DB_FILE = "state.db"
+STATE_JOURNAL_FILE = "state_journal.jsonl" # Turns committed but not yet flushed to the state files
+STATE_FSYNC = True # fsync the journal on every commit and each state file before it atomically replaces the old one
+STATE_FLUSH_INTERVAL = 5.0 # Seconds between background flushes of the resident game state
+STATE_FLUSH_EVERY = 20 # Flush early once this many turns are waiting
+# LM Studio's OpenAI-compatible endpoint. Change the port if you've configured it differently.
+LLM_URL = "http://localhost:1234/v1/chat/completions"
+LLM_CONNECT_TIMEOUT = 3.05 # Seconds to establish a connection to the LLM server
+LLM_READ_TIMEOUT = 120 # Seconds to wait for a (non-streamed) generation before giving up
+LLM_MAX_RETRIES = 2 # Retries, with jittered backoff, for connection errors, timeouts and 429/5xx responses
+LLM_CIRCUIT_FAILURES = 5 # Consecutive failed calls that open the circuit breaker
+LLM_CIRCUIT_RESET = 30 # Seconds the breaker stays open before letting a trial call through
+LLM_CACHE_PROMPT = False # Ask the server to reuse its KV cache for the prompt prefix ("cache_prompt"); only for llama.cpp-based servers, strict OpenAI-compatible ones reject it
+LLM_SLOTS = 0 # Server slots (llama.cpp --parallel); if > 0 each session sticks to one slot ("id_slot") and keeps its cache
 MAX_EVENTS = 5 # The number of recent events to keep in context
 EVENTS_THRESHOLD = 10 # Trigger summarization when events exceed this number
+EVENTS_TO_KEEP = 2 # Most recent events left out of a summary
+SUMMARY_FANOUT = 4 # Summaries of one level condensed into a chapter a level up
+SUMMARY_TOKEN_BUDGET = 300 # Tokens of summaries in the prompt's [SUMMARY OF PAST EVENTS], unless PROMPT_SECTION_BUDGETS sets it
+# Tokenizer of the model LM Studio serves (its Hugging Face tokenizer.json; needs pip install tokenizers).
+# None, or a missing file, estimates token counts from the text length instead.
+PROMPT_TOKENIZER_PATH = None
+PROMPT_TOKEN_BUDGET = 3000 # Max tokens of the turn prompt (the model's context minus the system prompt and the reply)
+# Section order: "stable_first" puts what rarely changes (summaries, world, nearby locations) first
+# and what changes every turn (recent events, deep memory, scene) last, so the LLM server can
+# reuse its KV cache for the shared prefix of consecutive prompts; "classic" is the original order.
+PROMPT_LAYOUT = prompt_builder.PromptLayout.STABLE_FIRST
+# Max tokens of each section's entries; sections not listed are only limited by PROMPT_TOKEN_BUDGET.
+PROMPT_SECTION_BUDGETS = {
+    "[CHARACTER]": 200,
+    "[DEEP MEMORY]": 400,
+    "[ITEMS IN CURRENT LOCATION]": 150,
+    "[NEARBY LOCATIONS]": 500,
+    "[NPCS PRESENT]": 400,
+    "[SUMMARY OF PAST EVENTS]": SUMMARY_TOKEN_BUDGET,
+    "[RECENT EVENTS]": 400,
+    "[SCENE]": 300,
+}
+# Serve replies to repeated observational input ("look around", "check inventory") from a cache
+# instead of the LLM while the state they describe is unchanged. Off by default: a cached turn
+# repeats the earlier story word for word.
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_TTL = 600 # Seconds a cached reply stays valid
+RESPONSE_CACHE_SIZE = 256 # Max cached replies per session; the least recently used are evicted beyond this
+UNDO_DEPTH = 20 # Turns per loaded session that /undo can take back
+NEARBY_LOCATION_HOPS = 1 # Moves away a location can be to be listed in the prompt's [NEARBY LOCATIONS]
+NPC_MOVE_MAX_HOPS = None # NPC_MOVE only to locations the NPC can reach in this many moves; None allows any reachable one
+LOCATION_GRAPH_CACHE_SIZE = 1024 # Neighbourhoods kept per session by the location graph
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Embedding backend: "sentence_transformers" (PyTorch) or "onnx" (ONNX Runtime, optionally int8).
+# Create the ONNX files with: python -m scripts.export_onnx_embedding --quantize
+EMBEDDING_BACKEND = embedding.EmbeddingBackend.SENTENCE_TRANSFORMERS
+ONNX_MODEL_PATH = os.path.join("models", EMBEDDING_MODEL_NAME, "model_int8.onnx")
+ONNX_TOKENIZER_PATH = os.path.join("models", EMBEDDING_MODEL_NAME, "tokenizer.json")
+EMBEDDING_THREADS = 0 # Intra-op threads for the embedding model; 0 uses the backend default
+MEMORY_SNAPSHOT_INTERVAL = 100 # Serialize the FAISS index every N newly indexed events
+EMBEDDING_CACHE_SIZE = 4096 # Max embeddings kept in the in-memory LRU cache
+EMBEDDING_CACHE_DIR = os.path.join(GAME_DATA_DIR, "embedding_cache") # On-disk cache tier; None disables it
+EMBEDDING_BATCH_SIZE = 64 # Max queued events the background worker encodes in one call
+# FAISS index behind deep memory: flat (exact), ivf_flat, ivf_pq or hnsw.
+# IVF types are trained automatically once MEMORY_INDEX_CONFIG.min_train_size events exist.
+MEMORY_INDEX_CONFIG = memory.IndexConfig(index_type=memory.IndexType.FLAT, nprobe=8, ef_search=64)
+RETRIEVAL_CANDIDATES = 10 # Candidates taken from each of the vector and keyword searches before fusion
+VECTOR_WEIGHT = 1.0 # Weight of semantic (FAISS) ranks in reciprocal-rank fusion
+LEXICAL_WEIGHT = 1.0 # Weight of keyword (BM25) ranks in reciprocal-rank fusion
+DEEP_MEMORY_SCOPE = None # Restrict deep memory recall: None (all events), "location" or "npcs_present"
+LAZY_STARTUP = True # Serve requests immediately and warm the memory system up in the background
+MEMORY_READY_TIMEOUT = 300 # Seconds a turn waits for the memory system before continuing without deep memory
+
+# --- LLM Client ---
+# One pooled, keep-alive HTTP client shared by every LLM call.
+llm = llm_client.LLMClient(
+    LLM_URL,
+    connect_timeout=LLM_CONNECT_TIMEOUT,
+    read_timeout=LLM_READ_TIMEOUT,
+    max_retries=LLM_MAX_RETRIES,
+    breaker=llm_client.CircuitBreaker(failure_threshold=LLM_CIRCUIT_FAILURES, reset_timeout=LLM_CIRCUIT_RESET)
+)
+
+# Counts prompt tokens for the budgets; the tokenizer (if any) loads on the first turn.
+prompt_token_counter = prompt_builder.TokenCounter.for_path(PROMPT_TOKENIZER_PATH)
+
+# === Sessions ===
+# Each session (playthrough) has its own game state store, deep event log and
+# memory indexes, loaded on first use and closed again when idle (LRU).
+
+def state_files(data_dir):
+    """Returns the game state files of a session's data directory, by section."""
+    return {
+        "character": os.path.join(data_dir, CHARACTER_FILE),
+        "world": os.path.join(data_dir, WORLD_FILE),
+        "events": os.path.join(data_dir, EVENTS_FILE),
+        "locations": os.path.join(data_dir, LOCATIONS_FILE),
+        "npcs": os.path.join(data_dir, NPCS_FILE),
+        "summaries": os.path.join(data_dir, SUMMARIES_FILE)
+    }
+
+def create_state_store(data_dir):
+    """
+    Creates the game state store for STATE_BACKEND. The parsed state stays in memory
+    as the source of truth. With the JSON backend, commits go to a small journal and
+    the files (one per section) are written behind, in the background; with SQLite
+    each commit is a transaction over the changed rows.
+    """
+    if STATE_BACKEND == game_state.StateBackend.SQLITE:
+        return sqlite_state.SqliteStateStore(os.path.join(data_dir, STATE_DB_FILE), fsync=STATE_FSYNC)
+    return game_state.StateStore(
+        state_files(data_dir),
+        journal_path=os.path.join(data_dir, STATE_JOURNAL_FILE),
+        fsync=STATE_FSYNC,
+        flush_interval=STATE_FLUSH_INTERVAL,
+        flush_every=STATE_FLUSH_EVERY
+    )
+
+def open_session(session_id):
+    """
+    Creates a session and its game files. The memory indexes are loaded on first use.
+    The default session keeps its files directly in GAME_DATA_DIR, where single-session saves live.
+    """
+    if session_id == DEFAULT_SESSION_ID:
+        data_dir = GAME_DATA_DIR
+    else:
+        data_dir = os.path.join(SESSIONS_DIR, session_id)
+    game_session = session.Session(
+        session_id,
+        data_dir,
+        state_store=create_state_store(data_dir),
+        # Append-only; not part of load_state/save_state, so turns never re-read or rewrite it.
+        event_log=event_log.EventLog(os.path.join(data_dir, FULL_EVENT_LOG_FILE), fsync=EVENT_LOG_FSYNC)
+    )
+    game_session.undo_journal = undo.UndoJournal(max_turns=UNDO_DEPTH)
+    if RESPONSE_CACHE_ENABLED:
+        game_session.response_cache = response_cache.ResponseCache(max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+    setup_game_files(game_session)
+    game_session.state_store.start()
+    return game_session
+
+sessions = session.SessionManager(open_session, max_sessions=MAX_SESSIONS, memory_budget=SESSION_MEMORY_BUDGET)
 
 # === Helper Functions (from your original script) ===
 
-def setup_game_files():
-    """Creates the gamedata directory and initial JSON files if they don't exist."""
-    os.makedirs(GAME_DATA_DIR, exist_ok=True)
-    if not os.path.exists(CHARACTER_FILE):
-        with open(CHARACTER_FILE, 'w') as f:
+def setup_game_files(game_session):
+    """Creates the session's data directory and initial JSON files if they don't exist."""
+    os.makedirs(game_session.data_dir, exist_ok=True)
+    files = state_files(game_session.data_dir)
+    if not os.path.exists(files["character"]):
+        with open(files["character"], 'w') as f:
             json.dump({"name": "Orton", "status": ["healthy"], "inventory": ["pocket knife", "water bottle"]}, f, indent=4)
-    if not os.path.exists(WORLD_FILE):
-        with open(WORLD_FILE, 'w') as f:
-            json.dump({"current_location": "Apartment B2", "time_of_day": "Morning"}, f, indent=4)
-    if not os.path.exists(EVENTS_FILE):
-        with open(EVENTS_FILE, 'w') as f:
+    if not os.path.exists(files["world"]):
+        with open(files["world"], 'w') as f:
+            json.dump({"current_location": "Apartment B2", "time_of_day": "Morning", "turn": 0}, f, indent=4)
+    if not os.path.exists(files["events"]):
+        with open(files["events"], 'w') as f:
             json.dump(["The adventure begins."], f, indent=4)
-    if not os.path.exists(LOCATIONS_FILE):
-        with open(LOCATIONS_FILE, 'w') as f:
+    if not os.path.exists(files["locations"]):
+        with open(files["locations"], 'w') as f:
             json.dump({
                 "Apartment B2": {
                     "description": "A cramped apartment with boarded windows and scattered debris. The air smells of mold and decay.",
@@ -66,8 +232,8 @@ def setup_game_files():
                     "items": ["old magazine", "bent spoon"]
                 }
             }, f, indent=4)
-    if not os.path.exists(NPCS_FILE):
-        with open(NPCS_FILE, 'w') as f:
+    if not os.path.exists(files["npcs"]):
+        with open(files["npcs"], 'w') as f:
             json.dump({
                 "Dale": {
                     "description": "A weathered survivor wearing a patched leather jacket. His eyes dart nervously around the room",
@@ -80,70 +246,94 @@ def setup_game_files():
                     "status": ["tired", "determined"]
                 }
             }, f, indent=4)
-    if not os.path.exists(SUMMARIES_FILE):
-        with open(SUMMARIES_FILE, 'w') as f:
+    if not os.path.exists(files["summaries"]):
+        with open(files["summaries"], 'w') as f:
             json.dump([], f, indent=4)
-    if not os.path.exists(FULL_EVENT_LOG_FILE):
-        with open(FULL_EVENT_LOG_FILE, 'w') as f:
-            json.dump(["The adventure begins."], f, indent=4)
+    if not game_session.event_log.exists():
+        if os.path.exists(game_session.path(LEGACY_FULL_EVENT_LOG_FILE)):
+            game_session.event_log.migrate_from_json(game_session.path(LEGACY_FULL_EVENT_LOG_FILE))
+        else:
+            game_session.event_log.append({
+                "text": "The adventure begins.",
+                "turn": 0,
+                "location": "Apartment B2",
+                "time_of_day": "Morning",
+                "npcs": [],
+                "items": []
+            })
+    if STATE_BACKEND == game_state.StateBackend.SQLITE and not os.path.exists(game_session.path(STATE_DB_FILE)):
+        sqlite_state.migrate_from_json(files, game_session.path(STATE_DB_FILE))
+
+def npcs_at_location(state, location):
+    """Returns the NPCs at a location; the SQLite backend answers this from its location index."""
+    npcs = state['npcs']
+    if isinstance(npcs, sqlite_state.NpcTable):
+        return npcs.at_location(location)
+    return {name: npc for name, npc in npcs.items() if npc.get('location') == location}
+
+def load_location_graph(game_session, state):
+    """
+    Returns the session's location graph, built from the state's locations on first
+    use. The SQLite backend reads every location's connections in one query.
+    """
+    if game_session.location_graph is None:
+        locations = state['locations']
+        if isinstance(locations, sqlite_state.LocationTable):
+            connections = locations.connection_map()
+        else:
+            connections = {name: location.get('connections', []) for name, location in locations.items()}
+        game_session.location_graph = location_graph.LocationGraph.from_connections(
+            connections, max_cached=LOCATION_GRAPH_CACHE_SIZE
+        )
+    return game_session.location_graph
+
+def update_location_graph(game_session, state):
+    """Brings the session's location graph up to date with the locations changed since the last save."""
+    graph = game_session.location_graph
+    if graph is None or 'locations' not in state.changes:
+        return
+    changed = state.changes['locations']
+    if changed is None:
+        # The whole section was replaced; rebuilt on next use
+        game_session.location_graph = None
+        return
+    for name in changed:
+        if name in state['locations']:
+            graph.set_connections(name, state['locations'][name].get('connections', []))
+        else:
+            graph.remove(name)
 
-def load_state():
-    """Loads all game state from JSON files into a dictionary."""
-    with open(CHARACTER_FILE, 'r') as f:
-        character_data = json.load(f)
-    with open(WORLD_FILE, 'r') as f:
-        world_data = json.load(f)
-    with open(EVENTS_FILE, 'r') as f:
-        events_data = json.load(f)
-    with open(LOCATIONS_FILE, 'r') as f:
-        locations_data = json.load(f)
-    with open(NPCS_FILE, 'r') as f:
-        npcs_data = json.load(f)
-    with open(SUMMARIES_FILE, 'r') as f:
-        summaries_data = json.load(f)
-    with open(FULL_EVENT_LOG_FILE, 'r') as f:
-        full_event_log_data = json.load(f)
-    return {
-        "character": character_data, 
-        "world": world_data, 
-        "events": events_data, 
-        "locations": locations_data, 
-        "npcs": npcs_data,
-        "summaries": summaries_data,
-        "full_event_log": full_event_log_data
-    }
+def load_state(game_session):
+    """
+    Returns the session's resident game state, a GameState dictionary of sections that
+    remembers what has been changed. The JSON files are only read the first
+    time (replaying any turns the journal holds beyond them).
+    """
+    return game_session.state_store.load()
 
-def save_state(state_data):
-    """Saves the provided state back to the individual JSON files."""
-    with open(CHARACTER_FILE, 'w') as f:
-        json.dump(state_data["character"], f, indent=4)
-    with open(WORLD_FILE, 'w') as f:
-        json.dump(state_data["world"], f, indent=4)
-    with open(EVENTS_FILE, 'w') as f:
-        json.dump(state_data["events"], f, indent=4)
-    with open(LOCATIONS_FILE, 'w') as f:
-        json.dump(state_data["locations"], f, indent=4)
-    with open(NPCS_FILE, 'w') as f:
-        json.dump(state_data["npcs"], f, indent=4)
-    with open(SUMMARIES_FILE, 'w') as f:
-        json.dump(state_data["summaries"], f, indent=4)
-    with open(FULL_EVENT_LOG_FILE, 'w') as f:
-        json.dump(state_data["full_event_log"], f, indent=4)
+def save_state(game_session, state_data):
+    """
+    Commits the entries changed since the last save to the journal. The JSON
+    files are rewritten in the background (each atomically), every
+    STATE_FLUSH_INTERVAL seconds or STATE_FLUSH_EVERY turns, and on shutdown.
+    """
+    game_session.state_store.save(state_data)
 
 # === LLM Integration (The REAL version) ===
 
-def query_llm(prompt_text):
+def llm_slot(game_session):
+    """The server slot a session's turns go to, or None without LLM_SLOTS."""
+    if LLM_SLOTS <= 0:
+        return None
+    return zlib.crc32(game_session.session_id.encode()) % LLM_SLOTS
+
+def game_master_payload(prompt_text, slot=None):
     """
-    Sends the assembled prompt to a local LLM running via LM Studio and returns the response.
+    Builds the chat completions request for a game turn. The system prompt never
+    changes and the prompt starts with its most stable sections, so with the
+    cache hints the server only prefills what changed since the session's last turn.
+    Servers that don't know the hints ignore them.
     """
-    # --- IMPORTANT ---
-    # Make sure LM Studio is running and a model is loaded.
-    # This URL is the default for LM Studio's local server.
-    # You might need to change the port if you've configured it differently.
-    url = "http://localhost:1234/v1/chat/completions"
-
-    headers = {"Content-Type": "application/json"}
-    
     # This payload structure is required by the OpenAI-compatible endpoint.
     payload = {
         "model": "local-model", # This value doesn't matter for LM Studio
@@ -163,15 +353,7 @@ def query_llm(prompt_text):
                     "[Write a brief summary for the event log]\n\n"
                     "ACTIONS:\n"
                     "[List any actions that need to happen, one per line. Available actions:]\n"
-                    "- TAKE item_name\n"
-                    "- DROP item_name\n"
-                    "- MOVE_TO location_name\n"
-                    "- TIME_ADVANCE morning/afternoon/evening/night\n"
-                    "- STATUS_ADD status_name\n"
-                    "- STATUS_REMOVE status_name\n"
-                    "- NPC_MOVE npc_name TO location_name\n"
-                    "- NPC_STATUS npc_name ADD status_name\n"
-                    "- NPC_STATUS npc_name REMOVE status_name\n"
+                    + "".join(f"- {usage}\n" for usage in action_registry.usage()) +
                     "[If no actions needed, write: NONE]\n\n"
                     "Example response:\n"
                     "STORY:\n"
@@ -189,13 +371,40 @@ def query_llm(prompt_text):
         ],
         "temperature": 0.7,
     }
+    if LLM_CACHE_PROMPT:
+        payload["cache_prompt"] = True
+    if slot is not None:
+        payload["id_slot"] = slot
+    return payload
+
+
+# The EVENT of the error responses; replies with these are never cached.
+LLM_ERROR_EVENTS = ("A connection error occurred.", "An LLM format error occurred.")
+
+
+def llm_connection_error_response(e):
+    """The response a turn gets when the LLM can't be reached, in the simple text format."""
+    print(f"Error connecting to LLM Studio: {e}")
+    return f"STORY:\nError: Could not connect to the LLM. Is LM Studio running? ({e})\n\nEVENT:\n{LLM_ERROR_EVENTS[0]}\n\nACTIONS:\nNONE"
 
+
+def llm_format_error_response(e):
+    """The response a turn gets when the LLM's reply can't be read, in the simple text format."""
+    print(f"Error parsing LLM response: {e}")
+    return f"STORY:\nError: The LLM returned an unexpected response format. Check the LM Studio console. ({e})\n\nEVENT:\n{LLM_ERROR_EVENTS[1]}\n\nACTIONS:\nNONE"
+
+
+def query_llm(prompt_text, slot=None):
+    """
+    Sends the assembled prompt to a local LLM running via LM Studio and returns the response.
+    `slot` pins the request to a server slot (see llm_slot).
+    """
+    # --- IMPORTANT ---
+    # Make sure LM Studio is running and a model is loaded.
+    # The request goes to LLM_URL through the shared client (pooling, timeouts, retries).
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-        
-        # Extract the content from the LLM's response
-        llm_response_text = response.json()['choices'][0]['message']['content']
+        # Raises for connection errors, timeouts and bad status codes once retries are used up
+        llm_response_text = llm.chat(game_master_payload(prompt_text, slot), label="turn")
         
         # It's good practice to print what the LLM returned, for debugging
         print("--- LLM Raw Response ---")
@@ -205,21 +414,40 @@ def query_llm(prompt_text):
         return llm_response_text
 
     except requests.exceptions.RequestException as e:
-        print(f"Error connecting to LLM Studio: {e}")
         # Return an error message in the simple text format
-        return f"STORY:\nError: Could not connect to the LLM. Is LM Studio running? ({e})\n\nEVENT:\nA connection error occurred.\n\nACTIONS:\nNONE"
+        return llm_connection_error_response(e)
     except (KeyError, IndexError) as e:
-        print(f"Error parsing LLM response: {e}")
-        return f"STORY:\nError: The LLM returned an unexpected response format. Check the LM Studio console. ({e})\n\nEVENT:\nAn LLM format error occurred.\n\nACTIONS:\nNONE"
+        return llm_format_error_response(e)
+
+
+def query_llm_stream(prompt_text, slot=None):
+    """
+    Streaming version of query_llm: yields the response text in chunks as the LLM
+    writes it. Errors are yielded as the same simple-format error response (on a
+    new line after a partial reply, so its section markers are still read).
+    """
+    chunks = []
+    try:
+        for chunk in llm.stream(game_master_payload(prompt_text, slot), label="turn_stream"):
+            chunks.append(chunk)
+            yield chunk
+    except requests.exceptions.RequestException as e:
+        yield ("\n" if chunks else "") + llm_connection_error_response(e)
+        return
+    except (KeyError, IndexError, ValueError) as e:
+        yield ("\n" if chunks else "") + llm_format_error_response(e)
+        return
+
+    print("--- LLM Raw Response (streamed) ---")
+    print("".join(chunks))
+    print("-----------------------------------")
 
 
 def query_llm_for_summary(text_to_summarize):
     """
-    Sends events to the LLM for summarization and returns only the text content.
+    Sends events to the LLM for summarization and returns only the text content,
+    or None if the LLM couldn't be reached or answered in an unexpected format.
     """
-    url = "http://localhost:1234/v1/chat/completions"
-    headers = {"Content-Type": "application/json"}
-    
     payload = {
         "model": "local-model",
         "messages": [
@@ -236,11 +464,8 @@ def query_llm_for_summary(text_to_summarize):
     }
 
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        
         # Extract only the text content from the LLM's response
-        llm_response = response.json()['choices'][0]['message']['content']
+        llm_response = llm.chat(payload, label="summary")
         
         print("--- LLM Summary Response ---")
         print(llm_response)
@@ -250,347 +475,440 @@ def query_llm_for_summary(text_to_summarize):
 
     except requests.exceptions.RequestException as e:
         print(f"Error connecting to LLM Studio for summary: {e}")
-        return f"Summary unavailable due to connection error: {e}"
+        return None
     except (KeyError, IndexError) as e:
         print(f"Error parsing LLM summary response: {e}")
-        return f"Summary unavailable due to parsing error: {e}"
+        return None
 
 
 def parse_llm_response(llm_response_text):
     """
     Parse the simple text-based LLM response into components.
     Returns a dictionary with 'story', 'event', and 'actions' keys.
+    Section markers are recognized at the start of any line, so a reply that
+    leaves out the blank lines between sections still parses.
     """
-    # Initialize default values
-    story = "The world is silent."
-    event = "Nothing happened."
-    actions = []
-    
-    # Split response into sections
-    sections = llm_response_text.split('\n\n')
-    current_section = None
-    
-    for section in sections:
-        section = section.strip()
-        if section.startswith('STORY:'):
-            current_section = 'story'
-            story = section[6:].strip()  # Remove 'STORY:' prefix
-        elif section.startswith('EVENT:'):
-            current_section = 'event'
-            event = section[6:].strip()  # Remove 'EVENT:' prefix
-        elif section.startswith('ACTIONS:'):
-            current_section = 'actions'
-            actions_text = section[8:].strip()  # Remove 'ACTIONS:' prefix
-            if actions_text.upper() != 'NONE':
-                # Split actions by newlines and clean them up
-                actions = [action.strip() for action in actions_text.split('\n') if action.strip()]
-        elif current_section and section:
-            # Continue previous section if we have content
-            if current_section == 'story':
-                story += '\n' + section
-            elif current_section == 'event':
-                event += '\n' + section
-            elif current_section == 'actions' and section.upper() != 'NONE':
-                actions.extend([action.strip() for action in section.split('\n') if action.strip()])
-    
-    return {
-        'story': story,
-        'event': event,
-        'actions': actions
-    }
+    return response_parser.parse_response(llm_response_text)
 
 
-def execute_action(action_str, state):
-    """
-    Execute a single action command on the game state.
-    Returns True if the action was successful, False otherwise.
-    """
-    if not action_str or action_str.upper() == 'NONE':
-        return True
-    
-    parts = action_str.strip().split()
-    if not parts:
-        return False
-        
-    command = parts[0].upper()
-    
-    try:
-        if command == "TAKE":
-            return handle_take_action(parts[1:], state)
-        elif command == "DROP":
-            return handle_drop_action(parts[1:], state)
-        elif command == "MOVE_TO":
-            return handle_move_action(parts[1:], state)
-        elif command == "TIME_ADVANCE":
-            return handle_time_action(parts[1:], state)
-        elif command == "STATUS_ADD":
-            return handle_status_add_action(parts[1:], state)
-        elif command == "STATUS_REMOVE":
-            return handle_status_remove_action(parts[1:], state)
-        elif command == "NPC_MOVE":
-            return handle_npc_move_action(parts[1:], state)
-        elif command == "NPC_STATUS":
-            return handle_npc_status_action(parts[1:], state)
-        else:
-            print(f"Warning: Unknown action command: {command}")
-            return False
-    except Exception as e:
-        print(f"Error executing action '{action_str}': {e}")
-        return False
+# Every action the LLM can request, declared once with its grammar (see managers/actions.py).
+# The system prompt lists them in registration order; registering a handler is all a new verb needs.
+action_registry = actions.ActionRegistry()
 
 
-def handle_take_action(args, state):
+@action_registry.action("TAKE {item_name}")
+def handle_take_action(command, staged):
     """Handle TAKE item_name action"""
-    if not args:
-        return False
-        
-    item_name = " ".join(args)  # Handle multi-word items
-    current_location = state['world']['current_location']
+    current_location = staged.world['current_location']
     
     # Remove from location
-    if current_location in state['locations']:
-        location_items = state['locations'][current_location].get('items', [])
-        if item_name in location_items:
-            location_items.remove(item_name)
-            state['character']['inventory'].append(item_name)
-            print(f"Action executed: Took '{item_name}' from {current_location}")
-            return True
-    
-    print(f"Action failed: Could not take '{item_name}' from {current_location}")
+    location = staged.location(current_location)
+    if location is not None and command.item_name in location.get('items', []):
+        location['items'].remove(command.item_name)
+        staged.character['inventory'].append(command.item_name)
+        staged.mark_dirty('locations', current_location)
+        staged.mark_dirty('character')
+        print(f"Action executed: Took '{command.item_name}' from {current_location}")
+        return True
+    
+    print(f"Action failed: Could not take '{command.item_name}' from {current_location}")
     return False
 
 
-def handle_drop_action(args, state):
+@action_registry.action("DROP {item_name}")
+def handle_drop_action(command, staged):
     """Handle DROP item_name action"""
-    if not args:
-        return False
-        
-    item_name = " ".join(args)
-    current_location = state['world']['current_location']
-    
-    # Remove from inventory
-    if item_name in state['character']['inventory']:
-        state['character']['inventory'].remove(item_name)
-        
-        # Add to current location
-        if current_location in state['locations']:
-            state['locations'][current_location].setdefault('items', []).append(item_name)
-            print(f"Action executed: Dropped '{item_name}' in {current_location}")
-            return True
+    current_location = staged.world['current_location']
+    
+    # Move from inventory to the current location
+    location = staged.location(current_location)
+    if location is not None and command.item_name in staged.character['inventory']:
+        staged.character['inventory'].remove(command.item_name)
+        location.setdefault('items', []).append(command.item_name)
+        staged.mark_dirty('locations', current_location)
+        staged.mark_dirty('character')
+        print(f"Action executed: Dropped '{command.item_name}' in {current_location}")
+        return True
     
-    print(f"Action failed: Could not drop '{item_name}'")
+    print(f"Action failed: Could not drop '{command.item_name}'")
     return False
 
 
-def handle_move_action(args, state):
+@action_registry.action("MOVE_TO {location_name}")
+def handle_move_action(command, staged):
     """Handle MOVE_TO location_name action"""
-    if not args:
-        return False
-        
-    target_location = " ".join(args)
-    current_location = state['world']['current_location']
+    target_location = command.location_name
+    current_location = staged.world['current_location']
     
     # Validate connection exists
-    if current_location in state['locations']:
-        connections = state['locations'][current_location].get('connections', [])
-        if target_location in connections and target_location in state['locations']:
-            state['world']['current_location'] = target_location
-            print(f"Action executed: Moved from {current_location} to {target_location}")
-            return True
+    if staged.location_graph.connected(current_location, target_location):
+        staged.world['current_location'] = target_location
+        staged.mark_dirty('world')
+        print(f"Action executed: Moved from {current_location} to {target_location}")
+        return True
     
     print(f"Action failed: Cannot move from {current_location} to {target_location}")
     return False
 
 
-def handle_time_action(args, state):
+@action_registry.action("TIME_ADVANCE {time_period:morning|afternoon|evening|night}")
+def handle_time_action(command, staged):
     """Handle TIME_ADVANCE time_period action"""
-    if not args:
-        return False
-        
-    time_period = args[0].lower()
-    valid_times = ['morning', 'afternoon', 'evening', 'night']
-    
-    if time_period in valid_times:
-        state['world']['time_of_day'] = time_period.capitalize()
-        print(f"Action executed: Time advanced to {time_period}")
-        return True
-    
-    print(f"Action failed: Invalid time period '{time_period}'")
-    return False
+    staged.world['time_of_day'] = command.time_period.capitalize()
+    staged.mark_dirty('world')
+    print(f"Action executed: Time advanced to {command.time_period.lower()}")
+    return True
 
 
-def handle_status_add_action(args, state):
+@action_registry.action("STATUS_ADD {status_name}")
+def handle_status_add_action(command, staged):
     """Handle STATUS_ADD status_name action"""
-    if not args:
-        return False
-        
-    status_name = " ".join(args)
-    if status_name not in state['character']['status']:
-        state['character']['status'].append(status_name)
-        print(f"Action executed: Added status '{status_name}' to character")
+    if command.status_name not in staged.character['status']:
+        staged.character['status'].append(command.status_name)
+        staged.mark_dirty('character')
+        print(f"Action executed: Added status '{command.status_name}' to character")
         return True
     
-    print(f"Action failed: Character already has status '{status_name}'")
+    print(f"Action failed: Character already has status '{command.status_name}'")
     return False
 
 
-def handle_status_remove_action(args, state):
+@action_registry.action("STATUS_REMOVE {status_name}")
+def handle_status_remove_action(command, staged):
     """Handle STATUS_REMOVE status_name action"""
-    if not args:
-        return False
-        
-    status_name = " ".join(args)
-    if status_name in state['character']['status']:
-        state['character']['status'].remove(status_name)
-        print(f"Action executed: Removed status '{status_name}' from character")
+    if command.status_name in staged.character['status']:
+        staged.character['status'].remove(command.status_name)
+        staged.mark_dirty('character')
+        print(f"Action executed: Removed status '{command.status_name}' from character")
         return True
     
-    print(f"Action failed: Character does not have status '{status_name}'")
+    print(f"Action failed: Character does not have status '{command.status_name}'")
     return False
 
 
-def handle_npc_move_action(args, state):
+@action_registry.action("NPC_MOVE {npc_name} TO {location_name}")
+def handle_npc_move_action(command, staged):
     """Handle NPC_MOVE npc_name TO location_name action"""
-    if len(args) < 3 or args[-2].upper() != 'TO':
-        return False
-        
-    # Find the TO keyword and split around it
-    to_index = -1
-    for i, arg in enumerate(args):
-        if arg.upper() == 'TO':
-            to_index = i
-            break
-    
-    if to_index == -1:
-        return False
-        
-    npc_name = " ".join(args[:to_index])
-    location_name = " ".join(args[to_index + 1:])
-    
-    if npc_name in state['npcs'] and location_name in state['locations']:
-        state['npcs'][npc_name]['location'] = location_name
-        print(f"Action executed: Moved NPC '{npc_name}' to {location_name}")
+    npc = staged.npc(command.npc_name)
+    # NPCs walk the map too: the destination has to be reachable from where the NPC is, if it is anywhere
+    reachable = npc is not None and (
+        npc.get('location') not in staged.location_graph
+        or staged.location_graph.path(npc['location'], command.location_name, max_hops=NPC_MOVE_MAX_HOPS) is not None
+    )
+    if reachable and staged.location(command.location_name) is not None:
+        npc['location'] = command.location_name
+        staged.mark_dirty('npcs', command.npc_name)
+        print(f"Action executed: Moved NPC '{command.npc_name}' to {command.location_name}")
         return True
     
-    print(f"Action failed: Could not move NPC '{npc_name}' to {location_name}")
+    print(f"Action failed: Could not move NPC '{command.npc_name}' to {command.location_name}")
     return False
 
 
-def handle_npc_status_action(args, state):
-    """Handle NPC_STATUS npc_name ADD/REMOVE status_name action"""
-    if len(args) < 3:
+@action_registry.action("NPC_STATUS {npc_name} ADD {status_name}")
+def handle_npc_status_add_action(command, staged):
+    """Handle NPC_STATUS npc_name ADD status_name action"""
+    npc = staged.npc(command.npc_name)
+    if npc is None:
+        print(f"Action failed: Unknown NPC '{command.npc_name}'")
         return False
-        
-    # Find ADD or REMOVE keyword
-    action_index = -1
-    action_type = None
-    for i, arg in enumerate(args):
-        if arg.upper() in ['ADD', 'REMOVE']:
-            action_index = i
-            action_type = arg.upper()
-            break
-    
-    if action_index == -1:
-        return False
-        
-    npc_name = " ".join(args[:action_index])
-    status_name = " ".join(args[action_index + 1:])
     
-    if npc_name not in state['npcs']:
-        print(f"Action failed: Unknown NPC '{npc_name}'")
-        return False
+    npc_statuses = npc.setdefault('status', [])
+    if command.status_name not in npc_statuses:
+        npc_statuses.append(command.status_name)
+        staged.mark_dirty('npcs', command.npc_name)
+        print(f"Action executed: Added status '{command.status_name}' to NPC '{command.npc_name}'")
+        return True
     
-    npc_statuses = state['npcs'][npc_name].setdefault('status', [])
+    print(f"Action failed: NPC '{command.npc_name}' already has status '{command.status_name}'")
+    return False
+
+
+@action_registry.action("NPC_STATUS {npc_name} REMOVE {status_name}")
+def handle_npc_status_remove_action(command, staged):
+    """Handle NPC_STATUS npc_name REMOVE status_name action"""
+    npc = staged.npc(command.npc_name)
+    if npc is None:
+        print(f"Action failed: Unknown NPC '{command.npc_name}'")
+        return False
     
-    if action_type == 'ADD':
-        if status_name not in npc_statuses:
-            npc_statuses.append(status_name)
-            print(f"Action executed: Added status '{status_name}' to NPC '{npc_name}'")
-            return True
-        else:
-            print(f"Action failed: NPC '{npc_name}' already has status '{status_name}'")
-            return False
-    elif action_type == 'REMOVE':
-        if status_name in npc_statuses:
-            npc_statuses.remove(status_name)
-            print(f"Action executed: Removed status '{status_name}' from NPC '{npc_name}'")
-            return True
-        else:
-            print(f"Action failed: NPC '{npc_name}' does not have status '{status_name}'")
-            return False
+    npc_statuses = npc.setdefault('status', [])
+    if command.status_name in npc_statuses:
+        npc_statuses.remove(command.status_name)
+        staged.mark_dirty('npcs', command.npc_name)
+        print(f"Action executed: Removed status '{command.status_name}' from NPC '{command.npc_name}'")
+        return True
     
+    print(f"Action failed: NPC '{command.npc_name}' does not have status '{command.status_name}'")
     return False
 
 
-def run_summarization_check(state):
+def run_summarization_check(game_session, state):
     """
-    Checks if summarization is needed and performs it if the event count exceeds the threshold.
+    Checks if summarization is needed and, if so, queues a job for the session's
+    background summary worker: condensing older events into a leaf summary, or
+    SUMMARY_FANOUT summaries of one level into a chapter. The turn doesn't wait for it.
     """
     events = state["events"]
+    worker = start_summary_worker(game_session)
     
     # Check if we need to summarize
-    if len(events) <= EVENTS_THRESHOLD:
-        return  # No summarization needed
-    
-    print(f"Events count ({len(events)}) exceeds threshold ({EVENTS_THRESHOLD}). Running summarization...")
-    
-    # Calculate how many events to summarize (leave 2 most recent)
-    events_to_keep = 2
-    events_to_summarize = events[events_to_keep:]  # Get older events (everything except the 2 most recent)
+    if len(events) > EVENTS_THRESHOLD:
+        # Summarize everything except the most recent events. The snapshot stays in
+        # the events list until its summary is merged, so nothing is lost meanwhile.
+        events_to_summarize = events[EVENTS_TO_KEEP:]
+        job = summarizer.SummaryJob(
+            events_to_summarize,
+            summarize_events,
+            lambda summarized_events, summary: merge_summary(game_session, summarized_events, summary)
+        )
+        if worker.submit(job):
+            print(f"Events count ({len(events)}) exceeds threshold ({EVENTS_THRESHOLD}). Summarizing {len(events_to_summarize)} events in the background...")
+        return
     
-    # Join events into a single string for summarization
-    events_text = "\n".join(events_to_summarize)
+    run = summarizer.mergeable_run(state["summaries"], SUMMARY_FANOUT)
+    if run is not None:
+        start, entries = run
+        job = summarizer.SummaryJob(
+            entries,
+            summarize_summaries,
+            lambda merged_entries, chapter: merge_chapter(game_session, start, merged_entries, chapter)
+        )
+        if worker.submit(job):
+            print(f"Condensing {len(entries)} level {summarizer.summary_node(entries[0])['level']} summaries into a chapter in the background...")
+
+
+def summarize_events(events_to_summarize):
+    """
+    Condenses a snapshot of events (most recent first) into a summary paragraph.
+    Runs on the summary worker's thread. Returns None if the LLM call failed.
+    """
+    # Join events into a single string for summarization, oldest first
+    events_text = "\n".join(reversed(events_to_summarize))
+    return query_llm_for_summary(events_text)
+
+
+def summarize_summaries(entries):
+    """
+    Condenses consecutive summaries (oldest first) into one chapter paragraph.
+    Runs on the summary worker's thread. Returns None if the LLM call failed.
+    """
+    return query_llm_for_summary("\n\n".join(summarizer.summary_node(entry)["text"] for entry in entries))
+
+
+def log_summary(game_session, state, summary_paragraph, level):
+    """
+    Appends a summary to the full event log, which embeds and keyword-indexes it
+    like an event, so deep memory can recall it. Archived summaries (merged into
+    a chapter) stay retrievable there. Returns the summary's tree node.
+    """
+    record = {
+        "text": summary_paragraph,
+        "turn": state['world'].get('turn', 0),
+        "kind": "summary",
+        "level": level
+    }
+    log_id = game_session.event_log.append(record)
+    add_to_faiss_index(game_session, record, log_id)
+    return {"text": summary_paragraph, "level": level, "log_id": log_id}
+
+
+def merge_summary(game_session, summarized_events, summary_paragraph):
+    """
+    Adds a finished summary to the session's state and removes the events it covers,
+    in one commit. Events logged while the summary was written are newer, so the
+    summarized ones are still the oldest, at the end of the list.
+    Runs on the summary worker's thread, under the state store's lock.
+    Returns False if the state no longer holds those events (e.g. after a reset).
+    """
+    state = load_state(game_session)
+    events = state["events"]
+    remaining = len(events) - len(summarized_events)
+    if remaining < 0 or events[remaining:] != summarized_events:
+        print("Discarding summary: the summarized events are no longer in the game state.")
+        return False
     
-    # Get summary from LLM
-    summary_paragraph = query_llm_for_summary(events_text)
+    # Recorded for /undo, so undoing the turns before the merge restores the events
+    step = undo.UndoStep("summary", log_length=len(game_session.event_log))
     
-    # Add summary to the summaries list
-    state["summaries"].append(summary_paragraph)
+    # Add summary to the summaries list (a leaf of the summary tree)
+    step.ops.append(("splice", "summaries", len(state["summaries"]), len(state["summaries"]) + 1, []))
+    state["summaries"].append(log_summary(game_session, state, summary_paragraph, level=0))
+    state.mark_dirty("summaries")
     
-    # Trim the events list to keep only the most recent events
-    state["events"] = events[:events_to_keep]
+    # Trim the events list to the events the summary doesn't cover
+    step.ops.append(("splice", "events", remaining, remaining, events[remaining:]))
+    state["events"] = events[:remaining]
+    save_state(game_session, state)
+    game_session.undo_journal.record(step)
     
     print(f"Summarization complete. Events reduced from {len(events)} to {len(state['events'])}.")
     print(f"New summary added: {summary_paragraph}")
+    return True
 
 
-def run_game_turn(player_input):
+def merge_chapter(game_session, start, merged_entries, chapter_paragraph):
+    """
+    Replaces consecutive summaries with the chapter condensing them, in one commit.
+    The merged summaries are archived: they leave the game state but stay in the
+    full event log. Runs on the summary worker's thread, under the state store's lock.
+    Returns False if the state no longer holds those summaries at `start`.
+    """
+    state = load_state(game_session)
+    summaries = state["summaries"]
+    end = start + len(merged_entries)
+    if summaries[start:end] != merged_entries:
+        print("Discarding chapter: the merged summaries are no longer in the game state.")
+        return False
+    
+    level = summarizer.summary_node(merged_entries[0])["level"] + 1
+    step = undo.UndoStep("chapter", log_length=len(game_session.event_log))
+    step.ops.append(("splice", "summaries", start, start + 1, summaries[start:end]))
+    summaries[start:end] = [log_summary(game_session, state, chapter_paragraph, level)]
+    state.mark_dirty("summaries")
+    save_state(game_session, state)
+    game_session.undo_journal.record(step)
+    
+    print(f"Chapter complete: {len(merged_entries)} summaries condensed into a level {level} chapter.")
+    return True
+
+
+def start_summary_worker(game_session):
+    """Returns the session's background summary worker, starting it if needed."""
+    if game_session.summary_worker is None:
+        game_session.summary_worker = summarizer.SummaryWorker(game_session.state_store.lock)
+    game_session.summary_worker.start()
+    return game_session.summary_worker
+
+
+def response_cache_slice(state):
+    """
+    The part of the state a reply to observational input describes: the current
+    location and its items, the NPCs present, the time of day and the character.
+    Returns the slice and the tags of the locations and NPCs it depends on.
+    """
+    current_location = state['world']['current_location']
+    location = state['locations'].get(current_location) or {}
+    npcs = npcs_at_location(state, current_location)
+    state_slice = {
+        "location": current_location,
+        "items": sorted(location.get('items', [])),
+        "npcs": {name: sorted(npc.get('status', [])) for name, npc in npcs.items()},
+        "time_of_day": state['world']['time_of_day'],
+        "character": {
+            "status": sorted(state['character']['status']),
+            "inventory": sorted(state['character']['inventory'])
+        }
+    }
+    tags = {f"location:{current_location}"} | {f"npc:{name}" for name in npcs}
+    return state_slice, tags
+
+
+def cached_response(game_session, state, player_input):
+    """
+    Looks the turn up in the session's response cache.
+    Returns the cache key (None with RESPONSE_CACHE_ENABLED off) and the cached response, if any.
+    """
+    if game_session.response_cache is None:
+        return None, None
+    state_slice, _ = response_cache_slice(state)
+    key = response_cache.state_key(state_slice, player_input)
+    return key, game_session.response_cache.get(key)
+
+
+def cache_response(game_session, state, key, llm_response_str, parsed_response):
+    """
+    Caches a reply that only described the scene: no actions, and not an error.
+    Called after the turn is applied; without actions the slice it describes is unchanged.
+    """
+    if key is None or parsed_response['actions']:
+        return
+    if parsed_response['event'] in LLM_ERROR_EVENTS or parsed_response['event'] == response_parser.DEFAULT_EVENT:
+        return
+    _, tags = response_cache_slice(state)
+    game_session.response_cache.put(key, llm_response_str, tags)
+
+
+def invalidate_cached_responses(game_session, state, time_of_day):
+    """
+    Drops the cached replies that describe state the turn's actions changed, as
+    recorded by the handlers' mark_dirty calls. `time_of_day` is the time before the actions.
+    """
+    cache = game_session.response_cache
+    changes = state.changes
+    if cache is None or not changes:
+        return
+    # Every cached reply describes the character and the time of day
+    if 'character' in changes or state['world']['time_of_day'] != time_of_day:
+        cache.invalidate()
+        return
+    if changes.get('locations', set()) is None or changes.get('npcs', set()) is None:
+        cache.invalidate()
+        return
+    tags = {f"location:{name}" for name in changes.get('locations', ())}
+    for npc_name in changes.get('npcs', ()):
+        # An NPC that moved changes both the location it left (tagged with the NPC) and the one it entered
+        tags.add(f"npc:{npc_name}")
+        if npc_name in state['npcs']:
+            tags.add(f"location:{state['npcs'][npc_name].get('location')}")
+    if tags:
+        cache.invalidate(tags)
+
+
+def run_game_turn(player_input, game_session):
     """
     This function orchestrates a single turn of the game with Phase 3 Hybrid Memory System.
+    The caller holds the session's lock (see SessionManager.acquire).
+    """
+    # A reply cached for this input and state skips retrieval and the LLM; the turn is still applied and logged
+    state = load_state(game_session)
+    cache_key, llm_response_str = cached_response(game_session, state, player_input)
+    if llm_response_str is not None:
+        print(f"Serving cached response for input: '{player_input}'")
+        return apply_llm_response(game_session, state, llm_response_str)
+
+    state, llm_prompt = prepare_turn(player_input, game_session)
+
+    # Step E: Query the LLM
+    llm_response_str = query_llm(llm_prompt, llm_slot(game_session))
+
+    return apply_llm_response(game_session, state, llm_response_str, cache_key=cache_key)
+
+
+def prepare_turn(player_input, game_session):
+    """
+    Steps A-D of a turn: loads the state, recalls deep memories and assembles the
+    LLM prompt. Returns the state and the prompt.
     """
-    # Step A: Load Full Game State
-    state = load_state()
+    # Step A: Load Full Game State (resident in memory after the first turn)
+    state = load_state(game_session)
     
     # Step B: SEMANTIC SEARCH (NEW STEP - Deep Memory Retrieval)
-    retrieved_indices = search_faiss_index(player_input, k=2)
+    # With lazy startup this is the first point a turn needs the model and indexes.
+    if wait_for_memory_system():
+        load_session_memory(game_session)
+    retrieved_indices = search_faiss_index(game_session, player_input, k=2, event_filter=deep_memory_filter(state))
     deep_memories = []
     if retrieved_indices:
-        deep_memories = [state["full_event_log"][i] for i in retrieved_indices if i < len(state["full_event_log"])]
+        logged_events = len(game_session.event_log)
+        deep_memories = [
+            event_metadata.event_text(event)
+            for event in game_session.event_log.get_many([i for i in retrieved_indices if i < logged_events])
+        ]
     
     print(f"Retrieved {len(deep_memories)} deep memories for input: '{player_input}'")
-    for i, memory in enumerate(deep_memories):
-        print(f"  Deep Memory {i+1}: {memory}")
+    for i, memory_text in enumerate(deep_memories):
+        print(f"  Deep Memory {i+1}: {memory_text}")
     
     # Step C: HEURISTIC FILTERING
     current_location = state['world']['current_location']
     
-    # Create contextual_locations
-    contextual_locations = {}
-    if current_location in state['locations']:
-        # Add current location
-        contextual_locations[current_location] = state['locations'][current_location]
-        
-        # Add connected locations
-        connections = state['locations'][current_location].get('connections', [])
-        for connected_location in connections:
-            if connected_location in state['locations']:
-                contextual_locations[connected_location] = state['locations'][connected_location]
+    # Create contextual_locations: the current location and those within NEARBY_LOCATION_HOPS moves, nearest first
+    nearby = load_location_graph(game_session, state).within(current_location, NEARBY_LOCATION_HOPS)
+    contextual_locations = {name: state['locations'][name] for name in nearby}
     
     # Create contextual_npcs (only NPCs in current location)
-    contextual_npcs = {}
-    for npc_name, npc_data in state['npcs'].items():
-        if npc_data.get('location') == current_location:
-            contextual_npcs[npc_name] = npc_data
+    contextual_npcs = npcs_at_location(state, current_location)
     
     # Step D: Assemble the HYBRID LLM Prompt
     char = state['character']
@@ -604,152 +922,190 @@ def run_game_turn(player_input):
         current_location_description = state['locations'][current_location].get('description', 'No description available')
         current_location_items = state['locations'][current_location].get('items', [])
     
-    # Format current location items
-    current_items_section = ""
-    if current_location_items:
-        for item in current_location_items:
-            current_items_section += f"    {item}\n"
-    else:
-        current_items_section = "    None\n"
-    
     # Format nearby locations
-    nearby_locations_section = ""
+    nearby_locations = []
     for loc_name, loc_data in contextual_locations.items():
         if loc_name != current_location:  # Don't include current location in nearby
             items_list = loc_data.get('items', [])
             items_str = f", Items: {', '.join(items_list)}" if items_list else ", Items: None"
-            nearby_locations_section += f"    {loc_name}: {loc_data.get('description', 'No description')}{items_str}\n\n"
-    
-    if not nearby_locations_section.strip():
-        nearby_locations_section = "    None\n\n"
+            nearby_locations.append(f"    {loc_name}: {loc_data.get('description', 'No description')}{items_str}")
     
     # Format NPCs present
-    npcs_present_section = ""
+    npcs_present = []
     for npc_name, npc_data in contextual_npcs.items():
         status_str = ', '.join(npc_data.get('status', []))
-        npcs_present_section += f"    {npc_name}: {npc_data.get('description', 'No description')}, Status: {status_str}\n\n"
-    
-    if not npcs_present_section.strip():
-        npcs_present_section = "    None\n\n"
-    
-    # Format deep memories (NEW SECTION)
-    deep_memory_section = ""
-    if deep_memories:
-        for memory in deep_memories:
-            deep_memory_section += f"    {memory}\n\n"
-        deep_memory_section = deep_memory_section.rstrip("\n")
-    else:
-        deep_memory_section = "    None"
-    
-    # Format recent events (up to 5, in reverse chronological order)
-    events_section = ""
-    for event in events[:5]:  # Take only the first 5 (most recent)
-        events_section += f"    {event}\n\n"
+        npcs_present.append(f"    {npc_name}: {npc_data.get('description', 'No description')}, Status: {status_str}")
     
-    # Remove trailing newlines if events exist
-    if events_section:
-        events_section = events_section.rstrip("\n")
+    # Format summary of past events: the chapters and summaries that best fill the budget
+    summary_budget = PROMPT_SECTION_BUDGETS.get("[SUMMARY OF PAST EVENTS]", SUMMARY_TOKEN_BUDGET)
+    selected_summaries = summarizer.select_summaries(state["summaries"], summary_budget, prompt_token_counter.count)
 
-    # Format summary of past events
-    summary_section = "None"
-    if state["summaries"]:
-        summary_section = state["summaries"][-1]  # Get the most recent summary
+    # Format recent events. The stable-first layout lists them oldest first, so
+    # a new event extends the previous turn's prompt instead of shifting it.
+    stable_layout = PROMPT_LAYOUT == prompt_builder.PromptLayout.STABLE_FIRST
+    recent_events = [f"    {event}" for event in events[:MAX_EVENTS]]  # Most recent first
+    if stable_layout:
+        recent_events.reverse()
 
     # NEW HYBRID PROMPT STRUCTURE
-    llm_prompt = f"""[CHARACTER]
-Name: {char['name']}, Status: {', '.join(char['status'])}, Inventory: {', '.join(char['inventory'])}
-
-[DEEP MEMORY]
-(Recalled from past events based on your input)
-
-{deep_memory_section}
-
-[WORLD]
-Current Location: {current_location}
-Description: {current_location_description}
-Time: {world['time_of_day']}
-
-[ITEMS IN CURRENT LOCATION]
-
-{current_items_section.rstrip()}
-
-[NEARBY LOCATIONS]
-
-{nearby_locations_section.rstrip()}
-
-[NPCS PRESENT]
-
-{npcs_present_section.rstrip()}
-
-[SUMMARY OF PAST EVENTS]
-(A narrative overview of the long-term past)
-
-{summary_section}
-
-[RECENT EVENTS]
-(What just happened)
-
-{events_section}
-
-[SCENE]
-{player_input}"""
+    # Sections are cut to their budgets in PROMPT_SECTION_BUDGETS; if the prompt is still
+    # over PROMPT_TOKEN_BUDGET, entries of the lowest priority sections are dropped first.
+    sections = [
+        prompt_builder.PromptSection(
+            "[CHARACTER]",
+            [f"Name: {char['name']}, Status: {', '.join(char['status'])}, Inventory: {', '.join(char['inventory'])}"],
+            required=True
+        ),
+        prompt_builder.PromptSection(
+            "[DEEP MEMORY]",
+            [f"    {memory_text}" for memory_text in deep_memories],  # Most relevant first
+            note="(Recalled from past events based on your input)", spaced=True, empty="    None", priority=3
+        ),
+        prompt_builder.PromptSection(
+            "[WORLD]",
+            [f"Current Location: {current_location}", f"Description: {current_location_description}", f"Time: {world['time_of_day']}"],
+            separator="\n", required=True
+        ),
+        prompt_builder.PromptSection(
+            "[ITEMS IN CURRENT LOCATION]",
+            [f"    {item}" for item in current_location_items],
+            spaced=True, separator="\n", empty="    None", priority=5
+        ),
+        prompt_builder.PromptSection(
+            "[NEARBY LOCATIONS]", nearby_locations, spaced=True, empty="    None", priority=1
+        ),
+        prompt_builder.PromptSection(
+            "[NPCS PRESENT]", npcs_present, spaced=True, empty="    None", priority=4
+        ),
+        prompt_builder.PromptSection(
+            "[SUMMARY OF PAST EVENTS]",
+            [node["text"] for node in selected_summaries],  # Oldest first
+            note="(A narrative overview of the long-term past)", spaced=True, priority=0, keep_last=True
+        ),
+        prompt_builder.PromptSection(
+            "[RECENT EVENTS]",
+            recent_events,
+            note="(What just happened)", spaced=True, empty="", priority=6, keep_last=stable_layout
+        ),
+        prompt_builder.PromptSection("[SCENE]", [player_input], required=True)
+    ]
+    for section in sections:
+        section.budget = PROMPT_SECTION_BUDGETS.get(section.title)
+    sections = prompt_builder.arrange(sections, PROMPT_LAYOUT)
+    llm_prompt, prompt_report = prompt_builder.PromptBuilder(prompt_token_counter, PROMPT_TOKEN_BUDGET).build(sections)
+    # How much of the prompt a prefix-caching server can reuse from this session's last turn
+    prompt_report["shared_prefix"] = prompt_token_counter.count(prompt_builder.shared_prefix(game_session.last_prompt, llm_prompt))
+    game_session.last_prompt = llm_prompt
+    game_session.last_prompt_report = prompt_report
     
     print("--- Assembled Hybrid Prompt for LLM ---")
     print(llm_prompt)
     print("---------------------------------------")
+    print(f"Prompt tokens: {prompt_report['total']} of {PROMPT_TOKEN_BUDGET}, {prompt_report['shared_prefix']} shared with the last turn ("
+          + ", ".join(f"{title} {info['tokens']}" + (f" -{info['dropped']}" if info['dropped'] else "")
+                      for title, info in prompt_report['sections'].items()) + ")")
 
-    # Step E: Query the LLM
-    llm_response_str = query_llm(llm_prompt)
+    return state, llm_prompt
 
-    # Step F: Parse and Apply LLM Response (NEW TEXT-BASED PARSING)
-    try:
-        # Parse the simple text-based response
-        parsed_response = parse_llm_response(llm_response_str)
+
+def apply_llm_response(game_session, state, llm_response_str, parsed_response=None, cache_key=None, staged_actions=None):
+    """
+    Steps F-J of a turn: applies the LLM's actions and event to the state, saves it
+    and queues the event for indexing. Returns the data sent back to the frontend.
+    `parsed_response` skips parsing when the response was already parsed as it streamed,
+    and `staged_actions` (an actions.StagedState) validating its actions when they were checked as they streamed.
+    With `cache_key` (see cached_response), a reply that only described the scene is cached.
+    """
+    # Steps F-I change the resident state; the background flush serializes it
+    # under the same lock, so it never sees a half-applied turn.
+    with game_session.state_store.lock:
+        # Step F: Parse the LLM Response (NEW TEXT-BASED PARSING)
+        try:
+            # Parse the simple text-based response
+            if parsed_response is None:
+                parsed_response = parse_llm_response(llm_response_str)
         
-        # Extract components
-        story_text = parsed_response['story']
-        new_event = parsed_response['event']
-        actions = parsed_response['actions']
+            # Extract components
+            story_text = parsed_response['story']
+            new_event = parsed_response['event']
+            action_lines = parsed_response['actions']
         
-        print(f"--- Parsed Response ---")
-        print(f"Story: {story_text}")
-        print(f"Event: {new_event}")
-        print(f"Actions: {actions}")
-        print("----------------------")
+            print(f"--- Parsed Response ---")
+            print(f"Story: {story_text}")
+            print(f"Event: {new_event}")
+            print(f"Actions: {action_lines}")
+            print("----------------------")
         
-        # Execute all actions
-        for action in actions:
-            if action.strip():
-                success = execute_action(action, state)
-                if not success:
-                    print(f"Failed to execute action: {action}")
+            # Parse and validate all actions against a staged copy; nothing is applied yet
+            if staged_actions is None:
+                staged_actions = action_registry.plan(action_lines, state, load_location_graph(game_session, state))
+            for action in staged_actions.rejected:
+                print(f"Failed to execute action: {action}")
         
-    except Exception as e:
-        # If parsing fails, we can still return the raw response
-        print(f"Error parsing LLM response: {e}")
-        return {
-            "story_text": f"Response Parsing Error: Could not parse the AI response properly.\n\nError: {str(e)}\n\nRaw response:\n{llm_response_str}",
-            "current_location": state['world']['current_location'],
-            "inventory": state['character']['inventory']
-        }
+        except Exception as e:
+            # If parsing fails, we can still return the raw response
+            print(f"Error parsing LLM response: {e}")
+            return {
+                "story_text": f"Response Parsing Error: Could not parse the AI response properly.\n\nError: {str(e)}\n\nRaw response:\n{llm_response_str}",
+                "current_location": state['world']['current_location'],
+                "inventory": state['character']['inventory']
+            }
 
-    # Step G: Add to BOTH memory systems
-    if new_event:
-        # Add to recent events (short-term memory)
-        state["events"].insert(0, new_event)
-        state["events"] = state["events"][:MAX_EVENTS]
-        
-        # Add to full event log (deep memory) - CRITICAL NEW STEP
-        state["full_event_log"].append(new_event)
-        
-        # Rebuild FAISS index immediately for new searchable memory
-        build_faiss_index(state["full_event_log"])
+        # Steps F-I apply the turn as one transaction: every change records its inverse,
+        # so a failure rolls the whole turn back, and /undo can take it back later.
+        turn_step = undo.UndoStep("turn", log_length=len(game_session.event_log))
+        try:
+            # Apply the validated actions together
+            time_of_day = state['world']['time_of_day']
+            staged_actions.commit(turn_step.ops)
+            update_location_graph(game_session, state)
+            invalidate_cached_responses(game_session, state, time_of_day)
+
+            # Advance the turn counter (older saves start counting from the log length)
+            turn = state['world'].get('turn', len(game_session.event_log)) + 1
+            turn_step.ops.append(undo.field_op(state, 'world', 'turn'))
+            state['world']['turn'] = turn
+            state.mark_dirty('world')
+
+            # Step G: Add to BOTH memory systems
+            if new_event:
+                # Add to recent events (short-term memory). The prompt shows the
+                # MAX_EVENTS most recent; older ones wait here to be summarized.
+                state["events"].insert(0, new_event)
+                turn_step.ops.append(("splice", "events", 0, 1, []))
+                state.mark_dirty("events")
+            
+                # Append to the full event log (deep memory) - CRITICAL NEW STEP
+                # Each entry records where and when it happened and who/what it mentions,
+                # so retrieval can be filtered on it.
+                event_record = event_metadata.make_event_record(new_event, turn, state)
+                event_id = game_session.event_log.append(event_record)
+
+            # Step H: Run Summarization Check
+            run_summarization_check(game_session, state)
+
+            # Step I: Save Game State (journal this turn's changes; the files are written behind)
+            save_state(game_session, state)
+
+        except Exception as e:
+            print(f"Applying the turn failed; rolling it back: {e}")
+            undo.revert(state, turn_step.ops)
+            update_location_graph(game_session, state)
+            game_session.event_log.truncate(turn_step.log_length)
+            return {
+                "story_text": f"Turn Error: The turn could not be applied and was rolled back.\n\nError: {str(e)}",
+                "current_location": state['world']['current_location'],
+                "inventory": state['character']['inventory']
+            }
 
-    # Step H: Run Summarization Check
-    run_summarization_check(state)
+        game_session.undo_journal.record(turn_step)
+        cache_response(game_session, state, cache_key, llm_response_str, parsed_response)
 
-    # Step I: Save Game State
-    save_state(state)
+        # Step J: Queue the new event for indexing. The background worker encodes it
+        # and appends it to the FAISS index after the response has been sent. Queuing
+        # under the lock the summary worker logs under keeps the indexes in log order.
+        if new_event:
+            add_to_faiss_index(game_session, event_record, event_id)
 
     # Prepare the data to send back to the frontend
     turn_result = {
@@ -760,80 +1116,300 @@ Time: {world['time_of_day']}
     return turn_result
 
 
+def undo_turns(game_session, turns):
+    """
+    Takes back the session's last `turns` turns, and any summaries merged since
+    the first of them, by applying their inverse operations newest first and
+    truncating the deep event log and memory indexes to where they were.
+    Returns the number of turns undone. The caller holds the session's lock.
+    """
+    # The memory indexes have to be loaded to be truncated along with the log
+    if wait_for_memory_system():
+        load_session_memory(game_session)
+    # A summary still being written may cover events that are about to be undone
+    if game_session.summary_worker is not None:
+        game_session.summary_worker.cancel()
+        game_session.summary_worker = None
+    
+    with game_session.state_store.lock:
+        steps = game_session.undo_journal.pop(turns)
+        if not steps:
+            return 0
+        state = load_state(game_session)
+        for step in steps:
+            undo.revert(state, step.ops)
+        update_location_graph(game_session, state)
+        truncate_deep_memory(game_session, steps[-1].log_length)
+        save_state(game_session, state)
+    
+    if game_session.response_cache is not None:
+        game_session.response_cache.invalidate()
+    undone = sum(1 for step in steps if step.kind == "turn")
+    print(f"Undid {undone} turns ({len(steps)} steps); {game_session.undo_journal.turns} more can be undone.")
+    return undone
+
+
 # === FAISS Memory System Functions ===
 
+def embedding_model_id():
+    """
+    Identifies the vectors the configured backend produces. Cached and stored
+    embeddings from another backend (e.g. fp32 vs. int8) are never mixed.
+    """
+    if EMBEDDING_BACKEND == embedding.EmbeddingBackend.ONNX:
+        return f"{EMBEDDING_MODEL_NAME}:onnx:{os.path.basename(ONNX_MODEL_PATH)}"
+    return EMBEDDING_MODEL_NAME
+
 def initialize_sentence_model():
-    """Initialize the sentence transformer model globally."""
-    global sentence_model
+    """
+    Initialize the sentence embedding model globally, using EMBEDDING_BACKEND.
+    The model is wrapped in an embedding cache so repeated texts are never re-encoded.
+    """
+    global sentence_model, embedding_cache
     if sentence_model is None:
-        print("Loading sentence transformer model...")
-        sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("Sentence transformer model loaded.")
+        print(f"Loading sentence embedding model ({EMBEDDING_BACKEND})...")
+        embedding_cache = embedding.EmbeddingCache(
+            max_entries=EMBEDDING_CACHE_SIZE,
+            disk_dir=EMBEDDING_CACHE_DIR,
+            namespace=embedding_model_id()
+        )
+        backend_module = embedding.BACKEND_MODULES[EMBEDDING_BACKEND]
+        with startup_profile.measure(f"import {backend_module}"):
+            startup.ensure_loaded(startup.lazy_import(backend_module))
+        with startup_profile.measure(f"load embedding model ({EMBEDDING_BACKEND})"):
+            model = embedding.load_encoder(
+                EMBEDDING_BACKEND,
+                EMBEDDING_MODEL_NAME,
+                onnx_model_path=ONNX_MODEL_PATH,
+                onnx_tokenizer_path=ONNX_TOKENIZER_PATH,
+                threads=EMBEDDING_THREADS
+            )
+        sentence_model = embedding.CachedEncoder(model, embedding_cache)
+        print("Sentence embedding model loaded.")
+
+def create_memory_store(game_session):
+    """Returns the on-disk store for embeddings and the FAISS index, next to the session's game data."""
+    return memory.EmbeddingStore(game_session.data_dir, model_name=embedding_model_id())
+
+def create_memory_index(game_session):
+    """Creates an empty, persisted memory index for a session."""
+    initialize_sentence_model()
+    return memory.MemoryIndex(sentence_model, store=create_memory_store(game_session), snapshot_interval=MEMORY_SNAPSHOT_INTERVAL, config=MEMORY_INDEX_CONFIG)
 
-def build_faiss_index(events_list):
+def load_faiss_index(game_session, events_list):
     """
-    Builds a FAISS index from the provided list of events.
+    Restores the session's FAISS index and embeddings from disk, validated against its event log.
+    Only events not covered by the stored embeddings are encoded.
     """
-    global faiss_index, sentence_model
-    
-    # Initialize the model if needed
     initialize_sentence_model()
+    event_texts = [event_metadata.event_text(event) for event in events_list]
+    game_session.memory_index = memory.MemoryIndex.load(sentence_model, event_texts, create_memory_store(game_session), snapshot_interval=MEMORY_SNAPSHOT_INTERVAL, config=MEMORY_INDEX_CONFIG)
+    print(f"FAISS index for session '{game_session.session_id}' loaded with {game_session.memory_index.ntotal} events.")
+    build_lexical_index(game_session, events_list)
+
+def load_session_memory(game_session):
+    """Loads a session's memory indexes and starts its embedding worker, the first time the session needs them."""
+    if game_session.memory_index is None:
+        load_faiss_index(game_session, game_session.event_log.records())
+        start_embedding_worker(game_session)
+
+def build_lexical_index(game_session, events_list):
+    """Builds the BM25 keyword index and the metadata posting lists over the session's full event log."""
+    game_session.lexical_index = lexical.BM25Index()
+    game_session.lexical_index.rebuild([event_metadata.event_text(event) for event in events_list])
+    game_session.metadata_index = event_metadata.EventMetadataIndex()
+    game_session.metadata_index.rebuild(events_list)
+    print(f"Keyword and metadata indexes built with {len(game_session.lexical_index)} events.")
+
+def build_faiss_index(game_session, events_list):
+    """
+    Rebuilds the session's FAISS index from scratch from the provided list of events.
+    Only used on /reset, when the stored index doesn't match the event log,
+    or when a full rebuild is explicitly requested.
+    """
+    if game_session.memory_index is None:
+        game_session.memory_index = create_memory_index(game_session)
+        start_embedding_worker(game_session)
+    build_lexical_index(game_session, events_list)
     
     if not events_list:
         print("No events to index.")
-        faiss_index = None
+        game_session.memory_index.rebuild([])
         return
     
     print(f"Building FAISS index from {len(events_list)} events...")
+    game_session.memory_index.rebuild([event_metadata.event_text(event) for event in events_list])
+    print(f"FAISS index built with {game_session.memory_index.ntotal} events.")
+
+def add_to_faiss_index(game_session, event, position):
+    """
+    Hands a single new event to the session's background embedding worker, which
+    encodes it and appends it to the existing FAISS index off the request path.
+    `position` is the event's index in the full event log.
+    """
+    event_text = event_metadata.event_text(event)
     
-    # Generate embeddings for all events
-    embeddings = sentence_model.encode(events_list)
-    embeddings = np.array(embeddings).astype('float32')
-    
-    # Create FAISS index
-    dimension = embeddings.shape[1]
-    faiss_index = faiss.IndexFlatIP(dimension)  # Inner Product (cosine similarity)
+    # Keyword and metadata indexing are cheap enough to stay on the request path
+    if game_session.lexical_index is not None:
+        game_session.lexical_index.add(position, event_text)
+    if game_session.metadata_index is not None:
+        game_session.metadata_index.add(position, event)
     
-    # Normalize embeddings for cosine similarity
-    faiss.normalize_L2(embeddings)
+    if game_session.memory_index is None:
+        print("FAISS index not initialized; skipping incremental update.")
+        return
     
-    # Add embeddings to index
-    faiss_index.add(embeddings)
+    if game_session.embedding_worker is None:
+        # No worker running (e.g. scripts and tests); index synchronously.
+        game_session.memory_index.add(event_text, position)
+        print(f"FAISS index updated: {game_session.memory_index.ntotal} events indexed.")
+        return
     
-    print(f"FAISS index built with {faiss_index.ntotal} events.")
+    game_session.embedding_worker.submit(event_text, position)
 
-def search_faiss_index(query_text, k=2):
+def truncate_deep_memory(game_session, length):
     """
-    Searches the FAISS index for the k most similar events to the query.
-    Returns a list of indices into the original events list.
+    Drops the session's logged events from position `length` on, from the full
+    event log and the FAISS, keyword and metadata indexes (e.g. when turns are undone).
     """
-    global faiss_index, sentence_model
+    logged = len(game_session.event_log)
+    if length >= logged:
+        return
+    # Let the worker publish what it has queued, so the FAISS index covers the whole log
+    flush_faiss_index(game_session)
+    dropped = game_session.event_log.get_many(list(range(length, logged)))
+    for position, event in zip(range(length, logged), dropped):
+        if game_session.lexical_index is not None:
+            game_session.lexical_index.remove(position, event_metadata.event_text(event))
+        if game_session.metadata_index is not None:
+            game_session.metadata_index.remove(position, event)
+    game_session.event_log.truncate(length)
+    
+    if game_session.memory_index is not None and not game_session.memory_index.truncate(length):
+        print("Too many events dropped to truncate the FAISS index; rebuilding it.")
+        build_faiss_index(game_session, game_session.event_log.records())
+
+def start_embedding_worker(game_session):
+    """Starts the background thread that indexes the session's new events in batches."""
+    if game_session.embedding_worker is None:
+        game_session.embedding_worker = memory.EmbeddingWorker(game_session.memory_index, max_batch_size=EMBEDDING_BATCH_SIZE)
+    game_session.embedding_worker.start()
+
+def flush_faiss_index(game_session, timeout=None):
+    """
+    Waits until every queued event of the session has been indexed.
+    Returns False if the timeout expired first.
+    """
+    if game_session.embedding_worker is None:
+        return True
+    return game_session.embedding_worker.flush(timeout)
+
+def deep_memory_filter(state):
+    """Builds the deep memory retrieval filter for DEEP_MEMORY_SCOPE, or None for no filtering."""
+    current_location = state['world']['current_location']
+    if DEEP_MEMORY_SCOPE == "location":
+        return event_metadata.EventFilter(location=current_location)
+    if DEEP_MEMORY_SCOPE == "npcs_present":
+        present = list(npcs_at_location(state, current_location))
+        return event_metadata.EventFilter(npcs=present) if present else None
+    return None
+
+def search_faiss_index(game_session, query_text, k=2, event_filter=None):
+    """
+    Hybrid deep-memory search: fuses FAISS semantic similarity with BM25 keyword
+    matches (which catch exact names like "Dale" or "Apartment B2").
+    An optional event_metadata.EventFilter narrows the candidate events (by location,
+    time of day, NPCs/items mentioned or turn window) before either search runs.
+    Returns a list of indices into the session's original events list.
+    """
+    memory_index = game_session.memory_index
+    lexical_index = game_session.lexical_index
+    metadata_index = game_session.metadata_index
     
-    if faiss_index is None or sentence_model is None:
-        print("FAISS index or sentence model not initialized.")
-        return []
+    candidates = max(k, RETRIEVAL_CANDIDATES)
     
-    if faiss_index.ntotal == 0:
-        print("FAISS index is empty.")
+    allowed = metadata_index.candidates(event_filter) if metadata_index is not None else None
+    if allowed is not None and not allowed:
         return []
     
-    # Encode the query
-    query_embedding = sentence_model.encode([query_text])
-    query_embedding = np.array(query_embedding).astype('float32')
-    
-    # Normalize for cosine similarity
-    faiss.normalize_L2(query_embedding)
+    vector_ranking = []
+    if memory_index is None or sentence_model is None:
+        print("FAISS index or sentence model not initialized.")
+    elif memory_index.ntotal == 0:
+        print("FAISS index is empty.")
+    else:
+        vector_ranking = memory_index.search(query_text, candidates, allowed_positions=allowed)
     
-    # Search the index
-    k = min(k, faiss_index.ntotal)  # Don't search for more than we have
-    scores, indices = faiss_index.search(query_embedding, k)
+    lexical_ranking = []
+    if lexical_index is not None:
+        lexical_ranking = [doc_id for doc_id, _ in lexical_index.search(query_text, candidates, allowed_ids=allowed)]
     
-    # Return the indices (convert from numpy to list)
-    return indices[0].tolist()
+    fused = lexical.fuse_rankings([vector_ranking, lexical_ranking], [VECTOR_WEIGHT, LEXICAL_WEIGHT])
+    return fused[:k]
+
+def warm_up_memory_system():
+    """
+    Loads the heavy dependencies and the embedding model and resolves `memory_ready`,
+    then restores the default session's FAISS, keyword and metadata indexes ahead of
+    its first turn. Other sessions load their indexes on first use.
+    Runs on a background thread when LAZY_STARTUP is enabled.
+    """
+    try:
+        with startup_profile.measure("import numpy"):
+            startup.ensure_loaded(memory.np)
+        with startup_profile.measure("import faiss"):
+            startup.ensure_loaded(memory.faiss)
+        initialize_sentence_model()
+    except Exception as e:
+        print(f"Memory system failed to start: {e}")
+        memory_ready.set_exception(e)
+        return
+    # Resolved before taking the session lock: turns wait for it while holding theirs.
+    memory_ready.set_result(True)
+    try:
+        with startup_profile.measure("restore memory indexes"):
+            with sessions.acquire(DEFAULT_SESSION_ID) as game_session:
+                load_session_memory(game_session)
+    except Exception as e:
+        print(f"Restoring the default session's memory indexes failed: {e}")
+    print("FAISS memory system ready.")
+    startup_profile.print_report()
+
+def wait_for_memory_system(timeout=MEMORY_READY_TIMEOUT):
+    """
+    Blocks until the memory system has warmed up.
+    Returns False (and the turn goes on without deep memory) if it failed or timed out.
+    """
+    try:
+        return memory_ready.result(timeout)
+    except Exception as e:
+        print(f"Memory system unavailable: {e!r}")
+        return False
+
+@atexit.register
+def close_sessions():
+    """
+    Indexes queued events, snapshots every loaded session's FAISS index (so the next
+    start skips re-indexing) and flushes its game state before the process exits.
+    """
+    sessions.close_all()
 
 
 # === Flask Web Routes ===
 
+def request_data():
+    """Returns the request's JSON body, or an empty dict if it isn't a JSON object."""
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else {}
+
+def request_session_id():
+    """
+    Returns the session named by the request (a `session_id` JSON field or query
+    parameter), DEFAULT_SESSION_ID if it names none, or None if the ID is invalid.
+    """
+    session_id = request_data().get('session_id') or request.args.get('session_id') or DEFAULT_SESSION_ID
+    return session_id if session.valid_session_id(session_id) else None
+
 @app.route('/')
 def index():
     """Serves the main HTML page for the game."""
@@ -844,34 +1420,171 @@ def play():
     """
     This is the API endpoint that the frontend calls.
     It receives player input, runs a game turn, and returns the result.
+    Turns of different sessions run in parallel; turns of one session run in order.
     """
-    player_input = request.json.get('input')
-    if not player_input:
+    player_input = request_data().get('input')
+    if not player_input or not isinstance(player_input, str):
         return jsonify({"error": "No input provided"}), 400
+    session_id = request_session_id()
+    if session_id is None:
+        return jsonify({"error": "Invalid session ID"}), 400
     
     # Run the game logic
-    result = run_game_turn(player_input)
+    with sessions.acquire(session_id) as game_session:
+        result = run_game_turn(player_input, game_session)
+    
+    return jsonify(result)
+
+def sse_event(event, data):
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/play/stream', methods=['POST'])
+def play_stream():
+    """
+    Streaming version of /play. Responds with Server-Sent Events: `story` events
+    carry the STORY text as the LLM writes it, `action` events each action as soon
+    as its line is complete (pre-checked, with the location it leads to), and a
+    final `done` event carries the same result /play returns, once the EVENT and
+    ACTIONS have been applied.
+    """
+    player_input = request_data().get('input')
+    if not player_input or not isinstance(player_input, str):
+        return jsonify({"error": "No input provided"}), 400
+    session_id = request_session_id()
+    if session_id is None:
+        return jsonify({"error": "Invalid session ID"}), 400
+
+    def generate():
+        with sessions.acquire(session_id) as game_session:
+            # A cached reply is sent in one piece, without retrieval or an LLM call
+            state = load_state(game_session)
+            cache_key, cached = cached_response(game_session, state, player_input)
+            if cached is None:
+                state, llm_prompt = prepare_turn(player_input, game_session)
+                reply_chunks = query_llm_stream(llm_prompt, llm_slot(game_session))
+            else:
+                print(f"Serving cached response for input: '{player_input}'")
+                reply_chunks = [cached]
+                cache_key = None
+            parser = response_parser.ResponseParser()
+            chunks = []
+            # Each action is validated as soon as its line is complete, against the state the earlier ones left
+            staged_actions = actions.StagedState(state, location_graph=load_location_graph(game_session, state))
+
+            def forward(parse_events):
+                for parse_event in parse_events:
+                    if isinstance(parse_event, response_parser.StoryDelta):
+                        yield sse_event("story", {"text": parse_event.text})
+                    elif isinstance(parse_event, response_parser.Action):
+                        valid = action_registry.check(parse_event.text, staged_actions)
+                        location = staged_actions.world['current_location']
+                        yield sse_event("action", {"action": parse_event.text, "valid": valid, "location": location})
+
+            for chunk in reply_chunks:
+                chunks.append(chunk)
+                yield from forward(parser.feed(chunk))
+            yield from forward(parser.close())
+            turn_result = apply_llm_response(game_session, state, "".join(chunks), parser.result(), cache_key, staged_actions)
+            yield sse_event("done", turn_result)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/health')
+def health():
+    """Liveness check; answers immediately, even while the memory system warms up."""
+    return jsonify({
+        "status": "ok",
+        "memory_ready": memory_ready.done() and memory_ready.exception() is None,
+        "startup": startup_profile.report()
+    })
+
+@app.route('/stats')
+def stats():
+    """Reports memory system counters (e.g. embedding cache hits and misses), LLM call latency and the loaded sessions."""
+    loaded = sessions.loaded()
+    return jsonify({
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "llm": llm.stats(),
+        "sessions": {
+            game_session.session_id: {
+                "memory_index_size": game_session.memory_index.ntotal if game_session.memory_index else 0,
+                "memory_usage": game_session.memory_usage(),
+                "summaries": game_session.summary_worker.stats() if game_session.summary_worker else None,
+                "response_cache": game_session.response_cache.stats() if game_session.response_cache else None,
+                "undo_turns": game_session.undo_journal.turns,
+                "location_graph": game_session.location_graph.stats() if game_session.location_graph else None,
+                "last_prompt": game_session.last_prompt_report
+            }
+            for game_session in loaded
+        },
+        "session_memory_usage": sum(game_session.memory_usage() for game_session in loaded)
+    })
+
+@app.route('/undo', methods=['POST'])
+def undo_game():
+    """
+    API endpoint to take back a session's last turns: `turns` (default 1), at most
+    UNDO_DEPTH. Responds with the number actually undone and the restored location and inventory.
+    """
+    turns = request_data().get('turns', 1)
+    if not isinstance(turns, int) or isinstance(turns, bool) or turns < 1:
+        return jsonify({"error": "turns must be a positive integer"}), 400
+    session_id = request_session_id()
+    if session_id is None:
+        return jsonify({"error": "Invalid session ID"}), 400
+    
+    with sessions.acquire(session_id) as game_session:
+        undone = undo_turns(game_session, turns)
+        state = load_state(game_session)
+        result = {
+            "undone": undone,
+            "current_location": state['world']['current_location'],
+            "inventory": state['character']['inventory']
+        }
     
     return jsonify(result)
 
 @app.route('/reset', methods=['POST'])
 def reset_game():
-    """API endpoint to reset the game state to default."""
-    # Delete old files
-    if os.path.exists(CHARACTER_FILE): os.remove(CHARACTER_FILE)
-    if os.path.exists(WORLD_FILE): os.remove(WORLD_FILE)
-    if os.path.exists(EVENTS_FILE): os.remove(EVENTS_FILE)
-    if os.path.exists(SUMMARIES_FILE): os.remove(SUMMARIES_FILE)
-    if os.path.exists(LOCATIONS_FILE): os.remove(LOCATIONS_FILE)
-    if os.path.exists(NPCS_FILE): os.remove(NPCS_FILE)
-    if os.path.exists(FULL_EVENT_LOG_FILE): os.remove(FULL_EVENT_LOG_FILE)
-    
-    # Create fresh ones
-    setup_game_files()
-    
-    # Rebuild FAISS index with fresh data
-    state = load_state()
-    build_faiss_index(state["full_event_log"])
+    """API endpoint to reset a session's game state to default."""
+    session_id = request_session_id()
+    if session_id is None:
+        return jsonify({"error": "Invalid session ID"}), 400
+    
+    with sessions.acquire(session_id) as game_session:
+        # Let the embedding worker finish queued events before the files go away
+        memory_available = wait_for_memory_system()
+        flush_faiss_index(game_session)
+        # A summary still being written belongs to the old game
+        if game_session.summary_worker is not None:
+            game_session.summary_worker.cancel()
+            game_session.summary_worker = None
+        game_session.state_store.reset()
+        game_session.undo_journal.clear()
+        game_session.location_graph = None
+        if game_session.response_cache is not None:
+            game_session.response_cache.invalidate()
+        
+        # Delete old files
+        for path in state_files(game_session.data_dir).values():
+            if os.path.exists(path): os.remove(path)
+        game_session.event_log.clear()
+        
+        # Create fresh ones
+        setup_game_files(game_session)
+        
+        # Rebuild FAISS index with fresh data. Without the embedding model the game
+        # goes on without deep memory; only the keyword and metadata indexes are rebuilt.
+        if memory_available:
+            build_faiss_index(game_session, game_session.event_log.records())
+        else:
+            game_session.memory_index = None
+            build_lexical_index(game_session, game_session.event_log.records())
     
     return jsonify({"message": "Game has been reset."})
 
@@ -879,14 +1592,17 @@ def reset_game():
 # === Main Execution Block ===
 if __name__ == "__main__":
     print("Starting RPG server...")
-    setup_game_files()
+    # Opening the default session creates its game files and loads its state.
+    with sessions.acquire(DEFAULT_SESSION_ID) as game_session:
+        load_state(game_session)
     
-    # Initialize FAISS index from existing full event log
+    # Restore the FAISS index from disk, encoding only events it doesn't cover yet.
+    # With LAZY_STARTUP the server answers requests while this runs in the background.
     print("Initializing FAISS memory system...")
-    state = load_state()
-    build_faiss_index(state["full_event_log"])
-    print("FAISS memory system ready.")
+    if LAZY_STARTUP:
+        threading.Thread(target=warm_up_memory_system, name="memory-warm-up", daemon=True).start()
+    else:
+        warm_up_memory_system()
     
     # 'host="0.0.0.0"' makes the server accessible on your local network
     app.run(host="0.0.0.0", port=5000, debug=True)
-
@@ -0,0 +1,223 @@
+import copy
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field, make_dataclass
+
+from managers import undo
+
+# A grammar placeholder: {name} matches any text, {name:a|b|c} one of the choices.
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)(?::([^{}]+))?\}")
+
+
+@dataclass(frozen=True)
+class Command:
+    # The ACTIONS line the command was parsed from.
+    text: str
+
+
+@dataclass
+class ActionSpec:
+    """
+    One action, declared by its grammar, e.g. "NPC_MOVE {npc_name} TO {location_name}".
+    The first word is the verb; other words are keywords, matched case-insensitively.
+    """
+
+    grammar: str
+    # Returns True if the command applied to the staged state, False if it doesn't apply.
+    handler: Callable[[Command, "StagedState"], bool]
+
+    verb: str = field(init=False)
+    pattern: re.Pattern = field(init=False, repr=False)
+    command_type: type = field(init=False, repr=False)
+    # The grammar as the LLM is told it, e.g. "TIME_ADVANCE morning/afternoon/evening/night".
+    usage: str = field(init=False)
+
+    def __post_init__(self):
+        words = self.grammar.split()
+        self.verb = words[0].upper()
+        parts, usage, fields, keywords = [], [], [], []
+        for word in words:
+            placeholder = PLACEHOLDER_PATTERN.fullmatch(word)
+            if placeholder is None:
+                parts.append(re.escape(word))
+                usage.append(word)
+                keywords.append(word)
+                continue
+            name, choices = placeholder.groups()
+            fields.append((name, str))
+            if choices is None:
+                parts.append(f"(?P<{name}>.+?)")
+                usage.append(name)
+            else:
+                parts.append(f"(?P<{name}>{'|'.join(re.escape(choice) for choice in choices.split('|'))})")
+                usage.append(choices.replace("|", "/"))
+        self.pattern = re.compile(" ".join(parts), re.IGNORECASE)
+        self.usage = " ".join(usage)
+        # E.g. NpcMoveTo(text, npc_name, location_name)
+        type_name = "".join(part.capitalize() for keyword in keywords for part in keyword.split("_"))
+        self.command_type = make_dataclass(type_name, fields, bases=(Command,), frozen=True)
+
+    def parse(self, line: str) -> Command | None:
+        match = self.pattern.fullmatch(line)
+        if match is None:
+            return None
+        return self.command_type(text=line, **match.groupdict())
+
+
+@dataclass
+class ActionRegistry:
+    """
+    The actions the LLM can request, each declared once with its grammar and
+    handler. Lines are parsed into typed commands by a lookup on their verb and
+    one precompiled pattern per grammar; handlers then check and apply them to
+    a StagedState, so a turn's commands are all validated before any of them
+    reaches the game state.
+    """
+
+    # Format: {verb: [ActionSpec]}, in registration order.
+    verbs: dict[str, list[ActionSpec]] = field(default_factory=dict)
+    specs: dict[type, ActionSpec] = field(default_factory=dict)
+
+    def action(self, grammar: str):
+        """
+        Decorator registering a handler for the action with this grammar.
+        """
+        def register(handler):
+            spec = ActionSpec(grammar, handler)
+            self.verbs.setdefault(spec.verb, []).append(spec)
+            self.specs[spec.command_type] = spec
+            return handler
+        return register
+
+    def usage(self) -> list[str]:
+        return [spec.usage for specs in self.verbs.values() for spec in specs]
+
+    def parse(self, line: str) -> Command | None:
+        """
+        Parses one ACTIONS line, or returns None if no grammar matches it.
+        """
+        line = " ".join(line.split())
+        if not line:
+            return None
+        for spec in self.verbs.get(line.split(" ", 1)[0].upper(), ()):
+            command = spec.parse(line)
+            if command is not None:
+                return command
+        return None
+
+    def stage(self, command: Command, staged: "StagedState") -> bool:
+        """
+        Applies a command to the staged state. Returns False if it doesn't apply.
+        """
+        try:
+            return self.specs[type(command)].handler(command, staged)
+        except Exception as e:
+            print(f"Error executing action '{command.text}': {e}")
+            return False
+
+    def check(self, line: str, staged: "StagedState") -> bool:
+        """
+        Parses an ACTIONS line and applies it to the staged state, recording it
+        in `accepted` or `rejected`. Returns whether it was accepted.
+        """
+        command = self.parse(line)
+        if command is None:
+            print(f"Warning: Unknown action command: {line}")
+        elif self.stage(command, staged):
+            staged.accepted.append(command)
+            return True
+        staged.rejected.append(line)
+        return False
+
+    def plan(self, lines: list[str], state: dict, location_graph=None) -> "StagedState":
+        """
+        Parses and validates a turn's actions in order, each against the state
+        the earlier ones left. Nothing changes until the result is committed;
+        lines that don't parse or apply are left out, in `rejected`.
+        """
+        staged = StagedState(state, location_graph=location_graph)
+        for line in lines:
+            self.check(line, staged)
+        return staged
+
+
+@dataclass
+class StagedState:
+    """
+    Copy-on-write view of the game state. Handlers read and change copies of
+    the sections (world, character) and entries (a location, an NPC) they
+    touch and mark them dirty as they would on the GameState; `commit` writes
+    the dirty ones back.
+    """
+
+    state: dict
+    # A location_graph.LocationGraph of the state's map, for handlers checking moves.
+    location_graph: object | None = None
+
+    accepted: list[Command] = field(default_factory=list)
+    rejected: list[str] = field(default_factory=list)
+
+    # Format: {section: copy}
+    sections: dict[str, dict] = field(default_factory=dict, repr=False)
+    # Format: {(section, key): copy, or None if the state has no such entry}
+    entries: dict[tuple[str, str], dict | None] = field(default_factory=dict, repr=False)
+    # Format: {section: set of changed keys, or None for the whole section}
+    changes: dict[str, set[str] | None] = field(default_factory=dict)
+
+    def section(self, name: str) -> dict:
+        if name not in self.sections:
+            self.sections[name] = copy.deepcopy(self.state[name])
+        return self.sections[name]
+
+    @property
+    def world(self) -> dict:
+        return self.section("world")
+
+    @property
+    def character(self) -> dict:
+        return self.section("character")
+
+    def entry(self, section: str, key: str) -> dict | None:
+        if (section, key) not in self.entries:
+            table = self.state[section]
+            self.entries[section, key] = copy.deepcopy(table[key]) if key in table else None
+        return self.entries[section, key]
+
+    def location(self, name: str) -> dict | None:
+        return self.entry("locations", name)
+
+    def npc(self, name: str) -> dict | None:
+        return self.entry("npcs", name)
+
+    def mark_dirty(self, section: str, *keys: str):
+        if not keys:
+            self.changes[section] = None
+        elif self.changes.get(section, set()) is not None:
+            self.changes.setdefault(section, set()).update(keys)
+
+    def commit(self, inverse: list[tuple] | None = None) -> list[tuple]:
+        """
+        Writes the changed sections and entries to the game state, marking them
+        dirty there. Returns the inverse operations (see managers/undo.py),
+        appended to `inverse` if given. Each is appended before its write, so
+        if a write fails the ones already made can still be reverted.
+        """
+        if inverse is None:
+            inverse = []
+        for section, keys in self.changes.items():
+            if keys is None:
+                target = self.state[section]
+                for key, value in self.sections[section].items():
+                    if target.get(key, undo.MISSING) != value:
+                        inverse.append(undo.field_op(self.state, section, key))
+                        self.state.mark_dirty(section)
+                        target[key] = value
+                continue
+            for key in keys:
+                table = self.state[section]
+                # The replaced entry object is kept as it was, so it serves as the old value
+                inverse.append(("entry", section, key, table[key] if key in table else undo.MISSING))
+                self.state.mark_dirty(section, key)
+                table[key] = self.entries[section, key]
+        self.changes = {}
+        return inverse
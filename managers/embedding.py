@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import StrEnum
+
+from managers import startup
+
+np = startup.lazy_import("numpy")
+
+
+@dataclass
+class EmbeddingCache:
+    """
+    Content-addressed cache of text embeddings.
+    Vectors are keyed on a hash of the text and kept in a bounded in-memory LRU
+    tier, optionally backed by an unbounded on-disk tier. Shared by every
+    session's embedding worker and request threads, so the in-memory tier and
+    counters are locked; disk files are written to a temporary path and moved into place.
+    """
+
+    max_entries: int = 4096
+
+    # Directory for the on-disk tier; None keeps the cache purely in memory.
+    disk_dir: str | None = None
+
+    # Mixed into every key so vectors from different models never collide.
+    namespace: str = ""
+
+    # Format: {text_hash: float32 vector}, least recently used first.
+    entries: OrderedDict[str, np.ndarray] = field(default_factory=OrderedDict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\x1f{text}".encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        # Shard by the first two hex digits to keep directories small.
+        return os.path.join(self.disk_dir, key[:2], f"{key}.npy")
+
+    def get(self, key: str) -> np.ndarray | None:
+        """
+        Looks a vector up in memory, then on disk. Counts the lookup as a hit or miss.
+        """
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        if self.disk_dir is not None:
+            try:
+                vector = np.load(self._disk_path(key))
+            except (OSError, ValueError):
+                vector = None
+            if vector is not None:
+                with self.lock:
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                return vector
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, vector: np.ndarray):
+        vector = np.asarray(vector, dtype="float32")
+        with self.lock:
+            self._remember(key, vector)
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # A reader never sees a half-written file, and concurrent writers of one key don't interleave
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                np.save(f, vector)
+            os.replace(temp_path, path)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        # The caller holds the lock
+        self.entries[key] = vector
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+@dataclass
+class CachedEncoder:
+    """
+    Drop-in wrapper around a SentenceTransformer-style model that serves
+    repeated texts from an EmbeddingCache and encodes only the misses, in one batch.
+    """
+
+    model: object
+    cache: EmbeddingCache
+
+    def encode(self, texts: list[str], **kwargs) -> np.ndarray:
+        keys = [self.cache.key(text) for text in texts]
+        vectors: dict[str, np.ndarray] = {}
+        missing: dict[str, str] = {}  # key -> text, deduplicated
+
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            vector = self.cache.get(key)
+            if vector is None:
+                missing[key] = text
+            else:
+                vectors[key] = vector
+
+        if missing:
+            encoded = np.asarray(
+                self.model.encode(list(missing.values()), **kwargs), dtype="float32"
+            )
+            for key, vector in zip(missing, encoded):
+                self.cache.put(key, vector)
+                vectors[key] = vector
+
+        if not keys:
+            return np.empty((0, 0), dtype="float32")
+        return np.stack([vectors[key] for key in keys])
+
+    def __getattr__(self, name):
+        # Anything else (e.g. get_sentence_embedding_dimension) goes to the model.
+        if name in ("model", "cache"):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+class EmbeddingBackend(StrEnum):
+    SENTENCE_TRANSFORMERS = "sentence_transformers"
+    ONNX = "onnx"
+
+
+# The heavy module each backend imports (sentence_transformers pulls in torch),
+# so startup can time the import apart from loading the model.
+BACKEND_MODULES = {
+    EmbeddingBackend.SENTENCE_TRANSFORMERS: "sentence_transformers",
+    EmbeddingBackend.ONNX: "onnxruntime",
+}
+
+
+@dataclass
+class OnnxEncoder:
+    """
+    Sentence encoder running an ONNX export of a MiniLM-style model on ONNX
+    Runtime (fp32 or int8-quantized), for CPU-only hosts. Mirrors the
+    SentenceTransformer pipeline: tokenize, run the transformer, mean-pool over
+    the attention mask, L2-normalize.
+    """
+
+    # Exported model (see scripts/export_onnx_embedding.py) and its
+    # Hugging Face `tokenizer.json`.
+    model_path: str
+    tokenizer_path: str
+
+    # ONNX Runtime intra-op threads; 0 lets it pick one per physical core.
+    intra_op_threads: int = 0
+    max_length: int = 256
+
+    def __post_init__(self):
+        import onnxruntime  # pip install onnxruntime
+        from tokenizers import Tokenizer  # pip install tokenizers
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            self.model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(self.tokenizer_path)
+        self.tokenizer.enable_truncation(self.max_length)
+        self.tokenizer.enable_padding()
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, texts: list[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        batches = [
+            self._encode_batch(texts[start : start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ]
+        if not batches:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype="float32")
+        return np.concatenate(batches)
+
+    def _encode_batch(self, texts: list[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype="int64")
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype="int64")
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype="int64")
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        if token_embeddings.ndim == 2:
+            # The export already pools to one vector per sentence.
+            pooled = token_embeddings
+        else:
+            mask = attention_mask[:, :, np.newaxis].astype("float32")
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype("float32")
+
+
+def load_encoder(
+    backend: EmbeddingBackend,
+    model_name: str,
+    onnx_model_path: str | None = None,
+    onnx_tokenizer_path: str | None = None,
+    threads: int = 0,
+):
+    """
+    Creates the embedding model for the configured backend. Every backend
+    exposes the same `encode(list[str])` interface.
+    """
+    if backend == EmbeddingBackend.ONNX:
+        return OnnxEncoder(onnx_model_path, onnx_tokenizer_path, intra_op_threads=threads)
+
+    from sentence_transformers import SentenceTransformer  # pip install sentence-transformers
+
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model_name)
@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+from array import array
+from dataclasses import dataclass, field
+
+# Byte offsets are stored as little-endian unsigned 64-bit integers.
+OFFSET_TYPECODE = "Q"
+
+
+@dataclass
+class EventLog:
+    """
+    The deep event log as an append-only JSON Lines file.
+    Each turn appends one record instead of rewriting the history, and an
+    offset index (a flat binary file of line offsets) gives O(1) random access
+    by event ID, which is simply the record's position in the log.
+    """
+
+    path: str
+
+    # fsync after every append so a logged event survives a power loss.
+    fsync: bool = True
+
+    # Format: offsets[event_id] = byte offset of that record's line
+    offsets: array | None = None
+
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    @property
+    def index_path(self) -> str:
+        return f"{self.path}.idx"
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._load_offsets())
+
+    def _load_offsets(self) -> array:
+        """
+        Loads the offset index, repairing a torn final line and rebuilding the
+        index by scanning the log if it doesn't match the file.
+        """
+        if self.offsets is not None:
+            return self.offsets
+
+        if not os.path.exists(self.path):
+            open(self.path, "ab").close()
+        self._drop_torn_tail()
+        size = os.path.getsize(self.path)
+
+        offsets = array(OFFSET_TYPECODE)
+        try:
+            with open(self.index_path, "rb") as f:
+                offsets.frombytes(f.read())
+        except (OSError, ValueError):
+            offsets = None
+
+        if offsets is None or not self._index_matches(offsets, size):
+            offsets = self._scan_offsets()
+            with open(self.index_path, "wb") as f:
+                offsets.tofile(f)
+
+        self.offsets = offsets
+        return offsets
+
+    def _drop_torn_tail(self):
+        # A crash mid-append can leave a final line without its newline.
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            f.seek(0)
+            end = f.read().rfind(b"\n") + 1
+            f.truncate(end)
+
+    def _index_matches(self, offsets: array, size: int) -> bool:
+        if not offsets:
+            return size == 0
+        # The last indexed line must end exactly at the end of the file.
+        with open(self.path, "rb") as f:
+            f.seek(offsets[-1])
+            f.readline()
+            return f.tell() == size
+
+    def _scan_offsets(self) -> array:
+        offsets = array(OFFSET_TYPECODE)
+        with open(self.path, "rb") as f:
+            position = 0
+            for line in f:
+                if line.strip():
+                    offsets.append(position)
+                position += len(line)
+        return offsets
+
+    def append(self, record: dict | str) -> int:
+        """
+        Appends one record and returns its event ID.
+        """
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with self.lock:
+            offsets = self._load_offsets()
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            with open(self.index_path, "ab") as f:
+                f.write(array(OFFSET_TYPECODE, [offset]).tobytes())
+            offsets.append(offset)
+            return len(offsets) - 1
+
+    def get(self, event_id: int) -> dict | str:
+        return self.get_many([event_id])[0]
+
+    def get_many(self, event_ids: list[int]) -> list[dict | str]:
+        """
+        Reads the given records by event ID, in the order requested.
+        """
+        with self.lock:
+            offsets = self._load_offsets()
+            records = []
+            with open(self.path, "rb") as f:
+                for event_id in event_ids:
+                    f.seek(offsets[event_id])
+                    records.append(json.loads(f.readline()))
+            return records
+
+    def records(self) -> list[dict | str]:
+        """
+        Reads the whole log, e.g. to rebuild the memory indexes at startup.
+        """
+        with self.lock:
+            self._load_offsets()
+            with open(self.path, "rb") as f:
+                return [json.loads(line) for line in f if line.strip()]
+
+    def truncate(self, length: int):
+        """
+        Drops the records from event ID `length` on, e.g. when turns are undone.
+        """
+        with self.lock:
+            offsets = self._load_offsets()
+            if length >= len(offsets):
+                return
+            with open(self.path, "rb+") as f:
+                f.truncate(offsets[length])
+                if self.fsync:
+                    os.fsync(f.fileno())
+            with open(self.index_path, "rb+") as f:
+                f.truncate(length * offsets.itemsize)
+            del offsets[length:]
+
+    def clear(self):
+        with self.lock:
+            for path in (self.path, self.index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.offsets = None
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        One-time migration from the old format, a single JSON array rewritten
+        every turn. The old file is kept with a `.migrated` suffix.
+        Returns the number of migrated events.
+        """
+        with open(json_path, "r") as f:
+            events = json.load(f)
+
+        with self.lock:
+            self.clear()
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                for event in events:
+                    f.write(json.dumps(event, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            os.replace(json_path, f"{json_path}.migrated")
+        print(f"Migrated {len(events)} events from {json_path} to {self.path}")
+        return len(events)
@@ -0,0 +1,181 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+# Attributes with one value per event vs. a list of values per event.
+SCALAR_ATTRIBUTES = ("location", "time_of_day")
+LIST_ATTRIBUTES = ("npcs", "items")
+
+
+def event_text(event: dict | str) -> str:
+    """
+    Returns the narrative text of a full event log entry.
+    Older saves store bare strings; newer ones store metadata records.
+    """
+    return event if isinstance(event, str) else event["text"]
+
+
+def mentions(text: str, names) -> list[str]:
+    """
+    Returns the names that appear in the text as whole words, case-insensitively.
+    """
+    lowered = text.lower()
+    return [
+        name
+        for name in names
+        if re.search(rf"(?<!\w){re.escape(name.lower())}(?!\w)", lowered)
+    ]
+
+
+def make_event_record(text: str, turn: int, state: dict) -> dict:
+    """
+    Builds a full event log record: the event text plus where and when it
+    happened, and which known NPCs and nearby items it mentions.
+    """
+    world = state["world"]
+    location = world["current_location"]
+    nearby_items = list(state["character"].get("inventory", []))
+    nearby_items += state["locations"].get(location, {}).get("items", [])
+    return {
+        "text": text,
+        "turn": turn,
+        "location": location,
+        "time_of_day": world.get("time_of_day"),
+        "npcs": mentions(text, state["npcs"]),
+        "items": mentions(text, dict.fromkeys(nearby_items)),
+    }
+
+
+@dataclass
+class EventFilter:
+    """
+    Restricts deep memory retrieval to matching events. Unset fields don't filter;
+    `npcs` and `items` match events mentioning any of the given names.
+    """
+
+    location: str | None = None
+    time_of_day: str | None = None
+    npcs: list[str] = field(default_factory=list)
+    items: list[str] = field(default_factory=list)
+    min_turn: int | None = None
+    max_turn: int | None = None
+
+    @property
+    def is_empty(self) -> bool:
+        return (
+            self.location is None
+            and self.time_of_day is None
+            and not self.npcs
+            and not self.items
+            and self.min_turn is None
+            and self.max_turn is None
+        )
+
+
+@dataclass
+class EventMetadataIndex:
+    """
+    Per-attribute posting lists over the full event log, used to narrow the
+    candidate set before vector and keyword search.
+    """
+
+    # Format: {attribute: {value: {event_position, ...}}}
+    # e.g. {"location": {"Hallway": {3, 8}}, "npcs": {"Dale": {3}}}
+    postings: dict[str, dict[str, set[int]]] = field(
+        default_factory=lambda: defaultdict(lambda: defaultdict(set))
+    )
+
+    # Event positions and their turn numbers, both ascending (the log is
+    # append-only), so a turn window is two binary searches.
+    positions: list[int] = field(default_factory=list)
+    turns: list[int] = field(default_factory=list)
+
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, position: int, event: dict | str):
+        # Legacy string events only carry their position as a turn number.
+        record = {"turn": position} if isinstance(event, str) else event
+        with self.lock:
+            for attribute in SCALAR_ATTRIBUTES:
+                if record.get(attribute) is not None:
+                    self.postings[attribute][record[attribute]].add(position)
+            for attribute in LIST_ATTRIBUTES:
+                for value in record.get(attribute, []):
+                    self.postings[attribute][value].add(position)
+            self.positions.append(position)
+            self.turns.append(record.get("turn", position))
+
+    def remove(self, position: int, event: dict | str):
+        """
+        Unindexes an event, e.g. when turns are undone.
+        """
+        record = {"turn": position} if isinstance(event, str) else event
+        with self.lock:
+            values = [(attribute, record.get(attribute)) for attribute in SCALAR_ATTRIBUTES]
+            values += [(attribute, value) for attribute in LIST_ATTRIBUTES for value in record.get(attribute, [])]
+            for attribute, value in values:
+                attribute_postings = self.postings[attribute]
+                if value in attribute_postings:
+                    attribute_postings[value].discard(position)
+                    if not attribute_postings[value]:
+                        del attribute_postings[value]
+            i = bisect.bisect_left(self.positions, position)
+            if i < len(self.positions) and self.positions[i] == position:
+                del self.positions[i]
+                del self.turns[i]
+
+    def rebuild(self, events: list[dict | str]):
+        with self.lock:
+            self.postings = defaultdict(lambda: defaultdict(set))
+            self.positions = []
+            self.turns = []
+        for position, event in enumerate(events):
+            self.add(position, event)
+
+    def candidates(self, event_filter: EventFilter | None) -> set[int] | None:
+        """
+        Returns the positions of matching events, or None when nothing is filtered.
+        Intersects the smallest posting lists first.
+        """
+        if event_filter is None or event_filter.is_empty:
+            return None
+
+        with self.lock:
+            sets = []
+            for attribute in SCALAR_ATTRIBUTES:
+                value = getattr(event_filter, attribute)
+                if value is not None:
+                    sets.append(self.postings[attribute].get(value, set()))
+            for attribute in LIST_ATTRIBUTES:
+                values = getattr(event_filter, attribute)
+                if values:
+                    sets.append(
+                        set().union(*(self.postings[attribute].get(v, set()) for v in values))
+                    )
+
+            position_range = None
+            if event_filter.min_turn is not None or event_filter.max_turn is not None:
+                start = 0
+                end = len(self.turns)
+                if event_filter.min_turn is not None:
+                    start = bisect.bisect_left(self.turns, event_filter.min_turn)
+                if event_filter.max_turn is not None:
+                    end = bisect.bisect_right(self.turns, event_filter.max_turn)
+                if start >= end:
+                    return set()
+                if not sets:
+                    return set(self.positions[start:end])
+                position_range = (self.positions[start], self.positions[end - 1])
+
+            sets.sort(key=len)
+            result = set(sets[0])
+            for other in sets[1:]:
+                result &= other
+                if not result:
+                    break
+            if position_range is not None:
+                low, high = position_range
+                result = {position for position in result if low <= position <= high}
+            return result
@@ -0,0 +1,273 @@
+import json
+import os
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from enum import StrEnum
+
+
+def atomic_write_text(path: str, text: str, fsync: bool = True):
+    """
+    Writes a file through a temporary file in the same directory and an atomic
+    rename, so a crash leaves either the old or the new contents, never a mix.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def atomic_write_json(path: str, data, fsync: bool = True):
+    atomic_write_text(path, json.dumps(data, indent=4), fsync=fsync)
+
+
+class StateBackend(StrEnum):
+    JSON = "json"
+    SQLITE = "sqlite"
+
+
+class GameState(dict):
+    """
+    The game state sections (character, world, events, ...) plus what changed
+    since the last commit. Replacing a section marks all of it changed; code that
+    mutates a section in place calls `mark_dirty`, naming the entries it touched
+    in keyed sections (locations, npcs) so only those are journaled.
+    """
+
+    def __init__(self, sections: dict):
+        super().__init__(sections)
+        # Format: {section: set of changed keys, or None for the whole section}
+        self.changes: dict[str, set[str] | None] = {}
+
+    def __setitem__(self, section: str, value):
+        super().__setitem__(section, value)
+        self.changes[section] = None
+
+    def mark_dirty(self, section: str, *keys: str):
+        if not keys:
+            self.changes[section] = None
+        elif self.changes.get(section, set()) is not None:
+            self.changes.setdefault(section, set()).update(keys)
+
+    @property
+    def dirty(self) -> set[str]:
+        return set(self.changes)
+
+    def take_changes(self) -> dict[str, set[str] | None]:
+        changes, self.changes = self.changes, {}
+        return changes
+
+
+@dataclass
+class StateStore:
+    """
+    Keeps the game state resident in memory as the source of truth and persists
+    it write-behind: one JSON file per section, each replaced atomically.
+
+    Every commit appends the changed entries to a small journal (JSON Lines) and
+    marks their sections for the next flush. Flushes run on a background thread
+    every `flush_interval` seconds or after `flush_every` commits, and on
+    shutdown. After a crash, `load` replays the journal over the files; entries
+    hold new values, not operations, so replaying an already-flushed turn is harmless.
+    """
+
+    # Format: {section: file_path}
+    files: dict[str, str]
+
+    journal_path: str
+
+    fsync: bool = True
+
+    # Flush at least this often (seconds) while commits are pending.
+    flush_interval: float = 5.0
+
+    # Flush early once this many commits are pending.
+    flush_every: int = 20
+
+    # The resident state, loaded on first use.
+    state: GameState | None = None
+
+    # Sections committed but not yet written to their files.
+    pending: set[str] = field(default_factory=set)
+    pending_commits: int = 0
+
+    # Held by callers while they mutate the resident state, and while a flush
+    # serializes it.
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+    flush_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    wake: threading.Event = field(default_factory=threading.Event, repr=False)
+    thread: threading.Thread | None = None
+    stopping: bool = False
+
+    @property
+    def flushing_journal_path(self) -> str:
+        return f"{self.journal_path}.flushing"
+
+    def load(self) -> GameState:
+        """
+        Returns the resident state, reading the files and replaying any
+        un-flushed journal entries the first time.
+        """
+        with self.lock:
+            if self.state is None:
+                sections = {}
+                for section, path in self.files.items():
+                    with open(path, "r") as f:
+                        sections[section] = json.load(f)
+                state = GameState(sections)
+                replayed = 0
+                for path in (self.flushing_journal_path, self.journal_path):
+                    replayed += self._replay(path, state)
+                if replayed:
+                    print(f"Recovered {replayed} un-flushed turns from the state journal.")
+                    self.pending.update(state.take_changes())
+                    self.pending_commits = replayed
+                self.state = state
+            return self.state
+
+    def _replay(self, path: str, state: GameState) -> int:
+        if not os.path.exists(path):
+            return 0
+        replayed = 0
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Torn final line from a crash mid-append
+                for section, change in entry.items():
+                    if "value" in change:
+                        state[section] = change["value"]
+                        continue
+                    for key, value in change["set"].items():
+                        state[section][key] = value
+                    for key in change["delete"]:
+                        state[section].pop(key, None)
+                    state.mark_dirty(section)
+                replayed += 1
+        return replayed
+
+    def save(self, state: GameState):
+        """
+        Commits the state's changes: journals the changed entries and leaves
+        writing the section files to the background flush.
+        Only the touched entries are serialized, so the cost of a commit doesn't
+        grow with the size of the world.
+        """
+        with self.lock:
+            entry = {}
+            for section, keys in state.take_changes().items():
+                if section not in self.files:
+                    continue
+                if keys is None:
+                    entry[section] = {"value": state[section]}
+                else:
+                    data = state[section]
+                    entry[section] = {
+                        "set": {key: data[key] for key in keys if key in data},
+                        "delete": [key for key in keys if key not in data],
+                    }
+            if not entry:
+                return
+
+            with open(self.journal_path, "a") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self.pending.update(entry)
+            self.pending_commits += 1
+            flush_now = self.pending_commits >= self.flush_every
+
+        if flush_now:
+            if self.thread is not None:
+                self.wake.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        """
+        Writes every section with committed changes and retires the journal
+        entries they cover.
+        """
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending or self.state is None:
+                    return
+                snapshots = {section: json.dumps(self.state[section], indent=4) for section in self.pending}
+                self.pending = set()
+                self.pending_commits = 0
+                self._rotate_journal()
+
+            try:
+                for section, text in snapshots.items():
+                    atomic_write_text(self.files[section], text, fsync=self.fsync)
+            except Exception:
+                with self.lock:
+                    self.pending.update(snapshots)
+                raise
+            if os.path.exists(self.flushing_journal_path):
+                os.remove(self.flushing_journal_path)
+
+    def _rotate_journal(self):
+        # Later commits go to a fresh journal while a flush runs. Entries left
+        # by a failed flush are kept until a flush succeeds.
+        if not os.path.exists(self.journal_path):
+            return
+        if not os.path.exists(self.flushing_journal_path):
+            os.replace(self.journal_path, self.flushing_journal_path)
+            return
+        with open(self.journal_path, "r") as src, open(self.flushing_journal_path, "a") as dst:
+            dst.write(src.read())
+            dst.flush()
+            if self.fsync:
+                os.fsync(dst.fileno())
+        os.remove(self.journal_path)
+
+    def start(self):
+        """Starts the background write-behind thread."""
+        if self.thread is None or not self.thread.is_alive():
+            self.stopping = False
+            self.thread = threading.Thread(target=self._run, name="state-persister", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stops the background thread and flushes everything still pending."""
+        if self.thread is not None:
+            self.stopping = True
+            self.wake.set()
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def _run(self):
+        while not self.stopping:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            # Any error is logged and retried at the next flush; the thread must not die with it
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing game state: {e}")
+
+    def reset(self):
+        """
+        Forgets the resident state and any un-flushed changes, e.g. before the
+        game files are recreated.
+        """
+        with self.flush_lock, self.lock:
+            self.state = None
+            self.pending = set()
+            self.pending_commits = 0
+            for path in (self.journal_path, self.flushing_journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,133 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Words that carry no recall value but would otherwise have the longest postings.
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have he her his i in into is it its "
+    "of on or she that the their them then there they this to was were with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercases text and splits it into alphanumeric terms, dropping stopwords.
+    e.g. "Orton entered Apartment B2" -> ["orton", "entered", "apartment", "b2"]
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+@dataclass
+class BM25Index:
+    """
+    Incrementally built inverted index with Okapi BM25 scoring.
+    Catches the exact names (NPCs, places, items) that semantic search tends to miss.
+    """
+
+    k1: float = 1.2
+    b: float = 0.75
+
+    # Query terms in more than this share of the documents are skipped, as long
+    # as the query has rarer terms. Past about half the log a term's IDF
+    # approaches zero, so it barely changes the ranking but its postings would
+    # dominate query time. Frequent names (an NPC in 3% of events) are kept.
+    max_document_share: float = 0.5
+
+    # Format: {term: {doc_id: term_frequency}}
+    postings: dict[str, dict[int, int]] = field(default_factory=lambda: defaultdict(dict))
+
+    # Format: {doc_id: number_of_terms}
+    doc_lengths: dict[int, int] = field(default_factory=dict)
+    total_length: int = 0
+
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: int, text: str):
+        """
+        Indexes one document. Cost is proportional to the document, not the index.
+        """
+        terms = Counter(tokenize(text))
+        with self.lock:
+            for term, frequency in terms.items():
+                self.postings[term][doc_id] = frequency
+            self.doc_lengths[doc_id] = sum(terms.values())
+            self.total_length += self.doc_lengths[doc_id]
+
+    def remove(self, doc_id: int, text: str):
+        """
+        Unindexes a document added with this text, e.g. when turns are undone.
+        """
+        terms = set(tokenize(text))
+        with self.lock:
+            if doc_id not in self.doc_lengths:
+                return
+            for term in terms:
+                term_postings = self.postings.get(term)
+                if term_postings is None:
+                    continue
+                term_postings.pop(doc_id, None)
+                if not term_postings:
+                    del self.postings[term]
+            self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def rebuild(self, texts: list[str]):
+        with self.lock:
+            self.postings = defaultdict(dict)
+            self.doc_lengths = {}
+            self.total_length = 0
+        for doc_id, text in enumerate(texts):
+            self.add(doc_id, text)
+
+    def search(
+        self, query_text: str, k: int = 10, allowed_ids: set[int] | None = None
+    ) -> list[tuple[int, float]]:
+        """
+        Returns up to k (doc_id, score) pairs, best first.
+        If `allowed_ids` is given, only those documents are scored.
+        """
+        with self.lock:
+            doc_count = len(self.doc_lengths)
+            if doc_count == 0:
+                return []
+            average_length = self.total_length / doc_count
+
+            query_postings = [self.postings[term] for term in set(tokenize(query_text)) if term in self.postings]
+            max_postings = self.max_document_share * doc_count
+            rare_postings = [term_postings for term_postings in query_postings if len(term_postings) <= max_postings]
+            if rare_postings:
+                query_postings = rare_postings
+
+            scores: dict[int, float] = defaultdict(float)
+            for term_postings in query_postings:
+                df = len(term_postings)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for doc_id, tf in term_postings.items():
+                    if allowed_ids is not None and doc_id not in allowed_ids:
+                        continue
+                    length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / average_length
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def fuse_rankings(
+    rankings: list[list[int]], weights: list[float] | None = None, k: int = 60
+) -> list[int]:
+    """
+    Weighted reciprocal-rank fusion: each ranking contributes weight / (k + rank)
+    to every document it lists. Returns doc IDs ordered by fused score.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: dict[int, float] = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,247 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth retrying: rate limiting and server-side failures.
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling the LLM server while the circuit breaker is open."""
+
+
+@dataclass
+class CircuitBreaker:
+    """
+    Stops calling a failing server for `reset_timeout` seconds after
+    `failure_threshold` consecutive failed calls. After that a single trial
+    call is let through (half-open); it closes the circuit again on success.
+    """
+
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+
+    failures: int = 0
+    opened_at: float | None = None
+    trial_in_flight: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+@dataclass
+class LLMClient:
+    """
+    Client for the OpenAI-compatible chat completions endpoint of the local LLM
+    server. Keeps connections alive in a pooled `requests.Session`, bounds every
+    call with connect/read timeouts, retries transient failures with jittered
+    exponential backoff and stops calling a dead server through a circuit breaker.
+    """
+
+    url: str
+
+    connect_timeout: float = 3.05
+    # Generation can legitimately take a while; this only caps a hung request.
+    read_timeout: float = 120.0
+
+    # Retries after the first attempt, for connection errors, timeouts and RETRY_STATUS_CODES.
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+
+    pool_size: int = 8
+
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+
+    # Recent calls, newest last. Format: (label, seconds, ok)
+    latencies: deque = field(default_factory=lambda: deque(maxlen=256))
+    # Time to the first streamed token of recent streaming calls, in seconds.
+    first_token_latencies: deque = field(default_factory=lambda: deque(maxlen=256))
+    # Prompt processing reported by servers that return llama.cpp-style `timings`.
+    # Format: (prefill milliseconds, prompt tokens prefilled, prompt tokens reused from the cache)
+    prefill_timings: deque = field(default_factory=lambda: deque(maxlen=256))
+    calls: int = 0
+    failures: int = 0
+
+    session: requests.Session | None = field(default=None, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        if self.session is None:
+            self.session = requests.Session()
+            # Retries are handled here, with backoff and the circuit breaker.
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+    def _send(self, payload: dict, stream: bool = False) -> requests.Response:
+        """
+        Posts the payload, retrying transient failures, and returns the successful
+        response. With `stream` only connecting and the response headers are retried;
+        the body is read by the caller.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(
+                    self.url, json=payload, stream=stream, timeout=(self.connect_timeout, self.read_timeout)
+                )
+                if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                    response.close()
+                    print(f"LLM server returned {response.status_code}; retrying ({attempt + 1}/{self.max_retries})")
+                else:
+                    response.raise_for_status()
+                    return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"LLM request failed ({e.__class__.__name__}); retrying ({attempt + 1}/{self.max_retries})")
+            # Full jitter: spreads retries out instead of hammering a struggling server in lockstep.
+            time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt)))
+
+    def _check_circuit(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"LLM server circuit is open after {self.breaker.failures} consecutive failures")
+
+    def _record(self, label: str, elapsed: float, ok: bool, first_token: float | None = None):
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        with self.lock:
+            self.calls += 1
+            self.failures += not ok
+            self.latencies.append((label, elapsed, ok))
+            if first_token is not None:
+                self.first_token_latencies.append(first_token)
+        first_token_note = f", first token after {first_token:.2f}s" if first_token is not None else ""
+        print(f"LLM call '{label}' took {elapsed:.2f}s{first_token_note} ({'ok' if ok else 'failed'})")
+
+    def _record_timings(self, body: dict):
+        timings = body.get("timings")
+        if not timings or "prompt_ms" not in timings:
+            return
+        with self.lock:
+            self.prefill_timings.append((timings["prompt_ms"], timings.get("prompt_n", 0), timings.get("cache_n", 0)))
+
+    def post(self, payload: dict, label: str = "chat") -> requests.Response:
+        """
+        Posts a chat completions payload and returns the successful response.
+        Raises a requests.exceptions.RequestException (CircuitOpenError while the
+        breaker is open) once the retries are used up.
+        """
+        self._check_circuit()
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = self._send(payload)
+            ok = True
+            return response
+        finally:
+            self._record(label, time.perf_counter() - start, ok)
+
+    def stream(self, payload: dict, label: str = "chat"):
+        """
+        Requests a streamed completion (`"stream": true`) and yields the content
+        deltas as the server sends them (Server-Sent Events).
+        The read timeout bounds the wait for each chunk, so a stalled stream fails.
+        """
+        self._check_circuit()
+        start = time.perf_counter()
+        first_token = None
+        ok = False
+        try:
+            with self._send(dict(payload, stream=True), stream=True) as response:
+                for line in response.iter_lines():
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        # Read on to the end of the body so the connection returns to the pool.
+                        continue
+                    chunk = json.loads(data)
+                    self._record_timings(chunk)
+                    choices = chunk["choices"]
+                    delta = choices[0].get("delta", {}).get("content") if choices else None
+                    if delta:
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        yield delta
+            ok = True
+        except GeneratorExit:
+            # The consumer stopped reading (e.g. the player closed the page); not a server failure.
+            ok = True
+            raise
+        finally:
+            self._record(label, time.perf_counter() - start, ok, first_token)
+
+    def chat(self, payload: dict, label: str = "chat") -> str:
+        """
+        Returns the message content of the first choice.
+        Raises KeyError or IndexError for an unexpected response format.
+        """
+        body = self.post(payload, label).json()
+        self._record_timings(body)
+        return body["choices"][0]["message"]["content"]
+
+    def stats(self) -> dict:
+        with self.lock:
+            latencies = sorted(seconds for _, seconds, ok in self.latencies if ok)
+            first_token_latencies = sorted(self.first_token_latencies)
+            prefill_ms = sorted(ms for ms, _, _ in self.prefill_timings)
+            prefilled = sum(n for _, n, _ in self.prefill_timings)
+            reused = sum(cached for _, _, cached in self.prefill_timings)
+            last = self.latencies[-1] if self.latencies else None
+            calls, failures = self.calls, self.failures
+
+        def percentile(values: list[float], p: float) -> float | None:
+            if not values:
+                return None
+            return round(values[min(len(values) - 1, int(p * len(values)))], 4)
+
+        return {
+            "calls": calls,
+            "failures": failures,
+            "circuit": self.breaker.state,
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p95": percentile(latencies, 0.95),
+            "first_token_p50": percentile(first_token_latencies, 0.5),
+            "prefill_ms_p50": percentile(prefill_ms, 0.5),
+            # Share of prompt tokens the server took from its KV cache instead of prefilling.
+            "prompt_cache_reuse": round(reused / (reused + prefilled), 4) if reused + prefilled else None,
+            "last_call": {"label": last[0], "seconds": round(last[1], 4), "ok": last[2]} if last else None,
+        }
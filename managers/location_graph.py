@@ -0,0 +1,223 @@
+import heapq
+import itertools
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass, field
+
+
+@dataclass
+class LocationGraph:
+    """
+    The map as adjacency sets, built once from the locations' connections, so
+    checking a move is one set lookup instead of a scan of a connections list.
+    Neighbourhoods (the locations within k moves) are cached, the least
+    recently used dropped beyond `max_cached`; changing a location's
+    connections drops only the cached neighbourhoods it was expanded in.
+    Connections are one-way, as in locations.json; those leading to unknown
+    locations are kept but not followed.
+    """
+
+    # Format: {location: {connected location: None}}, a set keeping the connections' order
+    adjacency: dict[str, dict[str, None]] = field(default_factory=dict)
+
+    max_cached: int = 1024
+
+    # Format: {(location, hops): {location: moves from it}}, least recently used first
+    neighborhoods: OrderedDict[tuple[str, int], dict[str, int]] = field(default_factory=OrderedDict, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    hits: int = 0
+    misses: int = 0
+
+    @classmethod
+    def from_connections(cls, connections: Mapping[str, Iterable[str]], **kwargs) -> "LocationGraph":
+        """
+        From {location: connected locations}.
+        """
+        return cls({name: dict.fromkeys(targets) for name, targets in connections.items()}, **kwargs)
+
+    @classmethod
+    def from_state(cls, locations: Mapping[str, dict], **kwargs) -> "LocationGraph":
+        """
+        From the game state's locations section, or the contents of locations.json.
+        """
+        return cls.from_connections({name: location.get("connections", []) for name, location in locations.items()}, **kwargs)
+
+    @classmethod
+    def from_locations(cls, locations: Iterable, **kwargs) -> "LocationGraph":
+        """
+        From modules/location.py Location objects, whose connections map a direction to a location ID.
+        """
+        return cls.from_connections({location.id: location.connections.values() for location in locations}, **kwargs)
+
+    def __contains__(self, name) -> bool:
+        return name in self.adjacency
+
+    def __len__(self) -> int:
+        return len(self.adjacency)
+
+    def neighbors(self, name: str) -> list[str]:
+        return [target for target in self.adjacency.get(name, ()) if target in self.adjacency]
+
+    def connected(self, source: str, target: str) -> bool:
+        """
+        Whether there is a connection from `source` to the known location `target`.
+        """
+        return target in self.adjacency.get(source, ()) and target in self.adjacency
+
+    def within(self, name: str, hops: int) -> dict[str, int]:
+        """
+        The locations at most `hops` moves from `name`, with their distance in
+        moves, nearest first (`name` itself at 0); empty for an unknown location.
+        The result is cached and shared, so it must not be changed.
+        """
+        key = (name, hops)
+        with self.lock:
+            found = self.neighborhoods.get(key)
+            if found is not None:
+                self.neighborhoods.move_to_end(key)
+                self.hits += 1
+                return found
+            self.misses += 1
+            found = self._breadth_first(name, hops)
+            self.neighborhoods[key] = found
+            while len(self.neighborhoods) > self.max_cached:
+                self.neighborhoods.popitem(last=False)
+            return found
+
+    def _breadth_first(self, name: str, hops: int) -> dict[str, int]:
+        if name not in self.adjacency:
+            return {}
+        distances = {name: 0}
+        frontier = [name]
+        for depth in range(1, hops + 1):
+            reached = []
+            for location in frontier:
+                for target in self.adjacency[location]:
+                    if target not in distances and target in self.adjacency:
+                        distances[target] = depth
+                        reached.append(target)
+            if not reached:
+                break
+            frontier = reached
+        return distances
+
+    def path(
+        self,
+        start: str,
+        goal: str,
+        max_hops: int | None = None,
+        heuristic: Callable[[str, str], float] | None = None,
+    ) -> list[str] | None:
+        """
+        A shortest route from `start` to `goal`, both included, or None if there
+        is none within `max_hops` moves. Breadth-first by default; with a
+        `heuristic(location, goal)` that never overestimates the moves left
+        (e.g. grid distance on a map with coordinates), A* explores less of a large map.
+        """
+        if start not in self.adjacency or goal not in self.adjacency:
+            return None
+        if start == goal:
+            return [start]
+        if heuristic is None:
+            parents = self._breadth_first_parents(start, goal, max_hops)
+        else:
+            parents = self._a_star_parents(start, goal, max_hops, heuristic)
+        if parents is None:
+            return None
+        route = [goal]
+        while route[-1] != start:
+            route.append(parents[route[-1]])
+        route.reverse()
+        return route
+
+    def _breadth_first_parents(self, start: str, goal: str, max_hops: int | None) -> dict[str, str] | None:
+        parents = {start: None}
+        frontier = [start]
+        depth = 0
+        while frontier and (max_hops is None or depth < max_hops):
+            depth += 1
+            reached = []
+            for location in frontier:
+                for target in self.adjacency[location]:
+                    if target not in parents and target in self.adjacency:
+                        parents[target] = location
+                        if target == goal:
+                            return parents
+                        reached.append(target)
+            frontier = reached
+        return None
+
+    def _a_star_parents(
+        self, start: str, goal: str, max_hops: int | None, heuristic: Callable[[str, str], float]
+    ) -> dict[str, str] | None:
+        parents = {start: None}
+        moves = {start: 0}
+        # Ties on the estimate go to the entry pushed first
+        order = itertools.count()
+        queue = [(heuristic(start, goal), next(order), start)]
+        while queue:
+            _, _, location = heapq.heappop(queue)
+            if location == goal:
+                return parents
+            depth = moves[location] + 1
+            if max_hops is not None and depth > max_hops:
+                continue
+            for target in self.adjacency[location]:
+                if target in self.adjacency and depth < moves.get(target, depth + 1):
+                    moves[target] = depth
+                    parents[target] = location
+                    heapq.heappush(queue, (depth + heuristic(target, goal), next(order), target))
+        return None
+
+    def set_connections(self, name: str, connections: Iterable[str]) -> bool:
+        """
+        Adds a location or replaces its connections. Returns whether anything changed.
+        """
+        connections = dict.fromkeys(connections)
+        with self.lock:
+            old = self.adjacency.get(name)
+            if old is not None and list(old) == list(connections):
+                return False
+            self.adjacency[name] = connections
+            if old is None:
+                # Connections to it that weren't followed before now are
+                self._invalidate()
+            else:
+                self._invalidate(name)
+            return True
+
+    def remove(self, name: str) -> bool:
+        with self.lock:
+            if self.adjacency.pop(name, None) is None:
+                return False
+            self._invalidate(name, reached=True)
+            return True
+
+    def _invalidate(self, name: str | None = None, reached: bool = False):
+        """
+        Drops the cached neighbourhoods whose search followed the connections of
+        `name` (reached it in fewer moves than its limit), or with `reached` every
+        one containing it; all of them if name is None.
+        """
+        if name is None:
+            self.neighborhoods.clear()
+            return
+        stale = [
+            key for key, distances in self.neighborhoods.items()
+            if name in distances and (reached or distances[name] < key[1])
+        ]
+        for key in stale:
+            del self.neighborhoods[key]
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "locations": len(self.adjacency),
+                "cached_neighborhoods": len(self.neighborhoods),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
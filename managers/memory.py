@@ -0,0 +1,711 @@
+from __future__ import annotations
+
+import bisect
+import hashlib
+import json
+import math
+import os
+import queue
+import struct
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from enum import StrEnum
+
+from managers import startup
+
+# Heavy dependencies are only loaded once the memory system is first used.
+faiss = startup.lazy_import("faiss")
+np = startup.lazy_import("numpy")
+
+# Binary layout of the embeddings file: a fixed-size header followed by
+# fixed-size rows of (event position, embedding vector).
+EMBEDDINGS_MAGIC = b"RPGEMB"
+EMBEDDINGS_VERSION = 1
+EMBEDDINGS_HEADER = struct.Struct("<6sHI4x")  # magic, version, dimension, padding
+
+# Log hashes remembered for truncating the index (one per recently added event).
+HASH_HISTORY = 1024
+
+EMBEDDINGS_FILENAME = "memory_embeddings.bin"
+INDEX_FILENAME = "memory_index.faiss"
+META_FILENAME = "memory_meta.json"
+
+
+def chain_hash(previous_hash: str, event_text: str) -> str:
+    """
+    Extends a rolling content hash of the event log by one event.
+    Because the log is append-only, the hash of any prefix can be checked in one pass.
+    """
+    return hashlib.sha256(f"{previous_hash}\x1f{event_text}".encode("utf-8")).hexdigest()
+
+
+def row_dtype(dimension: int) -> np.dtype:
+    return np.dtype([("position", "<i8"), ("vector", "<f4", (dimension,))])
+
+
+@dataclass
+class EmbeddingStore:
+    """
+    On-disk home of a MemoryIndex: an append-only, memory-mappable embeddings
+    file, a serialized FAISS index, and a small JSON sidecar recording how much
+    of the event log both of them cover.
+    """
+
+    data_dir: str
+    model_name: str = ""
+
+    @property
+    def embeddings_path(self) -> str:
+        return os.path.join(self.data_dir, EMBEDDINGS_FILENAME)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.data_dir, INDEX_FILENAME)
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.data_dir, META_FILENAME)
+
+    def read_meta(self) -> dict | None:
+        """
+        Returns the sidecar metadata, or None if it is missing, unreadable, or
+        was written by another file version or embedding model.
+        """
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != EMBEDDINGS_VERSION:
+            return None
+        if meta.get("model") != self.model_name:
+            return None
+        return meta
+
+    def write_meta(self, meta: dict):
+        meta = {"version": EMBEDDINGS_VERSION, "model": self.model_name, **meta}
+        temp_path = f"{self.meta_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(meta, f, indent=4)
+        os.replace(temp_path, self.meta_path)
+
+    def open_rows(self, dimension: int, count: int) -> np.ndarray | None:
+        """
+        Memory-maps the first `count` rows of the embeddings file.
+        Returns None if the file is missing, has a foreign header, or is too short.
+        """
+        try:
+            with open(self.embeddings_path, "rb") as f:
+                header = f.read(EMBEDDINGS_HEADER.size)
+        except OSError:
+            return None
+        if len(header) != EMBEDDINGS_HEADER.size:
+            return None
+
+        magic, version, file_dimension = EMBEDDINGS_HEADER.unpack(header)
+        if (magic, version, file_dimension) != (
+            EMBEDDINGS_MAGIC,
+            EMBEDDINGS_VERSION,
+            dimension,
+        ):
+            return None
+
+        dtype = row_dtype(dimension)
+        available = (
+            os.path.getsize(self.embeddings_path) - EMBEDDINGS_HEADER.size
+        ) // dtype.itemsize
+        if available < count:
+            return None
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+
+        return np.memmap(
+            self.embeddings_path,
+            dtype=dtype,
+            mode="r",
+            offset=EMBEDDINGS_HEADER.size,
+            shape=(count,),
+        )
+
+    def truncate_rows(self, dimension: int, count: int):
+        """
+        Drops any rows past `count`, e.g. ones appended before a crash but
+        never recorded in the sidecar.
+        """
+        size = EMBEDDINGS_HEADER.size + count * row_dtype(dimension).itemsize
+        if os.path.getsize(self.embeddings_path) > size:
+            os.truncate(self.embeddings_path, size)
+
+    def append_rows(self, positions: list[int], embeddings: np.ndarray):
+        dimension = embeddings.shape[1]
+        rows = np.empty(len(positions), dtype=row_dtype(dimension))
+        rows["position"] = positions
+        rows["vector"] = embeddings
+
+        is_new = not os.path.exists(self.embeddings_path)
+        with open(self.embeddings_path, "ab") as f:
+            if is_new:
+                f.write(
+                    EMBEDDINGS_HEADER.pack(
+                        EMBEDDINGS_MAGIC, EMBEDDINGS_VERSION, dimension
+                    )
+                )
+            f.write(rows.tobytes())
+
+    def write_index(self, index: faiss.Index):
+        temp_path = f"{self.index_path}.tmp"
+        faiss.write_index(index, temp_path)
+        os.replace(temp_path, self.index_path)
+
+    def read_index(self) -> faiss.Index | None:
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            return faiss.read_index(self.index_path)
+        except RuntimeError:
+            return None
+
+    def clear(self):
+        for path in (self.embeddings_path, self.index_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class IndexType(StrEnum):
+    FLAT = "flat"
+    IVF_FLAT = "ivf_flat"
+    IVF_PQ = "ivf_pq"
+    HNSW = "hnsw"
+
+
+@dataclass
+class IndexConfig:
+    """
+    Chooses and tunes the FAISS index behind a MemoryIndex.
+    IVF indexes need training, so they serve from a flat index until enough
+    events have been logged, and are retrained as the log keeps growing.
+    """
+
+    index_type: IndexType = IndexType.FLAT
+
+    # IVF: number of inverted lists (None picks ~4 * sqrt(n) at training time)
+    # and how many of them each query visits.
+    nlist: int | None = None
+    nprobe: int = 8
+
+    # IVF: train once this many events exist, retrain whenever the index has
+    # grown by `retrain_growth` since, and sample at most `max_train_size`.
+    min_train_size: int = 2048
+    retrain_growth: float = 4.0
+    max_train_size: int = 100_000
+
+    # IVF-PQ: sub-quantizers per vector and bits per sub-quantizer code.
+    pq_m: int = 16
+    pq_bits: int = 8
+
+    # HNSW: graph degree and construction/search beam widths.
+    hnsw_m: int = 32
+    ef_construction: int = 40
+    ef_search: int = 64
+
+    @property
+    def needs_training(self) -> bool:
+        return self.index_type in (IndexType.IVF_FLAT, IndexType.IVF_PQ)
+
+    def train_threshold(self) -> int:
+        threshold = self.min_train_size
+        if self.index_type == IndexType.IVF_PQ:
+            # Every PQ codebook has 2^bits centroids to learn.
+            threshold = max(threshold, 39 * 2**self.pq_bits)
+        return threshold
+
+    def should_train(self, count: int, trained_at: int) -> bool:
+        if not self.needs_training or count < self.train_threshold():
+            return False
+        return trained_at == 0 or count >= trained_at * self.retrain_growth
+
+    def factory_string(self, dimension: int, count: int) -> str:
+        if self.index_type == IndexType.HNSW:
+            return f"HNSW{self.hnsw_m},Flat"
+        if not self.needs_training or count < self.train_threshold():
+            return "Flat"
+
+        # FAISS wants at least 39 training points per inverted list.
+        nlist = self.nlist or int(4 * math.sqrt(count))
+        nlist = max(1, min(nlist, count // 39))
+        if self.index_type == IndexType.IVF_FLAT:
+            return f"IVF{nlist},Flat"
+
+        # The number of sub-quantizers has to divide the dimension.
+        pq_m = max(m for m in range(1, self.pq_m + 1) if dimension % m == 0)
+        return f"IVF{nlist},PQ{pq_m}x{self.pq_bits}"
+
+    def build(self, vectors: np.ndarray, chunk_size: int = 65536) -> faiss.Index:
+        """
+        Creates an index of the configured type, trains it if needed, and adds
+        the given L2-normalized vectors to it.
+        """
+        count, dimension = vectors.shape
+        index = faiss.index_factory(
+            dimension,
+            self.factory_string(dimension, count),
+            faiss.METRIC_INNER_PRODUCT,
+        )
+        if self.index_type == IndexType.HNSW:
+            index.hnsw.efConstruction = self.ef_construction
+        if not index.is_trained:
+            index.train(self._training_sample(vectors))
+        self.apply_search_params(index)
+
+        for start in range(0, count, chunk_size):
+            index.add(np.ascontiguousarray(vectors[start : start + chunk_size]))
+        return index
+
+    def _training_sample(self, vectors: np.ndarray) -> np.ndarray:
+        if len(vectors) <= self.max_train_size:
+            return np.ascontiguousarray(vectors)
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(len(vectors), self.max_train_size, replace=False))
+        return np.ascontiguousarray(vectors[sample])
+
+    def search_params(
+        self, index: faiss.Index, selector: faiss.IDSelector
+    ) -> faiss.SearchParameters:
+        """
+        Builds per-query parameters that restrict a search to the selected IDs
+        while keeping this config's nprobe/efSearch.
+        """
+        if faiss.try_extract_index_ivf(index) is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        if hasattr(index, "hnsw"):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        return faiss.SearchParameters(sel=selector)
+
+    def apply_search_params(self, index: faiss.Index):
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = self.nprobe
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = self.ef_search
+
+
+@dataclass
+class MemoryIndex:
+    """
+    Append-only semantic index over the deep event log.
+    Each event is encoded exactly once, when it is appended, and added to the
+    existing FAISS index instead of rebuilding it from the whole history.
+    """
+
+    # Anything exposing a SentenceTransformer-style `encode(list[str])`.
+    model: object
+
+    index: faiss.Index | None = None
+
+    # Maps a FAISS internal ID (its insertion order) to the position of the
+    # event in the full event log.
+    # Format: positions[faiss_id] = event_position
+    positions: list[int] = field(default_factory=list)
+
+    # Inverse of `positions`, for restricting searches to given events.
+    # Format: {event_position: faiss_id}
+    ids_by_position: dict[int, int] = field(default_factory=dict)
+
+    # Filtered searches over at most this many candidates score them exactly
+    # from the stored vectors instead of going through the FAISS index.
+    exact_search_threshold: int = 4096
+
+    # Optional persistence. When set, every appended embedding is written to
+    # disk and the index is snapshotted every `snapshot_interval` events.
+    store: EmbeddingStore | None = None
+    snapshot_interval: int = 100
+
+    # Rolling content hash of every event added so far (see chain_hash).
+    log_hash: str = ""
+    # The hash as it was after each recent event, so `truncate` can wind it back.
+    # Format: (ntotal, log_hash)
+    hash_history: deque = field(default_factory=lambda: deque(maxlen=HASH_HISTORY), repr=False)
+    indexed_since_snapshot: int = 0
+
+    config: IndexConfig = field(default_factory=IndexConfig)
+
+    # Number of events the current IVF index was trained on (0 if untrained).
+    trained_at: int = 0
+
+    # Without a store, appended vectors are kept here for retraining.
+    vectors: list[np.ndarray] = field(default_factory=list, repr=False)
+
+    # Guards the FAISS index and its bookkeeping. Encoding happens outside the
+    # lock, so readers only ever wait for the (cheap) publish step.
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    @property
+    def ntotal(self) -> int:
+        return 0 if self.index is None else self.index.ntotal
+
+    def memory_usage(self) -> int:
+        """
+        Approximate resident bytes of the index, in-memory vectors and ID maps.
+        Counts full float32 vectors, so compressed (PQ) indexes are overestimated.
+        """
+        if self.index is None:
+            return 0
+        size = self.ntotal * self.index.d * 4
+        size += sum(vectors.nbytes for vectors in self.vectors)
+        size += len(self.positions) * 64
+        return size
+
+    @classmethod
+    def load(
+        cls, model: object, events: list[str], store: EmbeddingStore, **kwargs
+    ) -> "MemoryIndex":
+        """
+        Restores an index from disk, checking it against the event log.
+        Only events the stored embeddings don't cover are encoded; if the stored
+        files don't match the log at all, everything is rebuilt.
+        """
+        memory_index = cls(model, store=store, **kwargs)
+        if not memory_index._restore(events):
+            print("Stored memory index is missing or stale; rebuilding.")
+            memory_index.rebuild(events)
+            return memory_index
+
+        missing = events[len(memory_index.positions) :]
+        if missing:
+            print(f"Encoding {len(missing)} events missing from the stored memory index...")
+            start = len(memory_index.positions)
+            memory_index.add_many(missing, list(range(start, start + len(missing))))
+        else:
+            memory_index._maybe_retrain()
+        return memory_index
+
+    def _restore(self, events: list[str]) -> bool:
+        meta = self.store.read_meta()
+        if meta is None or meta["count"] > len(events):
+            return False
+
+        count = meta["count"]
+        log_hash = ""
+        for event_text in events[:count]:
+            log_hash = chain_hash(log_hash, event_text)
+        if log_hash != meta["log_hash"]:
+            return False
+
+        rows = self.store.open_rows(meta["dimension"], count)
+        if rows is None:
+            return False
+        self.store.truncate_rows(meta["dimension"], count)
+
+        # Prefer the serialized index; top it up from the embeddings file if the
+        # snapshot is older than the last appended event. If it was built with
+        # another index type, rebuild it from the stored vectors (no re-encoding).
+        index = self.store.read_index()
+        if (
+            index is None
+            or index.d != meta["dimension"]
+            or index.ntotal > count
+            or meta.get("index_type") != self.config.index_type
+        ):
+            index = self.config.build(rows["vector"])
+            self.trained_at = count if self.config.should_train(count, 0) else 0
+        else:
+            self.config.apply_search_params(index)
+            self.trained_at = meta.get("trained_at", 0)
+            if index.ntotal < count:
+                index.add(np.ascontiguousarray(rows["vector"][index.ntotal :]))
+
+        self.index = index
+        self.positions = rows["position"].tolist()
+        self.ids_by_position = {position: i for i, position in enumerate(self.positions)}
+        self.log_hash = log_hash
+        self.hash_history.append((count, log_hash))
+        return True
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """
+        Encodes texts into L2-normalized float32 vectors ready for inner-product search.
+        """
+        embeddings = np.array(self.model.encode(texts)).astype("float32")
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def add(self, event_text: str, position: int):
+        """
+        Encodes a single new event and appends it to the index.
+        """
+        self.add_many([event_text], [position])
+
+    def add_many(self, event_texts: list[str], positions: list[int]):
+        """
+        Encodes a batch of new events in one call and appends them to the index.
+        """
+        if not event_texts:
+            return
+        if len(event_texts) != len(positions):
+            raise ValueError("Each event needs exactly one log position.")
+
+        embeddings = self.encode(event_texts)
+        with self.lock:
+            if self.index is None:
+                dimension = embeddings.shape[1]
+                self.index = self.config.build(np.empty((0, dimension), dtype="float32"))
+            first_id = self.index.ntotal
+            self.index.add(embeddings)
+            self.positions.extend(positions)
+            for i, position in enumerate(positions, start=first_id):
+                self.ids_by_position[position] = i
+            for i, event_text in enumerate(event_texts, start=first_id + 1):
+                self.log_hash = chain_hash(self.log_hash, event_text)
+                self.hash_history.append((i, self.log_hash))
+
+            if self.store is None:
+                self.vectors.append(embeddings)
+            else:
+                self.store.append_rows(positions, embeddings)
+                self.indexed_since_snapshot += len(event_texts)
+                if self.indexed_since_snapshot >= self.snapshot_interval:
+                    self.save()
+                else:
+                    self._write_meta()
+
+        self._maybe_retrain()
+
+    def _all_vectors(self) -> np.ndarray:
+        """
+        Returns every indexed vector, in FAISS-id order, without re-encoding.
+        """
+        if self.store is not None:
+            return self.store.open_rows(self.index.d, self.ntotal)["vector"]
+        if len(self.vectors) > 1:
+            self.vectors = [np.concatenate(self.vectors)]
+        return self.vectors[0]
+
+    def _maybe_retrain(self):
+        if self.index is not None and self.config.should_train(self.ntotal, self.trained_at):
+            self.retrain()
+
+    def retrain(self):
+        """
+        Rebuilds the index from the stored vectors with the configured index type,
+        training IVF indexes on the current log. Training runs outside the lock;
+        readers keep using the old index until the new one is swapped in.
+        """
+        with self.lock:
+            vectors = self._all_vectors()
+        count = len(vectors)
+        print(f"[Memory] Training {self.config.index_type} index on {count} events...")
+        index = self.config.build(vectors)
+
+        with self.lock:
+            if self.ntotal > count:
+                index.add(np.ascontiguousarray(self._all_vectors()[count:]))
+            self.index = index
+            self.trained_at = count if self.config.needs_training else 0
+            self.save()
+
+    def tune(self, nprobe: int | None = None, ef_search: int | None = None):
+        """
+        Adjusts query-time accuracy/speed trade-offs without rebuilding.
+        """
+        with self.lock:
+            if nprobe is not None:
+                self.config.nprobe = nprobe
+            if ef_search is not None:
+                self.config.ef_search = ef_search
+            if self.index is not None:
+                self.config.apply_search_params(self.index)
+
+    def rebuild(self, events: list[str]):
+        """
+        Discards the current index and re-encodes every event from scratch.
+        Only meant for explicit rebuild requests and game resets.
+        """
+        with self.lock:
+            self.index = None
+            self.positions = []
+            self.ids_by_position = {}
+            self.vectors = []
+            self.trained_at = 0
+            self.log_hash = ""
+            self.hash_history.clear()
+            if self.store is not None:
+                self.store.clear()
+            self.add_many(events, list(range(len(events))))
+            self.save()
+
+    def truncate(self, length: int) -> bool:
+        """
+        Drops the events at log positions from `length` on, e.g. when turns are
+        undone. Only the dropped vectors are touched, except for index types
+        that can't remove vectors (HNSW), which are rebuilt from the stored ones.
+        Returns False if the log hash of the remaining events isn't remembered
+        (more was dropped than HASH_HISTORY covers); the index must then be rebuilt.
+        """
+        with self.lock:
+            keep = bisect.bisect_left(self.positions, length)
+            if keep >= self.ntotal:
+                return True
+            log_hash = "" if keep == 0 else next(
+                (log_hash for count, log_hash in reversed(self.hash_history) if count == keep), None
+            )
+            if log_hash is None:
+                return False
+
+            try:
+                self.index.remove_ids(faiss.IDSelectorRange(keep, self.ntotal))
+            except RuntimeError:
+                self.index = self.config.build(np.ascontiguousarray(self._all_vectors()[:keep]))
+            for position in self.positions[keep:]:
+                del self.ids_by_position[position]
+            del self.positions[keep:]
+            self.log_hash = log_hash
+            while self.hash_history and self.hash_history[-1][0] > keep:
+                self.hash_history.pop()
+
+            if self.store is None:
+                self.vectors = [self._all_vectors()[:keep]] if self.vectors else []
+            else:
+                self.store.truncate_rows(self.index.d, keep)
+                self.save()
+            return True
+
+    def save(self):
+        """
+        Snapshots the FAISS index to disk alongside the embeddings file.
+        """
+        with self.lock:
+            if self.store is None or self.index is None:
+                return
+            self.store.write_index(self.index)
+            self.indexed_since_snapshot = 0
+            self._write_meta()
+
+    def _write_meta(self):
+        self.store.write_meta(
+            {
+                "dimension": self.index.d,
+                "count": self.ntotal,
+                "log_hash": self.log_hash,
+                "index_type": self.config.index_type,
+                "trained_at": self.trained_at,
+            }
+        )
+
+    def search(
+        self, query_text: str, k: int = 2, allowed_positions: set[int] | None = None
+    ) -> list[int]:
+        """
+        Returns the log positions of the k events most similar to the query.
+        If `allowed_positions` is given, only those events are considered.
+        """
+        if self.ntotal == 0:
+            return []
+
+        query_embedding = self.encode([query_text])
+        with self.lock:
+            if allowed_positions is None:
+                k = min(k, self.ntotal)  # Don't search for more than we have
+                _, ids = self.index.search(query_embedding, k)
+                return [self.positions[i] for i in ids[0].tolist() if i != -1]
+
+            allowed_ids = np.array(
+                sorted(
+                    self.ids_by_position[position]
+                    for position in allowed_positions
+                    if position in self.ids_by_position
+                ),
+                dtype="int64",
+            )
+            if len(allowed_ids) == 0:
+                return []
+            k = min(k, len(allowed_ids))
+
+            if len(allowed_ids) <= self.exact_search_threshold:
+                # Few candidates: scoring them directly beats any index traversal.
+                scores = self._all_vectors()[allowed_ids] @ query_embedding[0]
+                ids = allowed_ids[np.argsort(-scores, kind="stable")[:k]].tolist()
+            else:
+                selector = faiss.IDSelectorBatch(allowed_ids)
+                params = self.config.search_params(self.index, selector)
+                _, found = self.index.search(query_embedding, k, params=params)
+                ids = [i for i in found[0].tolist() if i != -1]
+            return [self.positions[i] for i in ids]
+
+
+@dataclass
+class EmbeddingWorker:
+    """
+    Background thread that takes event indexing off the request path.
+    Submitted events are queued, encoded in batches with a single `encode`
+    call, and published to the MemoryIndex in log order.
+    """
+
+    memory_index: MemoryIndex
+    max_batch_size: int = 64
+
+    pending: queue.Queue = field(default_factory=queue.Queue)
+    thread: threading.Thread | None = None
+
+    # Submitted events not yet published; `idle` is notified when it drops to 0.
+    unpublished: int = 0
+    idle: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(
+            target=self._run, name="embedding-worker", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, event_text: str, position: int):
+        with self.idle:
+            self.unpublished += 1
+        self.pending.put((event_text, position))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until every submitted event has been published to the index.
+        Returns False if the timeout expired first.
+        """
+        with self.idle:
+            return self.idle.wait_for(lambda: self.unpublished == 0, timeout)
+
+    def stop(self, timeout: float | None = None):
+        """
+        Publishes whatever is still queued, then shuts the thread down.
+        """
+        if self.thread is None:
+            return
+        self.pending.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = None in batch
+            events = [item for item in batch if item is not None]
+            try:
+                if events:
+                    event_texts, positions = zip(*events)
+                    self.memory_index.add_many(list(event_texts), list(positions))
+            except Exception as e:
+                print(f"[Memory] Failed to index {len(events)} events: {e}")
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+                with self.idle:
+                    self.unpublished -= len(events)
+                    if self.unpublished == 0:
+                        self.idle.notify_all()
+
+            if stopping:
+                return
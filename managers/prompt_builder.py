@@ -0,0 +1,242 @@
+import os
+import threading
+from dataclasses import dataclass, field
+from enum import StrEnum
+
+# Rough characters per token of English prose, for when no tokenizer is at hand.
+CHARS_PER_TOKEN = 4
+
+TRUNCATION_MARK = "..."
+
+SECTION_SEPARATOR = "\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass
+class TokenCounter:
+    """
+    Counts tokens with the LLM's own tokenizer (a Hugging Face `tokenizer.json`,
+    read with the `tokenizers` package) when `tokenizer_path` is set and
+    loadable, and estimates them from the text length otherwise.
+    The tokenizer is loaded on first use.
+    """
+
+    tokenizer_path: str | None = None
+
+    tokenizer: object | None = field(default=None, repr=False)
+    loaded: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def _load(self):
+        if self.loaded:
+            return
+        with self.lock:
+            if self.loaded:
+                return
+            if self.tokenizer_path is not None:
+                try:
+                    from tokenizers import Tokenizer  # pip install tokenizers
+
+                    self.tokenizer = Tokenizer.from_file(self.tokenizer_path)
+                except Exception as e:  # Not installed, or a missing or malformed file
+                    print(f"Prompt tokenizer unavailable ({e}); estimating token counts.")
+            self.loaded = True
+
+    @property
+    def exact(self) -> bool:
+        self._load()
+        return self.tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        self._load()
+        if self.tokenizer is None:
+            return estimate_tokens(text)
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cuts the text down to at most `max_tokens` tokens, marking the cut.
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        keep = max(0, max_tokens - self.count(TRUNCATION_MARK))
+        if self.tokenizer is None:
+            end = keep * CHARS_PER_TOKEN
+        else:
+            offsets = self.tokenizer.encode(text, add_special_tokens=False).offsets
+            end = offsets[keep][0] if keep < len(offsets) else len(text)
+        return text[:end].rstrip() + TRUNCATION_MARK
+
+    @classmethod
+    def for_path(cls, tokenizer_path: str | None) -> "TokenCounter":
+        if tokenizer_path is not None and not os.path.exists(tokenizer_path):
+            print(f"Prompt tokenizer {tokenizer_path} not found; estimating token counts.")
+            tokenizer_path = None
+        return cls(tokenizer_path)
+
+
+class PromptLayout(StrEnum):
+    # The original order, character and deep memory first.
+    CLASSIC = "classic"
+    # Most stable sections first, so consecutive turns share a long prompt
+    # prefix and the LLM server can reuse its KV cache for it.
+    STABLE_FIRST = "stable_first"
+
+
+# Section titles from the least to the most likely to change between turns.
+STABLE_FIRST_ORDER = [
+    "[SUMMARY OF PAST EVENTS]",  # Changes when a summary is merged
+    "[WORLD]",  # Changes on moving or when time passes
+    "[NEARBY LOCATIONS]",
+    "[NPCS PRESENT]",
+    "[ITEMS IN CURRENT LOCATION]",
+    "[CHARACTER]",
+    "[RECENT EVENTS]",  # Changes every turn
+    "[DEEP MEMORY]",  # Depends on the player's input
+    "[SCENE]",
+]
+
+
+def arrange(sections: list["PromptSection"], layout: PromptLayout) -> list["PromptSection"]:
+    """
+    Orders the sections for the layout. Sections missing from the layout's
+    order go last, in their original order.
+    """
+    if layout == PromptLayout.CLASSIC:
+        return list(sections)
+    position = {title: i for i, title in enumerate(STABLE_FIRST_ORDER)}
+    return sorted(sections, key=lambda section: position.get(section.title, len(position)))
+
+
+def shared_prefix(previous: str | None, prompt: str) -> str:
+    """
+    The text a prompt has in common with the start of the previous one: what
+    an LLM server with prefix caching doesn't have to prefill again.
+    """
+    if not previous:
+        return ""
+    return os.path.commonprefix([previous, prompt])
+
+
+@dataclass
+class PromptSection:
+    """
+    One section of the turn prompt, e.g. "[NPCS PRESENT]".
+    Entries are listed most important first (last, with `keep_last`), so the
+    builder cuts the least important ones when the section is over budget.
+    """
+
+    title: str
+    entries: list[str]
+
+    # A line under the title, e.g. "(What just happened)".
+    note: str | None = None
+    # Leave a blank line between the title (and note) and the entries.
+    spaced: bool = False
+    separator: str = "\n\n"
+    # Shown when there are no entries.
+    empty: str = "None"
+
+    # Max tokens of the section's entries; None for no limit.
+    budget: int | None = None
+    # When the whole prompt is over budget, entries of lower priority
+    # sections are dropped first. Required sections are never dropped.
+    priority: int = 0
+    required: bool = False
+    # The last entries are the most important (e.g. the most recent summaries).
+    keep_last: bool = False
+
+    def render(self, entries: list[str] | None = None) -> str:
+        entries = self.entries if entries is None else entries
+        head = self.title if self.note is None else f"{self.title}\n{self.note}"
+        body = self.separator.join(entries) if entries else self.empty
+        return f"{head}\n\n{body}" if self.spaced else f"{head}\n{body}"
+
+
+@dataclass
+class PromptBuilder:
+    """
+    Assembles the prompt from sections within token budgets: each section is
+    first cut to its own budget, then, while the whole prompt is over `budget`,
+    entries are dropped from the lowest priority sections.
+    """
+
+    counter: TokenCounter
+    # Max tokens of the whole prompt; None for no limit.
+    budget: int | None = None
+
+    def build(self, sections: list[PromptSection]) -> tuple[str, dict]:
+        """
+        Returns the prompt and its token breakdown:
+        {"total": int, "budget": int | None, "exact": bool,
+         "sections": {title: {"tokens": int, "entries": int, "dropped": int}}}
+        """
+        kept = [self._fit_section(section) for section in sections]
+        tokens = [self._section_tokens(section, entries) for section, entries in zip(sections, kept)]
+        total = sum(tokens) + self.counter.count(SECTION_SEPARATOR) * (len(sections) - 1)
+
+        if self.budget is not None and total > self.budget:
+            droppable = sorted(
+                (i for i, section in enumerate(sections) if not section.required),
+                key=lambda i: sections[i].priority,
+            )
+            for i in droppable:
+                section = sections[i]
+                separator_tokens = self.counter.count(section.separator)
+                while total > self.budget and kept[i]:
+                    # Drop entries until the estimated excess is gone, then re-measure the section.
+                    excess = total - self.budget
+                    while excess > 0 and kept[i]:
+                        dropped = kept[i][0] if section.keep_last else kept[i][-1]
+                        kept[i] = kept[i][1:] if section.keep_last else kept[i][:-1]
+                        excess -= self.counter.count(dropped) + separator_tokens
+                    section_tokens = self._section_tokens(section, kept[i])
+                    total += section_tokens - tokens[i]
+                    tokens[i] = section_tokens
+                if total <= self.budget:
+                    break
+
+        rendered = [section.render(entries) for section, entries in zip(sections, kept)]
+        prompt = SECTION_SEPARATOR.join(rendered)
+        report = {
+            "total": self.counter.count(prompt),
+            "budget": self.budget,
+            "exact": self.counter.exact,
+            "sections": {
+                section.title: {
+                    "tokens": section_tokens,
+                    "entries": len(entries),
+                    "dropped": len(section.entries) - len(entries),
+                }
+                for section, entries, section_tokens in zip(sections, kept, tokens)
+            },
+        }
+        return prompt, report
+
+    def _section_tokens(self, section: PromptSection, entries: list[str]) -> int:
+        return self.counter.count(section.render(entries))
+
+    def _fit_section(self, section: PromptSection) -> list[str]:
+        if section.budget is None:
+            return list(section.entries)
+        ordered = reversed(section.entries) if section.keep_last else section.entries
+        kept = []
+        used = 0
+        for entry in ordered:
+            entry_tokens = self.counter.count(entry)
+            if used + entry_tokens <= section.budget:
+                kept.append(entry)
+                used += entry_tokens
+                continue
+            if not kept:
+                # A single entry larger than the whole budget is cut, not dropped.
+                kept.append(self.counter.truncate(entry, section.budget))
+            break
+        if section.keep_last:
+            kept.reverse()
+        return kept
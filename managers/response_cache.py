@@ -0,0 +1,100 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+
+def normalize_input(player_input: str) -> str:
+    """
+    Canonical form of the player's input: lowercase words, without punctuation
+    or extra whitespace, so "Look around!" and "look  around" share an entry.
+    """
+    return " ".join(re.findall(r"\w+", player_input.lower()))
+
+
+def state_key(state_slice: dict, player_input: str) -> str:
+    """
+    Hashes the state the reply depends on together with the normalized input.
+    """
+    canonical = json.dumps(
+        {"state": state_slice, "input": normalize_input(player_input)},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    response: str
+    stored_at: float
+    # What the entry depends on, e.g. {"location:Hallway", "npc:Dale"}.
+    tags: frozenset[str]
+
+
+@dataclass
+class ResponseCache:
+    """
+    LLM replies to observational input (replies without actions), keyed on a
+    hash of the state slice they describe. Entries expire after `ttl` seconds,
+    the least recently used go once there are more than `max_entries`, and
+    `invalidate` drops those depending on state an action changed.
+    """
+
+    max_entries: int = 256
+    ttl: float = 600.0
+
+    # Least recently used first.
+    entries: OrderedDict[str, CacheEntry] = field(default_factory=OrderedDict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    hits: int = 0
+    misses: int = 0
+    invalidated: int = 0
+
+    def get(self, key: str) -> str | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry.stored_at > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.response
+
+    def put(self, key: str, response: str, tags: set[str]):
+        with self.lock:
+            self.entries[key] = CacheEntry(response, time.monotonic(), frozenset(tags))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, tags: set[str] | None = None):
+        """
+        Drops the entries depending on any of the tags, or every entry if tags is None.
+        """
+        with self.lock:
+            if tags is None:
+                dropped = list(self.entries)
+            else:
+                dropped = [key for key, entry in self.entries.items() if entry.tags & tags]
+            for key in dropped:
+                del self.entries[key]
+            self.invalidated += len(dropped)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "invalidated": self.invalidated,
+            }
@@ -0,0 +1,189 @@
+import re
+from dataclasses import dataclass, field
+
+SECTIONS = ("STORY", "EVENT", "ACTIONS")
+
+# A section marker starts a line: "STORY:", "EVENT:" or "ACTIONS:", optionally indented.
+# Text after the colon on the same line belongs to the section.
+MARKER_PATTERN = re.compile(r"[ \t]*(STORY|EVENT|ACTIONS)[ \t]*:")
+# A line start that may still turn into a marker once more text arrives.
+PARTIAL_MARKER_PATTERN = re.compile(r"[ \t]*(STORY|EVENT|ACTIONS)[ \t]*")
+
+# List decorations models like to put in front of actions: "- ", "* ", "1. ", "2) ".
+BULLET_PATTERN = re.compile(r"^(?:[-*•]|\d+[.)])\s+")
+
+DEFAULT_STORY = "The world is silent."
+DEFAULT_EVENT = "Nothing happened."
+
+
+@dataclass
+class SectionStart:
+    section: str  # "story", "event" or "actions"
+
+
+@dataclass
+class StoryDelta:
+    text: str
+
+
+@dataclass
+class EventText:
+    text: str
+
+
+@dataclass
+class Action:
+    text: str
+
+
+ParseEvent = SectionStart | StoryDelta | EventText | Action
+
+
+def _could_be_marker(line_start: str) -> bool:
+    stripped = line_start.lstrip(" \t")
+    if any(section.startswith(stripped) for section in SECTIONS):
+        return True
+    return PARTIAL_MARKER_PATTERN.fullmatch(line_start) is not None
+
+
+@dataclass
+class ResponseParser:
+    """
+    Incremental parser for the LLM's STORY/EVENT/ACTIONS response format.
+
+    Feed it chunks of text as they are streamed; each call returns the parse
+    events that became certain: `SectionStart` when a marker is read,
+    `StoryDelta` for story text (whitespace at the edges held back, so the
+    deltas concatenate to the final stripped story), `EventText` once the
+    event section ends, and one `Action` per completed action line.
+
+    Markers are recognized at the start of any line, with or without a blank
+    line before them. Text before the first marker is ignored.
+    """
+
+    section: str | None = None
+
+    # Unconsumed text: the start of a line that may still become a marker.
+    buffer: str = ""
+    at_line_start: bool = True
+
+    story: str = ""
+    story_started: bool = False
+    # Whitespace after the story text so far; emitted only if more text follows.
+    story_pending_space: str = ""
+
+    event_parts: list[str] = field(default_factory=list)
+    event: str | None = None
+
+    action_line: str = ""
+    actions: list[str] = field(default_factory=list)
+
+    closed: bool = False
+
+    def feed(self, chunk: str) -> list[ParseEvent]:
+        events = []
+        self.buffer += chunk
+        self._consume(events, final=False)
+        return events
+
+    def close(self) -> list[ParseEvent]:
+        """
+        Consumes whatever is left (a truncated response ends here) and finishes
+        the current section.
+        """
+        events = []
+        if not self.closed:
+            self._consume(events, final=True)
+            self._finish_section(events)
+            self.closed = True
+        return events
+
+    def result(self) -> dict:
+        """
+        The parsed response, in the shape `parse_response` returns.
+        """
+        return {
+            "story": self.story if self.story_started else DEFAULT_STORY,
+            "event": self.event if self.event is not None else DEFAULT_EVENT,
+            "actions": list(self.actions),
+        }
+
+    def _consume(self, events: list[ParseEvent], final: bool):
+        while self.buffer:
+            newline = self.buffer.find("\n")
+            if self.at_line_start:
+                line = self.buffer if newline == -1 else self.buffer[:newline]
+                marker = MARKER_PATTERN.match(line)
+                if marker:
+                    self._start_section(marker.group(1).lower(), events)
+                    self.buffer = self.buffer[marker.end():]
+                    self.at_line_start = False
+                    continue
+                if newline == -1 and not final and _could_be_marker(line):
+                    return  # Wait for the rest of the line
+                self.at_line_start = False
+
+            if newline == -1:
+                self._content(self.buffer, events, line_complete=False)
+                self.buffer = ""
+            else:
+                self._content(self.buffer[:newline], events, line_complete=True)
+                self.buffer = self.buffer[newline + 1:]
+                self.at_line_start = True
+
+    def _start_section(self, section: str, events: list[ParseEvent]):
+        self._finish_section(events)
+        self.section = section
+        events.append(SectionStart(section))
+
+    def _finish_section(self, events: list[ParseEvent]):
+        if self.section == "event":
+            text = "".join(self.event_parts).strip()
+            self.event_parts = []
+            if text:
+                self.event = text
+                events.append(EventText(text))
+        elif self.section == "actions":
+            self._finish_action(events)
+
+    def _content(self, text: str, events: list[ParseEvent], line_complete: bool):
+        if self.section == "story":
+            self._story_text(text + "\n" if line_complete else text, events)
+        elif self.section == "event":
+            self.event_parts.append(text + "\n" if line_complete else text)
+        elif self.section == "actions":
+            self.action_line += text
+            if line_complete:
+                self._finish_action(events)
+
+    def _story_text(self, text: str, events: list[ParseEvent]):
+        if not self.story_started:
+            text = text.lstrip()
+            if not text:
+                return
+            self.story_started = True
+        body = text.rstrip()
+        if not body:
+            self.story_pending_space += text
+            return
+        delta = self.story_pending_space + body
+        self.story_pending_space = text[len(body):]
+        self.story += delta
+        events.append(StoryDelta(delta))
+
+    def _finish_action(self, events: list[ParseEvent]):
+        action = BULLET_PATTERN.sub("", self.action_line.strip()).strip()
+        self.action_line = ""
+        if action and action.upper() != "NONE":
+            self.actions.append(action)
+            events.append(Action(action))
+
+
+def parse_response(text: str) -> dict:
+    """
+    Parses a complete response. Returns a dictionary with 'story', 'event' and 'actions' keys.
+    """
+    parser = ResponseParser()
+    parser.feed(text)
+    parser.close()
+    return parser.result()
@@ -0,0 +1,195 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from managers.event_log import EventLog
+
+# Session IDs become directory names, so only allow a safe character set.
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Rough resident cost of one logged event in the keyword and metadata indexes.
+INDEX_BYTES_PER_EVENT = 1024
+
+
+def valid_session_id(session_id) -> bool:
+    # Request bodies are JSON, so the ID may be any type
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+@dataclass
+class Session:
+    """
+    One playthrough: its own data directory, game state store, deep event log
+    and memory indexes. The memory indexes are loaded on first use.
+    """
+
+    session_id: str
+    data_dir: str
+
+    # A game_state.StateStore or sqlite_state.SqliteStateStore.
+    state_store: object
+    event_log: EventLog
+
+    memory_index: object | None = None
+    lexical_index: object | None = None
+    metadata_index: object | None = None
+    embedding_worker: object | None = None
+    summary_worker: object | None = None
+    # A response_cache.ResponseCache, if enabled.
+    response_cache: object | None = None
+    # An undo.UndoJournal of the turns /undo can take back.
+    undo_journal: object | None = None
+    # A location_graph.LocationGraph of the map, built on first use.
+    location_graph: object | None = None
+
+    # The last turn's prompt and its token breakdown (see prompt_builder.PromptBuilder.build).
+    last_prompt: str | None = None
+    last_prompt_report: dict | None = None
+
+    # Held for a whole request, so requests for the same session run one at a time.
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    # Requests currently using the session; it can't be evicted while > 0.
+    active: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.data_dir, name)
+
+    def memory_usage(self) -> int:
+        """
+        Approximate bytes held by the session's memory indexes.
+        """
+        if self.memory_index is None:
+            return 0
+        return self.memory_index.memory_usage() + self.memory_index.ntotal * INDEX_BYTES_PER_EVENT
+
+    def close(self):
+        """
+        Indexes whatever is still queued, snapshots the memory index and
+        flushes the game state. A summary still being written is dropped; its
+        events stay in the state and are summarized when the session is next used.
+        """
+        if self.summary_worker is not None:
+            self.summary_worker.cancel()
+            self.summary_worker = None
+        if self.embedding_worker is not None:
+            self.embedding_worker.stop()
+            self.embedding_worker = None
+        if self.memory_index is not None:
+            self.memory_index.save()
+        self.state_store.stop()
+
+
+@dataclass
+class SessionManager:
+    """
+    Keeps recently used sessions loaded. Sessions are opened lazily by
+    `open_session(session_id)` and the least recently used idle ones are
+    closed once there are more than `max_sessions`, or their memory indexes
+    together exceed `memory_budget` bytes. Opening and closing run outside the
+    manager's lock, so they only hold up requests for that session.
+    """
+
+    open_session: Callable[[str], Session]
+    max_sessions: int = 16
+    memory_budget: int = 1024 * 1024 * 1024
+
+    # Least recently used first.
+    sessions: OrderedDict[str, Session] = field(default_factory=OrderedDict)
+    # Format: {session_id: event set once the session has been opened or closed}
+    pending: dict[str, threading.Event] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @contextmanager
+    def acquire(self, session_id: str):
+        """
+        Yields the session with its lock held. Requests for different sessions
+        run in parallel; requests for the same session wait for each other.
+        """
+        session = self._checkout(session_id)
+        try:
+            with session.lock:
+                session.last_used = time.monotonic()
+                yield session
+        finally:
+            with self.lock:
+                session.active -= 1
+            self.evict()
+
+    def _checkout(self, session_id: str) -> Session:
+        """
+        Returns the loaded session, counted as active, opening it first if needed.
+        Only one thread opens a session; others asking for it wait for that, as
+        they do for a session still being closed after its eviction.
+        """
+        while True:
+            with self.lock:
+                session = self.sessions.get(session_id)
+                if session is not None:
+                    self.sessions.move_to_end(session_id)
+                    session.active += 1
+                    return session
+                pending = self.pending.get(session_id)
+                if pending is None:
+                    opened = self.pending[session_id] = threading.Event()
+            if pending is not None:
+                pending.wait()
+                continue
+            try:
+                session = self.open_session(session_id)
+                with self.lock:
+                    self.sessions[session_id] = session
+                    session.active += 1
+                return session
+            finally:
+                with self.lock:
+                    del self.pending[session_id]
+                opened.set()
+
+    def evict(self):
+        """
+        Closes least recently used idle sessions until the limits are met.
+        """
+        evicted = []
+        with self.lock:
+            usage = sum(session.memory_usage() for session in self.sessions.values())
+            for session_id, session in list(self.sessions.items()):
+                if len(self.sessions) <= self.max_sessions and usage <= self.memory_budget:
+                    break
+                if session.active:
+                    continue
+                session_usage = session.memory_usage()
+                del self.sessions[session_id]
+                # Reopening waits until it is closed, so two sessions never share its files
+                self.pending[session_id] = threading.Event()
+                usage -= session_usage
+                evicted.append((session_id, session, session_usage))
+        for session_id, session, session_usage in evicted:
+            self._close(session_id, session)
+            print(f"Evicted idle session '{session_id}' ({session_usage / 2**20:.1f} MiB).")
+
+    def _close(self, session_id: str, session: Session):
+        try:
+            session.close()
+        finally:
+            with self.lock:
+                self.pending.pop(session_id).set()
+
+    def loaded(self) -> list[Session]:
+        with self.lock:
+            return list(self.sessions.values())
+
+    def close_all(self):
+        with self.lock:
+            closing = list(self.sessions.items())
+            self.sessions.clear()
+            for session_id, _ in closing:
+                self.pending[session_id] = threading.Event()
+        for session_id, session in closing:
+            self._close(session_id, session)
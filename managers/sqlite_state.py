@@ -0,0 +1,419 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
+
+from managers.game_state import GameState
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    section TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS locations (
+    name TEXT PRIMARY KEY,
+    description TEXT,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS connections (
+    source TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    PRIMARY KEY (source, position)
+);
+CREATE INDEX IF NOT EXISTS connections_by_target ON connections (target);
+CREATE TABLE IF NOT EXISTS items (
+    location TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (location, position)
+);
+CREATE TABLE IF NOT EXISTS npcs (
+    name TEXT PRIMARY KEY,
+    description TEXT,
+    location TEXT,
+    status TEXT NOT NULL DEFAULT '[]',
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS npcs_by_location ON npcs (location);
+CREATE TABLE IF NOT EXISTS events (
+    position INTEGER PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    position INTEGER PRIMARY KEY,
+    body TEXT NOT NULL
+);
+"""
+
+# Sections stored as a single JSON document vs. as an ordered list of rows.
+DOCUMENT_SECTIONS = ("character", "world")
+LIST_SECTIONS = ("events", "summaries")
+
+# Location and NPC fields with their own columns or tables; anything else goes to `extra`.
+LOCATION_FIELDS = ("description", "connections", "items")
+NPC_FIELDS = ("description", "location", "status")
+
+
+class SqliteTable(MutableMapping, ABC):
+    """
+    A keyed state section (locations, npcs) read lazily from SQLite.
+    Rows are fetched on first access and then cached, so a turn only reads the
+    rows it touches; `StateStore.save` writes back the keys marked dirty.
+    Subclasses map a row to their tables with `_fetch`, `_write` and `_delete`.
+    """
+
+    select_names = ""
+
+    def __init__(self, store: "SqliteStateStore"):
+        self.store = store
+        # Format: {name: row dict}
+        self.rows: dict[str, dict] = {}
+        # All names in insertion order, loaded on first iteration.
+        self.names: dict[str, None] | None = None
+        self.deleted: set[str] = set()
+
+    @abstractmethod
+    def _fetch(self, name: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def _write(self, conn: sqlite3.Connection, name: str, row: dict):
+        ...
+
+    @abstractmethod
+    def _delete(self, conn: sqlite3.Connection, name: str):
+        ...
+
+    def __getitem__(self, name: str) -> dict:
+        row = self.rows.get(name)
+        if row is None:
+            if name in self.deleted:
+                raise KeyError(name)
+            with self.store.lock:
+                row = self._fetch(name)
+            if row is None:
+                raise KeyError(name)
+            self.rows[name] = row
+        return row
+
+    def __setitem__(self, name: str, row: dict):
+        self.rows[name] = row
+        self.deleted.discard(name)
+        if self.names is not None:
+            self.names.setdefault(name)
+
+    def __delitem__(self, name: str):
+        self[name]  # Raises KeyError for unknown names
+        del self.rows[name]
+        self.deleted.add(name)
+        if self.names is not None:
+            self.names.pop(name, None)
+
+    def __contains__(self, name) -> bool:
+        if name in self.rows:
+            return True
+        if name in self.deleted:
+            return False
+        if self.names is not None:
+            return name in self.names
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
+
+    def _names(self) -> dict[str, None]:
+        if self.names is None:
+            with self.store.lock:
+                names = dict.fromkeys(name for (name,) in self.store.conn.execute(self.select_names))
+            names.update(dict.fromkeys(self.rows))
+            for name in self.deleted:
+                names.pop(name, None)
+            self.names = names
+        return self.names
+
+    def __iter__(self):
+        return iter(list(self._names()))
+
+    def __len__(self) -> int:
+        return len(self._names())
+
+    def to_dict(self) -> dict:
+        return {name: self[name] for name in self}
+
+
+class LocationTable(SqliteTable):
+    select_names = "SELECT name FROM locations ORDER BY rowid"
+
+    def _fetch(self, name):
+        conn = self.store.conn
+        found = conn.execute("SELECT description, extra FROM locations WHERE name = ?", (name,)).fetchone()
+        if found is None:
+            return None
+        description, extra = found
+        row = {}
+        if description is not None:
+            row["description"] = description
+        row["connections"] = [
+            target
+            for (target,) in conn.execute(
+                "SELECT target FROM connections WHERE source = ? ORDER BY position", (name,)
+            )
+        ]
+        row["items"] = [
+            item
+            for (item,) in conn.execute(
+                "SELECT name FROM items WHERE location = ? ORDER BY position", (name,)
+            )
+        ]
+        row.update(json.loads(extra))
+        return row
+
+    def _write(self, conn, name, row):
+        extra = {key: value for key, value in row.items() if key not in LOCATION_FIELDS}
+        conn.execute(
+            "INSERT INTO locations (name, description, extra) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET description = excluded.description, extra = excluded.extra",
+            (name, row.get("description"), json.dumps(extra)),
+        )
+        conn.execute("DELETE FROM connections WHERE source = ?", (name,))
+        conn.executemany(
+            "INSERT INTO connections (source, position, target) VALUES (?, ?, ?)",
+            [(name, i, target) for i, target in enumerate(row.get("connections", []))],
+        )
+        conn.execute("DELETE FROM items WHERE location = ?", (name,))
+        conn.executemany(
+            "INSERT INTO items (location, position, name) VALUES (?, ?, ?)",
+            [(name, i, item) for i, item in enumerate(row.get("items", []))],
+        )
+
+    def connection_map(self) -> dict[str, list[str]]:
+        """
+        Every location's connections, read in one query instead of a row at a
+        time, e.g. to build the location graph. Rows changed since the last save
+        are taken as they are in memory.
+        """
+        connections = {name: [] for name in self._names()}
+        with self.store.lock:
+            for source, target in self.store.conn.execute(
+                "SELECT source, target FROM connections ORDER BY source, position"
+            ):
+                if source in connections and source not in self.rows:
+                    connections[source].append(target)
+        for name, row in self.rows.items():
+            connections[name] = list(row.get("connections", []))
+        return connections
+
+    def _delete(self, conn, name):
+        conn.execute("DELETE FROM locations WHERE name = ?", (name,))
+        conn.execute("DELETE FROM connections WHERE source = ?", (name,))
+        conn.execute("DELETE FROM items WHERE location = ?", (name,))
+
+
+class NpcTable(SqliteTable):
+    select_names = "SELECT name FROM npcs ORDER BY rowid"
+
+    def _fetch(self, name):
+        found = self.store.conn.execute(
+            "SELECT description, location, status, extra FROM npcs WHERE name = ?", (name,)
+        ).fetchone()
+        if found is None:
+            return None
+        description, location, status, extra = found
+        row = {}
+        if description is not None:
+            row["description"] = description
+        if location is not None:
+            row["location"] = location
+        row["status"] = json.loads(status)
+        row.update(json.loads(extra))
+        return row
+
+    def _write(self, conn, name, row):
+        extra = {key: value for key, value in row.items() if key not in NPC_FIELDS}
+        conn.execute(
+            "INSERT INTO npcs (name, description, location, status, extra) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET description = excluded.description, "
+            "location = excluded.location, status = excluded.status, extra = excluded.extra",
+            (name, row.get("description"), row.get("location"), json.dumps(row.get("status", [])), json.dumps(extra)),
+        )
+
+    def _delete(self, conn, name):
+        conn.execute("DELETE FROM npcs WHERE name = ?", (name,))
+
+    def at_location(self, location: str) -> dict[str, dict]:
+        """
+        Returns the NPCs at a location, found through the location index
+        instead of a scan over every NPC.
+        """
+        with self.store.lock:
+            names = [
+                name
+                for (name,) in self.store.conn.execute(
+                    "SELECT name FROM npcs WHERE location = ? ORDER BY rowid", (location,)
+                )
+            ]
+        # Cached rows may have moved since the last save.
+        names += [name for name, row in self.rows.items() if row.get("location") == location and name not in names]
+        return {name: self[name] for name in names if self[name].get("location") == location}
+
+
+TABLE_SECTIONS = {"locations": LocationTable, "npcs": NpcTable}
+
+
+@dataclass
+class SqliteStateStore:
+    """
+    Game state in a SQLite database, behind the same load/save interface as
+    `game_state.StateStore`.
+
+    Character and world are small JSON documents; locations (with their
+    connections and items) and NPCs are tables read row by row on demand;
+    recent events and summaries are ordered rows. Each save is one transaction
+    writing only the rows marked dirty. The database runs in WAL mode, and every
+    query uses a fixed SQL string so sqlite3's statement cache keeps it prepared.
+    """
+
+    path: str
+
+    fsync: bool = True
+
+    # The resident state, loaded on first use.
+    state: GameState | None = None
+
+    conn: sqlite3.Connection | None = field(default=None, repr=False)
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    def connect(self) -> sqlite3.Connection:
+        with self.lock:
+            if self.conn is None:
+                conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+                conn.execute("PRAGMA journal_mode = WAL")
+                # In WAL mode NORMAL is crash-safe but may lose the last commits on power loss.
+                conn.execute(f"PRAGMA synchronous = {'FULL' if self.fsync else 'NORMAL'}")
+                conn.executescript(SCHEMA)
+                self.conn = conn
+            return self.conn
+
+    def load(self) -> GameState:
+        with self.lock:
+            if self.state is None:
+                conn = self.connect()
+                sections = {}
+                for section in DOCUMENT_SECTIONS:
+                    found = conn.execute("SELECT body FROM documents WHERE section = ?", (section,)).fetchone()
+                    sections[section] = json.loads(found[0]) if found else {}
+                for section in LIST_SECTIONS:
+                    sections[section] = [
+                        json.loads(body)
+                        for (body,) in conn.execute(f"SELECT body FROM {section} ORDER BY position")
+                    ]
+                for section, table in TABLE_SECTIONS.items():
+                    sections[section] = table(self)
+                self.state = GameState(sections)
+            return self.state
+
+    def save(self, state: GameState):
+        """
+        Writes the entries changed since the last save in one transaction.
+        """
+        with self.lock:
+            conn = self.connect()
+            with conn:
+                for section, keys in state.take_changes().items():
+                    if keys is None:
+                        self._write_section(conn, state, section)
+                        continue
+                    table = state[section]
+                    for key in keys:
+                        if key in table.deleted:
+                            table._delete(conn, key)
+                        elif key in table.rows:
+                            table._write(conn, key, table.rows[key])
+                    table.deleted -= keys
+
+    def _write_section(self, conn: sqlite3.Connection, state: GameState, section: str):
+        value = state[section]
+        if section in DOCUMENT_SECTIONS:
+            conn.execute(
+                "INSERT INTO documents (section, body) VALUES (?, ?) "
+                "ON CONFLICT (section) DO UPDATE SET body = excluded.body",
+                (section, json.dumps(value)),
+            )
+        elif section in LIST_SECTIONS:
+            conn.execute(f"DELETE FROM {section}")
+            conn.executemany(
+                f"INSERT INTO {section} (position, body) VALUES (?, ?)",
+                [(i, json.dumps(entry)) for i, entry in enumerate(value)],
+            )
+        elif section in TABLE_SECTIONS:
+            # A whole keyed section was replaced (or marked dirty without keys).
+            rows = value.to_dict() if isinstance(value, SqliteTable) else dict(value)
+            table = TABLE_SECTIONS[section](self)
+            for name in table:
+                if name not in rows:
+                    table._delete(conn, name)
+            for name, row in rows.items():
+                table._write(conn, name, row)
+            table.rows = rows
+            table.names = dict.fromkeys(rows)
+            dict.__setitem__(state, section, table)
+
+    def import_sections(self, sections: dict):
+        """
+        Replaces the stored state with the given sections (plain dicts and lists).
+        """
+        with self.lock:
+            conn = self.connect()
+            state = GameState(sections)
+            with conn:
+                for section in sections:
+                    self._write_section(conn, state, section)
+            self.state = None
+
+    # The database is its own journal, so there is nothing to write behind.
+    def start(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def stop(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def reset(self):
+        """
+        Forgets the resident state and deletes the database, e.g. before the
+        game is recreated from the default JSON files.
+        """
+        with self.lock:
+            self.stop()
+            self.state = None
+            for path in (self.path, f"{self.path}-wal", f"{self.path}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def migrate_from_json(files: dict[str, str], db_path: str) -> dict[str, int]:
+    """
+    Copies the JSON layout (one file per section, as used by
+    `game_state.StateStore`) into a SQLite database.
+    Returns the number of entries migrated per section.
+    """
+    sections = {}
+    for section, path in files.items():
+        with open(path, "r") as f:
+            sections[section] = json.load(f)
+    store = SqliteStateStore(db_path)
+    store.import_sections(sections)
+    store.stop()
+    counts = {section: len(value) for section, value in sections.items()}
+    print(f"Migrated game state to {db_path}: {counts}")
+    return counts
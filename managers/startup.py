@@ -0,0 +1,73 @@
+import importlib.util
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Returns a module whose code only runs on first attribute access, so heavy
+    dependencies (numpy, faiss) cost nothing until they are actually used.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def ensure_loaded(module: ModuleType) -> ModuleType:
+    """
+    Forces a lazily imported module to finish importing.
+    """
+    getattr(module, "__file__", None)
+    return module
+
+
+@dataclass
+class StartupProfiler:
+    """
+    Records how long each startup step took (imports, model load, index restore)
+    so slow starts can be attributed to a specific step.
+    """
+
+    started_at: float = field(default_factory=time.perf_counter)
+
+    # Format: {step_name: seconds}, in the order the steps finished.
+    timings: dict[str, float] = field(default_factory=dict)
+
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @contextmanager
+    def measure(self, step: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.timings[step] = time.perf_counter() - start
+
+    def report(self) -> dict:
+        with self.lock:
+            return {
+                "steps": {step: round(seconds, 4) for step, seconds in self.timings.items()},
+                "since_start": round(time.perf_counter() - self.started_at, 4),
+            }
+
+    def print_report(self):
+        report = self.report()
+        print("--- Startup Time Report ---")
+        for step, seconds in report["steps"].items():
+            print(f"  {step:<32} {seconds * 1000:>9.1f} ms")
+        print(f"  {'total since start':<32} {report['since_start'] * 1000:>9.1f} ms")
+        print("---------------------------")
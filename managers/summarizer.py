@@ -0,0 +1,163 @@
+import queue
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from managers.prompt_builder import estimate_tokens
+
+
+def summary_node(entry: dict | str) -> dict:
+    """
+    Returns a summary entry as a node of the summary tree.
+    Older saves store bare strings, which are leaf summaries.
+    Format: {"text": str, "level": int, "log_id": int | None}
+    Leaves (level 0) condense events; a level n+1 chapter condenses level n summaries.
+    """
+    if isinstance(entry, str):
+        return {"text": entry, "level": 0, "log_id": None}
+    return entry
+
+
+def mergeable_run(summaries: list, fanout: int) -> tuple[int, list] | None:
+    """
+    Finds the oldest `fanout` consecutive summaries of the same level, to be
+    condensed into one chapter a level up. Returns (start index, entries), or None.
+
+    Summaries are kept oldest first, and merging always condenses the oldest
+    full run, so levels never increase towards the newest end: the list reads
+    like the digits of a counter in base `fanout`.
+    """
+    start = 0
+    while start + fanout <= len(summaries):
+        level = summary_node(summaries[start])["level"]
+        end = start + 1
+        while end < len(summaries) and summary_node(summaries[end])["level"] == level:
+            end += 1
+        if end - start >= fanout:
+            return start, summaries[start:start + fanout]
+        start = end
+    return None
+
+
+def select_summaries(
+    summaries: list, budget: int, count_tokens: Callable[[str], int] = estimate_tokens
+) -> list[dict]:
+    """
+    Picks the summaries that best fill a token budget: the most recent first,
+    since they carry the story's current threads, skipping any that don't fit.
+    Chapters cover older history in few tokens, so a long game still gets an
+    overview of its beginning. Returns the picked nodes oldest first.
+    """
+    picked = []
+    remaining = budget
+    for entry in reversed(summaries):
+        node = summary_node(entry)
+        tokens = count_tokens(node["text"])
+        if tokens <= remaining:
+            picked.append(node)
+            remaining -= tokens
+    picked.reverse()
+    return picked
+
+
+@dataclass
+class SummaryJob:
+    # Snapshot of what gets condensed: events or summaries.
+    items: list
+    # Returns the summary paragraph, or None if that failed.
+    summarize: Callable[[list], str | None]
+    # Folds the summary into the game state; returns False if it no longer applies.
+    merge: Callable[[list, str], bool]
+
+
+@dataclass
+class SummaryWorker:
+    """
+    Background thread that takes summarization off the request path.
+
+    A job snapshots what it condenses (old events, or a run of summaries to
+    merge into a chapter), has the LLM write the summary, and merges it back
+    into the game state, replacing exactly the snapshotted entries. Merges run
+    under `lock` (the state store's lock), so they are atomic with respect to turns.
+
+    At most one job is queued or running at a time, so nothing is ever part of
+    two summaries. A job that fails or is cancelled leaves its entries in the
+    state, where the next job picks them up.
+    """
+
+    lock: threading.RLock
+
+    pending: queue.Queue = field(default_factory=queue.Queue)
+    busy: bool = False
+    cancelled: bool = False
+    thread: threading.Thread | None = None
+    # Guards `busy` and is notified when it clears; `lock` is only taken for merging and cancelling.
+    submit_lock: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    merged: int = 0
+    failed: int = 0
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(
+            target=self._run, name="summary-worker", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, job: SummaryJob) -> bool:
+        """
+        Queues a job. Returns False (and does nothing) while another job is
+        still queued or running.
+        """
+        with self.submit_lock:
+            if self.busy or self.cancelled:
+                return False
+            self.busy = True
+        self.pending.put(job)
+        return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until the submitted job has been merged (or has failed).
+        Returns False if the timeout expired first.
+        """
+        with self.submit_lock:
+            return self.submit_lock.wait_for(lambda: not self.busy, timeout)
+
+    def cancel(self):
+        """
+        Drops the queued job and the result of a running one, and lets the
+        thread exit. Doesn't wait for a running LLM call to return.
+        """
+        with self.lock:
+            self.cancelled = True
+        self.pending.put(None)
+
+    def stats(self) -> dict:
+        return {"busy": self.busy, "merged": self.merged, "failed": self.failed}
+
+    def _run(self):
+        while True:
+            job = self.pending.get()
+            try:
+                if job is None:
+                    return
+                if self.cancelled:
+                    continue
+                summary = job.summarize(job.items)
+                if summary is None:
+                    self.failed += 1
+                    continue
+                with self.lock:
+                    if not self.cancelled and job.merge(job.items, summary):
+                        self.merged += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[Summary] Failed to summarize {len(job.items)} entries: {e}")
+            finally:
+                if job is not None:
+                    with self.submit_lock:
+                        self.busy = False
+                        self.submit_lock.notify_all()
+                self.pending.task_done()
@@ -0,0 +1,93 @@
+from collections import deque
+from dataclasses import dataclass, field
+
+# Marks a field or entry that didn't exist before the change; undoing it deletes it.
+# A sentinel rather than None, which is a value a field can really have.
+MISSING = object()
+
+
+# Inverse operations, as tuples:
+#   ("field", section, key, old_value): a field of a document section (world, character)
+#   ("entry", section, key, old_entry): an entry of a keyed section (locations, npcs)
+#   ("splice", section, start, stop, old_items): the slice a list section (events, summaries) had
+def field_op(state: dict, section: str, key: str) -> tuple:
+    """
+    The inverse of changing one field of a document section; call it before the change.
+    """
+    return ("field", section, key, state[section].get(key, MISSING))
+
+
+def revert(state, ops: list[tuple]):
+    """
+    Applies inverse operations to the game state, newest first, marking what they change dirty.
+    """
+    for op in reversed(ops):
+        kind, section = op[0], op[1]
+        if kind == "splice":
+            _, _, start, stop, old_items = op
+            state[section][start:stop] = old_items
+            state.mark_dirty(section)
+            continue
+        _, _, key, old_value = op
+        target = state[section]
+        if old_value is MISSING:
+            if key in target:
+                del target[key]
+        else:
+            target[key] = old_value
+        if kind == "entry":
+            state.mark_dirty(section, key)
+        else:
+            state.mark_dirty(section)
+
+
+@dataclass
+class UndoStep:
+    # "turn", or a summary merged in the background ("summary", "chapter").
+    kind: str
+    # Length of the deep event log before the step; undoing it truncates the log back to this.
+    log_length: int
+    ops: list[tuple] = field(default_factory=list)
+
+
+@dataclass
+class UndoJournal:
+    """
+    The steps that changed a session's game state, oldest first, as inverse
+    operations: the previous value of each changed field or entry, and the
+    slices of list sections it replaced. Undoing a turn costs as much as the
+    turn changed, however large the state. Summaries merged in the background
+    are steps too, so undoing the turns before them undoes them first.
+    Only the last `max_turns` turns are kept.
+    """
+
+    max_turns: int = 20
+
+    steps: deque[UndoStep] = field(default_factory=deque)
+
+    @property
+    def turns(self) -> int:
+        return sum(1 for step in self.steps if step.kind == "turn")
+
+    def record(self, step: UndoStep):
+        self.steps.append(step)
+        turns = self.turns
+        while turns > self.max_turns:
+            if self.steps.popleft().kind == "turn":
+                turns -= 1
+
+    def pop(self, turns: int) -> list[UndoStep]:
+        """
+        Removes the last `turns` turns and every step after the first of them.
+        Returns the removed steps, newest first.
+        """
+        popped = []
+        while turns > 0 and self.steps:
+            step = self.steps.pop()
+            popped.append(step)
+            if step.kind == "turn":
+                turns -= 1
+        return popped
+
+    def clear(self):
+        self.steps.clear()
@@ -0,0 +1,146 @@
+"""
+Checks the ONNX embedding backend against the PyTorch sentence-transformers
+model and measures encoding throughput.
+
+Parity: both backends encode a fixed corpus of game text; the script reports
+per-sentence cosine agreement and exits non-zero if any sentence falls below
+--min-cosine. Throughput: sentences per second at batch sizes 1, 8 and 64.
+
+Usage (from the repository root, after scripts.export_onnx_embedding):
+    python -m scripts.benchmark_embedding
+    python -m scripts.benchmark_embedding --onnx-model models/all-MiniLM-L6-v2/model.onnx --threads 4
+    python -m scripts.benchmark_embedding --skip-throughput
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from managers import embedding
+
+# Fixed corpus: the kinds of text the game actually embeds (events and player input).
+CORPUS = [
+    "The adventure begins.",
+    "Orton picked up a rusty can",
+    "Orton dropped the torn newspaper in Apartment B2",
+    "Orton moved from the Hallway to the Stairwell",
+    "Dale pulled his patched leather jacket tighter and watched the stairs",
+    "Sarah shared a bottle of water with Orton on the Ground Floor",
+    "A distant scream echoed through the concrete stairwell",
+    "Orton searched the lobby and found an old magazine and a bent spoon",
+    "The flickering lights in the hallway finally died",
+    "Dale warned Orton not to trust the people from the north side",
+    "Orton bandaged the cut on his arm with a strip of cloth",
+    "Night fell and the building grew quiet",
+    "look around",
+    "check inventory",
+    "talk to Dale",
+    "take the rusty can",
+    "go to the stairwell",
+    "ask Sarah about her backpack",
+    "What did Dale say about the north side?",
+    "Where did I leave the newspaper?",
+    "Orton barricaded the door of Apartment B2 with a broken table",
+    "Sarah collapsed from exhaustion and Orton carried her upstairs",
+    "A rat scurried across the debris-strewn floor",
+    "Orton traded his pocket knife to Dale for a flashlight",
+    "The graffiti on the wall read: THEY COME AT NIGHT",
+    "Orton heard footsteps above and froze",
+    "Dale became hostile after Orton refused to share food",
+    "The morning light revealed a path through the collapsed lobby",
+    "Orton drank the last of his water",
+    "Sarah told a story about the city before the collapse",
+    "An old radio crackled with static and a faint voice",
+    "Orton climbed onto the roof to look for smoke on the horizon",
+]
+
+
+def load_backends(args):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    backends = {"pytorch": SentenceTransformer(args.model)}
+    for model_path in args.onnx_model:
+        backends[f"onnx:{os.path.basename(model_path)}"] = embedding.OnnxEncoder(
+            model_path, args.tokenizer, intra_op_threads=args.threads
+        )
+    return backends
+
+
+def check_parity(backends: dict, min_cosine: float) -> bool:
+    reference = np.asarray(backends["pytorch"].encode(CORPUS), dtype="float32")
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+
+    passed = True
+    for name, model in backends.items():
+        if name == "pytorch":
+            continue
+        vectors = model.encode(CORPUS)
+        cosines = (vectors * reference).sum(axis=1)
+        worst = int(np.argmin(cosines))
+        ok = cosines.min() >= min_cosine
+        passed &= ok
+        print(
+            f"{name:<28} cosine mean {cosines.mean():.5f}  min {cosines.min():.5f} "
+            f"({CORPUS[worst]!r})  {'PASS' if ok else 'FAIL'}"
+        )
+    return passed
+
+
+def measure_throughput(backends: dict, batch_sizes: list[int], sentences: int):
+    texts = (CORPUS * (sentences // len(CORPUS) + 1))[:sentences]
+    print(f"{'backend':<28}" + "".join(f"{'batch ' + str(b):>14}" for b in batch_sizes))
+    for name, model in backends.items():
+        model.encode(texts[:8])  # warm up
+        row = f"{name:<28}"
+        for batch_size in batch_sizes:
+            start = time.perf_counter()
+            for offset in range(0, len(texts), batch_size):
+                model.encode(texts[offset : offset + batch_size], batch_size=batch_size)
+            row += f"{len(texts) / (time.perf_counter() - start):>10.1f} s/s"
+        print(row)
+
+
+def main():
+    default_dir = os.path.join("models", "all-MiniLM-L6-v2")
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument(
+        "--onnx-model",
+        nargs="+",
+        default=[
+            path
+            for path in (
+                os.path.join(default_dir, "model.onnx"),
+                os.path.join(default_dir, "model_int8.onnx"),
+            )
+            if os.path.exists(path)
+        ],
+    )
+    parser.add_argument("--tokenizer", default=os.path.join(default_dir, "tokenizer.json"))
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--sentences", type=int, default=512)
+    parser.add_argument("--skip-throughput", action="store_true")
+    args = parser.parse_args()
+
+    if not args.onnx_model:
+        sys.exit("No ONNX model found; run python -m scripts.export_onnx_embedding --quantize first.")
+
+    backends = load_backends(args)
+    print("--- Parity with the PyTorch model ---")
+    passed = check_parity(backends, args.min_cosine)
+    if not args.skip_throughput:
+        print("--- Throughput (sentences per second) ---")
+        measure_throughput(backends, args.batch_sizes, args.sentences)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmarks the location graph on generated maps of 10k+ locations.
+
+Each map is a grid of rooms connected to their neighbours in both directions,
+with a share of the connections walled off. For every map size this reports
+the time to build the graph, connection checks against scanning the
+connections lists, k-hop neighbourhoods walked from the lists every turn
+against the graph's cached ones, and breadth-first against A* pathfinding
+(with grid distance as the heuristic).
+
+Usage (from the repository root):
+    python -m scripts.benchmark_location_graph
+    python -m scripts.benchmark_location_graph --sizes 10000 100000 --hops 1 2 3 --queries 2000
+"""
+
+import argparse
+import random
+import time
+
+from managers import location_graph
+
+
+def generate_map(size: int, walls: float, rng: random.Random) -> tuple[dict, dict]:
+    """
+    Returns the locations, as the game state holds them, and each one's grid position.
+    """
+    width = max(1, round(size ** 0.5))
+    positions = {f"Room {i % width},{i // width}": (i % width, i // width) for i in range(size)}
+    locations = {name: {"description": f"Room at {x},{y}", "items": [], "connections": []} for name, (x, y) in positions.items()}
+    for name, (x, y) in positions.items():
+        for neighbour in (f"Room {x + 1},{y}", f"Room {x},{y + 1}"):
+            if neighbour in locations and rng.random() >= walls:
+                locations[name]["connections"].append(neighbour)
+                locations[neighbour]["connections"].append(name)
+    return locations, positions
+
+
+def walk(locations: dict, start: str, turns: int, rng: random.Random) -> list[str]:
+    """
+    Where a player moving to a random connected room every few turns is on each turn.
+    """
+    route = [start]
+    for _ in range(turns - 1):
+        here = route[-1]
+        connections = locations[here]["connections"]
+        route.append(rng.choice(connections) if connections and rng.random() < 0.3 else here)
+    return route
+
+
+def list_neighbourhood(locations: dict, name: str, hops: int) -> dict[str, int]:
+    """
+    The neighbourhood walked from the connections lists, as prepare_turn did for one hop.
+    """
+    distances = {name: 0}
+    frontier = [name]
+    for depth in range(1, hops + 1):
+        reached = []
+        for location in frontier:
+            for target in locations[location].get("connections", []):
+                if target not in distances and target in locations:
+                    distances[target] = depth
+                    reached.append(target)
+        frontier = reached
+    return distances
+
+
+def timed(function, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--hops", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--walls", type=float, default=0.2, help="share of grid connections walled off")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        locations, positions = generate_map(size, args.walls, rng)
+        names = list(locations)
+        edges = sum(len(location["connections"]) for location in locations.values())
+        print(f"\n{size} locations, {edges} connections")
+
+        build_seconds, graph = timed(location_graph.LocationGraph.from_state, locations)
+        print(f"  build graph: {build_seconds * 1000:.1f} ms")
+
+        # Connection checks, as MOVE_TO makes them
+        pairs = [(name, rng.choice(names)) for name in rng.choices(names, k=args.queries)]
+        pairs += [(name, rng.choice(locations[name]["connections"])) for name, _ in pairs if locations[name]["connections"]]
+        list_seconds, _ = timed(lambda: [target in locations[source]["connections"] for source, target in pairs])
+        graph_seconds, _ = timed(lambda: [graph.connected(source, target) for source, target in pairs])
+        print(f"  connection check: lists {list_seconds / len(pairs) * 1e6:.2f} us, graph {graph_seconds / len(pairs) * 1e6:.2f} us")
+
+        # Neighbourhoods along a playthrough, which stays in one area for several turns
+        route = walk(locations, rng.choice(names), args.queries, rng)
+        for hops in args.hops:
+            list_seconds, expected = timed(lambda: [list_neighbourhood(locations, name, hops) for name in route])
+            graph.neighborhoods.clear()
+            graph_seconds, found = timed(lambda: [graph.within(name, hops) for name in route])
+            assert found == expected
+            print(
+                f"  {hops}-hop neighbourhood: lists {list_seconds / len(route) * 1e6:.1f} us/turn, "
+                f"cached graph {graph_seconds / len(route) * 1e6:.1f} us/turn "
+                f"({len(set(route))} distinct locations of {len(route)} turns)"
+            )
+
+        # Pathfinding between random locations
+        def grid_distance(location, goal):
+            (x, y), (goal_x, goal_y) = positions[location], positions[goal]
+            return abs(x - goal_x) + abs(y - goal_y)
+
+        path_pairs = [(rng.choice(names), rng.choice(names)) for _ in range(max(1, args.queries // 20))]
+        bfs_seconds, bfs_paths = timed(lambda: [graph.path(start, goal) for start, goal in path_pairs])
+        a_star_seconds, a_star_paths = timed(
+            lambda: [graph.path(start, goal, heuristic=grid_distance) for start, goal in path_pairs]
+        )
+        for bfs_path, a_star_path in zip(bfs_paths, a_star_paths):
+            assert (bfs_path is None) == (a_star_path is None)
+            assert bfs_path is None or len(bfs_path) == len(a_star_path)
+        found = [path for path in bfs_paths if path is not None]
+        mean_moves = sum(len(path) - 1 for path in found) / len(found) if found else 0.0
+        print(
+            f"  path ({len(found)}/{len(path_pairs)} reachable, {mean_moves:.0f} moves on average): "
+            f"BFS {bfs_seconds / len(path_pairs) * 1000:.2f} ms, A* {a_star_seconds / len(path_pairs) * 1000:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmarks the deep-memory index types on synthetic event embeddings.
+
+For every log size and index type this reports recall@k against the exact
+flat index, query latency, build time, and the serialized index size.
+
+Usage (from the repository root):
+    python -m scripts.benchmark_memory
+    python -m scripts.benchmark_memory --sizes 10000 100000 --k 5 --queries 200
+"""
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from managers import memory
+
+DIMENSION = 384  # all-MiniLM-L6-v2
+
+
+def synthetic_embeddings(
+    count: int, dimension: int, rng: np.random.Generator, clusters: int = 256
+) -> np.ndarray:
+    """
+    Generates L2-normalized vectors around random topic centroids, which is
+    closer to real event embeddings than uniform noise.
+    """
+    centroids = rng.standard_normal((clusters, dimension), dtype="float32")
+    vectors = np.empty((count, dimension), dtype="float32")
+    chunk_size = 65536
+    for start in range(0, count, chunk_size):
+        end = min(start + chunk_size, count)
+        topics = rng.integers(0, clusters, end - start)
+        noise = rng.standard_normal((end - start, dimension), dtype="float32")
+        vectors[start:end] = centroids[topics] + 0.6 * noise
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found.tolist(), truth.tolist()))
+    return hits / truth.size
+
+
+def benchmark(
+    config: memory.IndexConfig,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    truth: np.ndarray | None,
+    k: int,
+) -> dict:
+    start = time.perf_counter()
+    index = config.build(vectors)
+    build_seconds = time.perf_counter() - start
+
+    # Time queries one by one, the way game turns issue them.
+    latencies = []
+    found = np.empty((len(queries), k), dtype="int64")
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query[np.newaxis, :], k)
+        latencies.append(time.perf_counter() - start)
+        found[i] = ids[0]
+
+    return {
+        "index": config.factory_string(vectors.shape[1], len(vectors)),
+        "build_s": build_seconds,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+        "recall": 1.0 if truth is None else recall_at_k(found, truth),
+        "size_mb": faiss.serialize_index(index).nbytes / 2**20,
+        "found": found,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--types", nargs="+", default=[t.value for t in memory.IndexType])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(
+        f"{'events':>9} {'type':>9} {'index':>20} {'build s':>8} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(args.k):>9} {'size MB':>8}"
+    )
+    for size in args.sizes:
+        rng = np.random.default_rng(args.seed)
+        vectors = synthetic_embeddings(size, DIMENSION, rng)
+        queries = synthetic_embeddings(args.queries, DIMENSION, rng)
+
+        # Flat runs first: its results are the ground truth for recall.
+        index_types = sorted(
+            (memory.IndexType(t) for t in args.types),
+            key=lambda t: t != memory.IndexType.FLAT,
+        )
+        truth = None
+        for index_type in index_types:
+            config = memory.IndexConfig(
+                index_type=index_type,
+                nprobe=args.nprobe,
+                ef_search=args.ef_search,
+                min_train_size=min(size, memory.IndexConfig.min_train_size),
+            )
+            if truth is None and index_type != memory.IndexType.FLAT:
+                truth = benchmark(memory.IndexConfig(), vectors, queries, None, args.k)["found"]
+            result = benchmark(config, vectors, queries, truth, args.k)
+            if index_type == memory.IndexType.FLAT:
+                truth = result["found"]
+            print(
+                f"{size:>9} {index_type:>9} {result['index']:>20} {result['build_s']:>8.2f} "
+                f"{result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f} "
+                f"{result['recall']:>9.3f} {result['size_mb']:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Measures the prefill time the stable-first prompt layout saves on an LLM server with prefix caching.
+
+Starts a local stand-in for a llama.cpp-style chat completions server: each
+slot remembers the last prompt it processed, and a request with
+`"cache_prompt": true` is only charged prefill time for the tokens after the
+prefix it shares with that prompt (reported back in llama.cpp's `timings`).
+A synthetic playthrough is then replayed through the game's payload builder
+and LLM client, once per prompt layout and cache setting.
+
+Usage (from the repository root):
+    python -m scripts.benchmark_prompt_cache
+    python -m scripts.benchmark_prompt_cache --turns 100 --prefill-ms-per-token 0.5
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app
+from managers import llm_client, prompt_builder
+
+REPLY = "STORY:\nYou look around.\n\nEVENT:\nOrton looked around\n\nACTIONS:\nNONE"
+
+WORDS = (
+    "rusted pipes drip onto cracked tiles while a draft carries the smell of smoke and wet concrete "
+    "through broken doors scattered papers old cans flickering lights distant voices heavy footsteps"
+).split()
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, prefill_ms_per_token: float):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.counter = prompt_builder.TokenCounter()
+        # Format: {slot: last prompt text}
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/v1/chat/completions"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server: StandInServer
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = "\n".join(message["content"] for message in payload["messages"])
+        slot = payload.get("id_slot", 0)
+        with self.server.lock:
+            previous = self.server.slots.get(slot) if payload.get("cache_prompt") else None
+            self.server.slots[slot] = prompt
+        cached = self.server.counter.count(prompt_builder.shared_prefix(previous, prompt))
+        prefilled = self.server.counter.count(prompt) - cached
+        prompt_ms = prefilled * self.server.prefill_ms_per_token
+        time.sleep(prompt_ms / 1000)
+
+        body = json.dumps({
+            "choices": [{"message": {"role": "assistant", "content": REPLY}}],
+            "timings": {"prompt_n": prefilled, "prompt_ms": prompt_ms, "cache_n": cached},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def playthrough(turns: int, seed: int) -> list[list[prompt_builder.PromptSection]]:
+    """
+    The prompt sections of a synthetic playthrough, laid out like the game's:
+    moving every few turns, picking things up, events every turn and a new
+    summary every ten turns.
+    """
+    rng = random.Random(seed)
+    locations = {
+        f"Location_{i}": {
+            "description": text(rng, 25),
+            "items": [f"item_{i}_{j}" for j in range(rng.randint(0, 4))],
+            "connections": [f"Location_{(i + step) % 40}" for step in (1, 2, 7)],
+        }
+        for i in range(40)
+    }
+    npcs = {f"NPC_{i}": {"description": text(rng, 12), "location": f"Location_{rng.randrange(40)}"} for i in range(25)}
+    inventory = ["pocket knife", "water bottle"]
+    summaries = [text(rng, 60)]
+    events = []
+    log = []
+    location = "Location_0"
+    times = ["Morning", "Afternoon", "Evening", "Night"]
+
+    turn_sections = []
+    for turn in range(turns):
+        current = locations[location]
+        nearby = [
+            f"    {name}: {locations[name]['description']}, Items: {', '.join(locations[name]['items']) or 'None'}"
+            for name in current["connections"]
+        ]
+        present = [
+            f"    {name}: {npc['description']}, Status: healthy" for name, npc in npcs.items() if npc["location"] == location
+        ]
+        deep_memories = [f"    {event}" for event in rng.sample(log, min(2, len(log)))]
+        turn_sections.append([
+            prompt_builder.PromptSection(
+                "[CHARACTER]", [f"Name: Orton, Status: healthy, Inventory: {', '.join(inventory)}"], required=True
+            ),
+            prompt_builder.PromptSection(
+                "[DEEP MEMORY]", deep_memories,
+                note="(Recalled from past events based on your input)", spaced=True, empty="    None"
+            ),
+            prompt_builder.PromptSection(
+                "[WORLD]",
+                [f"Current Location: {location}", f"Description: {current['description']}", f"Time: {times[turn // 8 % 4]}"],
+                separator="\n", required=True
+            ),
+            prompt_builder.PromptSection(
+                "[ITEMS IN CURRENT LOCATION]", [f"    {item}" for item in current["items"]],
+                spaced=True, separator="\n", empty="    None"
+            ),
+            prompt_builder.PromptSection("[NEARBY LOCATIONS]", nearby, spaced=True, empty="    None"),
+            prompt_builder.PromptSection("[NPCS PRESENT]", present, spaced=True, empty="    None"),
+            prompt_builder.PromptSection(
+                "[SUMMARY OF PAST EVENTS]", list(summaries),
+                note="(A narrative overview of the long-term past)", spaced=True
+            ),
+            prompt_builder.PromptSection(
+                "[RECENT EVENTS]", [f"    {event}" for event in events[:5]],
+                note="(What just happened)", spaced=True, empty=""
+            ),
+            prompt_builder.PromptSection("[SCENE]", [text(rng, 8)], required=True),
+        ])
+
+        # What the turn did
+        roll = rng.random()
+        if roll < 0.25:
+            location = rng.choice(current["connections"])
+        elif roll < 0.45 and current["items"]:
+            inventory.append(current["items"].pop())
+        event = f"Turn {turn}: {text(rng, 10)}"
+        events.insert(0, event)
+        log.append(event)
+        if turn % 10 == 9:
+            summaries = summaries[-2:] + [text(rng, 60)]
+            del events[2:]
+    return turn_sections
+
+
+def run(url: str, turn_sections, layout: prompt_builder.PromptLayout, cache_prompt: bool) -> dict:
+    app.LLM_CACHE_PROMPT = cache_prompt
+    builder = prompt_builder.PromptBuilder(prompt_builder.TokenCounter())
+    client = llm_client.LLMClient(url)
+    start = time.perf_counter()
+    prompt_tokens = 0
+    for sections in turn_sections:
+        sections = prompt_builder.arrange(sections, layout)
+        if layout == prompt_builder.PromptLayout.STABLE_FIRST:
+            # Oldest first, as prepare_turn lists them in this layout
+            for section in sections:
+                if section.title == "[RECENT EVENTS]":
+                    section.entries = section.entries[::-1]
+        prompt, report = builder.build(sections)
+        prompt_tokens += report["total"]
+        client.chat(app.game_master_payload(prompt, slot=0), label="benchmark")
+    elapsed = time.perf_counter() - start
+    prefill_ms = sum(ms for ms, _, _ in client.prefill_timings)
+    stats = client.stats()
+    return {
+        "prompt_tokens": prompt_tokens / len(turn_sections),
+        "prefill_ms": prefill_ms / len(turn_sections),
+        "reuse": stats["prompt_cache_reuse"] or 0.0,
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    turn_sections = playthrough(args.turns, args.seed)
+    runs = [
+        ("classic, no cache hint", prompt_builder.PromptLayout.CLASSIC, False),
+        ("classic, cache_prompt", prompt_builder.PromptLayout.CLASSIC, True),
+        ("stable_first, cache_prompt", prompt_builder.PromptLayout.STABLE_FIRST, True),
+    ]
+    print(f"{args.turns} turns, {args.prefill_ms_per_token} ms prefill per prompt token\n")
+    print(f"{'layout':<28} {'prompt tok':>10} {'prefill ms/turn':>16} {'cache reuse':>12} {'wall s':>8}")
+    baseline = None
+    for name, layout, cache_prompt in runs:
+        server = StandInServer(args.prefill_ms_per_token)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            result = run(server.url, turn_sections, layout, cache_prompt)
+        finally:
+            server.shutdown()
+        baseline = baseline or result["prefill_ms"]
+        saving = 1 - result["prefill_ms"] / baseline if baseline else 0.0
+        print(
+            f"{name:<28} {result['prompt_tokens']:>10.0f} {result['prefill_ms']:>16.1f} "
+            f"{result['reuse']:>12.1%} {result['seconds']:>8.2f}  ({saving:.0%} less prefill)"
+        )
+
+
+if __name__ == "__main__":
+    main()
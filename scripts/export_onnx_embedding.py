@@ -0,0 +1,78 @@
+"""
+Exports the sentence embedding model to ONNX for the "onnx" embedding backend,
+optionally with an int8 dynamically-quantized copy.
+
+Writes model.onnx (fp32), model_int8.onnx (with --quantize) and tokenizer.json
+into models/<model name>/ by default.
+
+Usage (from the repository root):
+    python -m scripts.export_onnx_embedding --quantize
+    python -m scripts.export_onnx_embedding --model all-MiniLM-L6-v2 --output models/minilm
+
+Requires torch, transformers, onnx and onnxruntime.
+"""
+
+import argparse
+import os
+
+
+def export(model_name: str, output_dir: str, opset: int = 17) -> str:
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    # Bare sentence-transformers names live under the sentence-transformers org.
+    repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    tokenizer = AutoTokenizer.from_pretrained(repo_id)
+    model = AutoModel.from_pretrained(repo_id).eval()
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer.save_pretrained(output_dir)  # writes tokenizer.json
+
+    sample = tokenizer(["Orton picked up a rusty can."], return_tensors="pt")
+    inputs = (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"])
+    model_path = os.path.join(output_dir, "model.onnx")
+    dynamic = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            inputs,
+            model_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": dynamic,
+                "attention_mask": dynamic,
+                "token_type_ids": dynamic,
+                "last_hidden_state": dynamic,
+            },
+            opset_version=opset,
+        )
+    print(f"Exported {repo_id} to {model_path}")
+    return model_path
+
+
+def quantize(model_path: str) -> str:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = model_path.replace(".onnx", "_int8.onnx")
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    print(f"Quantized weights to int8 in {quantized_path}")
+    return quantized_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--output", default=None, help="defaults to models/<model>")
+    parser.add_argument("--quantize", action="store_true", help="also write an int8 copy")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    output_dir = args.output or os.path.join("models", args.model.split("/")[-1])
+    model_path = export(args.model, output_dir, args.opset)
+    if args.quantize:
+        quantize(model_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Fuzzes the incremental LLM response parser (managers/response_parser.py).
+
+Generates well-formed, sloppy (no blank lines, bullets, indented markers,
+"NONE"), truncated and garbage responses, feeds each one in random chunk
+sizes and checks that:
+  - parsing never raises,
+  - the result doesn't depend on how the text was chunked,
+  - the streamed story deltas add up to the final story,
+  - well-formed responses parse to exactly what was generated.
+
+Usage (from the repository root):
+    python -m scripts.fuzz_response_parser
+    python -m scripts.fuzz_response_parser --cases 20000 --seed 7
+"""
+
+import argparse
+import random
+import sys
+
+from managers import response_parser
+
+WORDS = [
+    "the", "goblin", "lantern", "flickers", "STORY", "EVENT", "ACTIONS", "event:", "story:",
+    "you", "walk", "north", "NONE", "Old_Sword", "Forest_Path", "whispers", ":", "-", "*",
+]
+ACTIONS = ["TAKE Old_Sword", "DROP Rusty_Key", "MOVE_TO Forest_Path", "TIME_ADVANCE Evening", "NPC_MOVE Goblin Cave"]
+
+
+def sentence(rng: random.Random) -> str:
+    # Marker words inside a line are ordinary text
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+
+
+def generate(rng: random.Random) -> tuple[str, dict | None]:
+    """
+    Returns a response and, if it is well formed, the expected parse.
+    """
+    story_lines = [sentence(rng) for _ in range(rng.randint(1, 4))]
+    # Keep generated story lines from starting with a marker
+    story_lines = [line if not response_parser.MARKER_PATTERN.match(line) else "x " + line for line in story_lines]
+    story_separator = rng.choice(["\n", "\n\n"])
+    event = sentence(rng).replace(":", "").strip() or "quiet"
+    actions = rng.sample(ACTIONS, rng.randint(0, 3))
+
+    gap = rng.choice(["\n", "\n\n", "\n\n\n"])
+    indent = rng.choice(["", " ", "\t"])
+    bullet = rng.choice(["", "- ", "* ", "1. "])
+    same_line = rng.random() < 0.5
+    actions_text = "\n".join(bullet + action for action in actions) if actions else "NONE"
+    text = (
+        f"{indent}STORY:{' ' if same_line else chr(10)}{story_separator.join(story_lines)}{gap}"
+        f"{indent}EVENT:\n{event}{gap}"
+        f"{indent}ACTIONS:\n{actions_text}"
+    )
+    if rng.random() < 0.3:
+        text += rng.choice(["\n", "\n\n", "  "])
+
+    kind = rng.random()
+    if kind < 0.5:
+        return text, {"story": story_separator.join(story_lines).strip(), "event": event, "actions": actions}
+    if kind < 0.8:
+        return text[: rng.randint(0, len(text))], None
+    # Garbage: shuffled fragments of a response
+    fragments = text.split(rng.choice(["\n", " ", ":"]))
+    rng.shuffle(fragments)
+    return rng.choice(["\n", " ", ""]).join(fragments), None
+
+
+def chunked(text: str, rng: random.Random) -> list[str]:
+    chunks, position = [], 0
+    while position < len(text):
+        size = rng.choice([1, 1, 2, 3, 5, 8, 16, 64])
+        chunks.append(text[position:position + size])
+        position += size
+    return chunks
+
+
+def parse_streamed(chunks: list[str]) -> tuple[dict, str]:
+    parser = response_parser.ResponseParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    events.extend(parser.close())
+    streamed_story = "".join(e.text for e in events if isinstance(e, response_parser.StoryDelta))
+    streamed_actions = [e.text for e in events if isinstance(e, response_parser.Action)]
+    result = parser.result()
+    if streamed_actions != result["actions"]:
+        raise AssertionError(f"streamed actions {streamed_actions!r} != {result['actions']!r}")
+    return result, streamed_story
+
+
+def check(text: str, expected: dict | None, rng: random.Random):
+    whole = response_parser.parse_response(text)
+    result, streamed_story = parse_streamed(chunked(text, rng))
+    if result != whole:
+        raise AssertionError(f"chunked parse {result!r} != whole parse {whole!r}")
+    if result["story"] != (streamed_story or response_parser.DEFAULT_STORY):
+        raise AssertionError(f"streamed story {streamed_story!r} != story {result['story']!r}")
+    if expected is not None and result != expected:
+        raise AssertionError(f"parse {result!r} != expected {expected!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cases", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failures = 0
+    for case in range(args.cases):
+        text, expected = generate(rng)
+        try:
+            check(text, expected, rng)
+        except Exception as e:
+            failures += 1
+            if failures <= 10:
+                print(f"Case {case} failed: {e}\n--- response ---\n{text!r}\n")
+    print(f"{args.cases - failures}/{args.cases} cases passed (seed {args.seed}).")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
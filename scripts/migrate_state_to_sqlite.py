@@ -0,0 +1,50 @@
+"""
+Migrates the game state from the JSON layout in gamedata/ (character.json,
+world.json, events.json, locations.json, npcs.json, summaries.json) to the
+SQLite database used by STATE_BACKEND = "sqlite".
+
+The JSON files are left untouched. Any turns still in the JSON backend's
+journal are replayed first, so stop the server before migrating.
+
+Usage (from the repository root):
+    python -m scripts.migrate_state_to_sqlite
+    python -m scripts.migrate_state_to_sqlite --data-dir gamedata --db gamedata/state.db --force
+"""
+
+import argparse
+import os
+import sys
+
+from managers import game_state, sqlite_state
+
+SECTIONS = ("character", "world", "events", "locations", "npcs", "summaries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-dir", default="gamedata")
+    parser.add_argument("--db", default=None, help="defaults to <data-dir>/state.db")
+    parser.add_argument("--force", action="store_true", help="replace an existing database")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(args.data_dir, "state.db")
+    if os.path.exists(db_path) and not args.force:
+        sys.exit(f"{db_path} already exists; pass --force to replace it.")
+
+    files = {section: os.path.join(args.data_dir, f"{section}.json") for section in SECTIONS}
+    missing = [path for path in files.values() if not os.path.exists(path)]
+    if missing:
+        sys.exit(f"Missing state files: {', '.join(missing)}")
+
+    # Bring the JSON files up to date with any un-flushed turns.
+    json_store = game_state.StateStore(files, journal_path=os.path.join(args.data_dir, "state_journal.jsonl"))
+    json_store.load()
+    json_store.flush()
+
+    if os.path.exists(db_path):
+        sqlite_state.SqliteStateStore(db_path).reset()
+    sqlite_state.migrate_from_json(files, db_path)
+
+
+if __name__ == "__main__":
+    main()